@@ -110,6 +110,11 @@ def ex3_3():
     # that may start with a currency symbol and be followed by separators.
     # Optionally, the price may be followed by written currency words
     # like 'dollars', 'pounds', or 'euros'.
+    #
+    # Careful: a repeated group of repeats like (\d+[,\.\s]?)+ can match a long
+    # run of digits in a huge number of ways. If the rest of a pattern then
+    # fails, the regex engine tries them all ("catastrophic backtracking").
+    # See solutions/capstone/patterns.py for versions that avoid this.
     
     for text in price_texts:
         print(f"Text: '{text}'")
@@ -154,6 +159,7 @@ def ex3_4():
     # that is separated by spaces or hyphens.
     # Optionally, the firdst numbers may be surrounded by braces and/or
     # start with a '+'.
+    # (This nests repeats too, see the note in ex3_3.)
     
     
     phone_numbers = [
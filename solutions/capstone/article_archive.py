@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+# Compressed archive of raw article HTML for the Wikipedia Scraper
+# Keeps fetched pages so they can be re-extracted later without downloading them again.
+#
+# Layout of an archive directory:
+#   objects/ab/cdef...   zlib compressed page bodies, named by the sha256 of the body
+#   index.log            append-only lines of "sha256<TAB>size<TAB>title"
+#
+# Bodies are content addressed, so redirects and repeated fetches of an unchanged
+# page are only stored once. Objects are written to a temporary file and renamed
+# into place, and index lines are appended under a lock, so several scraper
+# processes can write to the same archive at once.
+
+import hashlib
+import os
+import sys
+import tempfile
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends of a single short line are still whole
+    fcntl = None
+
+
+class ArticleArchive:
+    INDEX_NAME = "index.log"
+    OBJECTS_NAME = "objects"
+    COMPRESSION_LEVEL = 6
+
+    def __init__(self, path):
+        self.path = path
+        self.objects_path = os.path.join(path, self.OBJECTS_NAME)
+        self.index_path = os.path.join(path, self.INDEX_NAME)
+        os.makedirs(self.objects_path, exist_ok=True)
+        # title -> (digest, size) of the most recently archived body
+        self.titles = {}
+        self.index_offset = 0
+        self.refresh()
+
+
+    # Read index lines appended since the last refresh, including other writers'
+    def refresh(self):
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, 'rb') as f:
+            f.seek(self.index_offset)
+            for line in f:
+                # A line without a newline is still being written by someone else
+                if not line.endswith(b'\n'):
+                    break
+                self.index_offset += len(line)
+                digest, size, title = line.decode('utf-8').rstrip('\n').split('\t', 2)
+                self.titles[title] = (digest, int(size))
+
+
+    # Titles are stored with runs of whitespace collapsed, since the index is
+    # tab and newline separated
+    def _normalise_title(self, title):
+        return ' '.join(title.split())
+
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects_path, digest[:2], digest[2:])
+
+
+    # Store a page body under a title
+    # Returns the sha256 hex digest the body is stored under
+    def put(self, title, body):
+        title = self._normalise_title(title)
+        digest = hashlib.sha256(body).hexdigest()
+        if self.titles.get(title, (None,))[0] == digest:
+            return digest
+
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(zlib.compress(body, self.COMPRESSION_LEVEL))
+            # Another writer may have stored the same body meanwhile; either copy is fine
+            os.replace(tmp_path, path)
+
+        self._append_index(digest, len(body), title)
+        self.titles[title] = (digest, len(body))
+        return digest
+
+
+    # Append one index line, holding an exclusive lock so lines never interleave
+    def _append_index(self, digest, size, title):
+        line = f"{digest}\t{size}\t{title}\n".encode('utf-8')
+        fd = os.open(self.index_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+
+    # Read a stored body by its digest
+    def get_object(self, digest):
+        with open(self._object_path(digest), 'rb') as f:
+            return zlib.decompress(f.read())
+
+
+    # Read the latest body stored under a title
+    # Returns bytes, or None if the title isn't archived
+    def get(self, title):
+        title = self._normalise_title(title)
+        if title not in self.titles:
+            self.refresh()
+        entry = self.titles.get(title)
+        if entry is None:
+            return None
+        return self.get_object(entry[0])
+
+
+    def __contains__(self, title):
+        title = self._normalise_title(title)
+        if title not in self.titles:
+            self.refresh()
+        return title in self.titles
+
+
+    # Stream (title, body) pairs for every archived title, one body in memory at a time
+    # With unique=True each distinct body is only yielded once, under its first title
+    def iter_articles(self, unique=False):
+        self.refresh()
+        seen = set()
+        for title, (digest, _) in list(self.titles.items()):
+            if unique:
+                if digest in seen:
+                    continue
+                seen.add(digest)
+            yield title, self.get_object(digest)
+
+
+    # Summarise how much space the archive takes compared to the raw bodies
+    def stats(self):
+        self.refresh()
+        digests = {}
+        for digest, size in self.titles.values():
+            digests[digest] = size
+        stored = sum(os.path.getsize(self._object_path(d)) for d in digests)
+        return {
+            'titles': len(self.titles),
+            'objects': len(digests),
+            'raw_bytes': sum(size for _, size in self.titles.values()),
+            'unique_bytes': sum(digests.values()),
+            'stored_bytes': stored,
+        }
+
+
+def main():
+    if len(sys.argv) != 2:
+        print(f"usage: {sys.argv[0]} ARCHIVE_DIR")
+        sys.exit(1)
+    stats = ArticleArchive(sys.argv[1]).stats()
+    print(f"Titles:        {stats['titles']:,}")
+    print(f"Unique bodies: {stats['objects']:,}")
+    print(f"Raw size:      {stats['raw_bytes']:,} bytes")
+    print(f"Deduplicated:  {stats['unique_bytes']:,} bytes")
+    print(f"On disk:       {stats['stored_bytes']:,} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+# Local article store for the Wikipedia Scraper
+# Saves scraped article titles, revisions, paragraphs and categorised facts
+# to a SQLite database so repeat lookups don't need a network round trip.
+# An FTS5 index over titles and paragraphs lets searches be answered locally.
+
+import sqlite3
+import time
+from models import Article
+
+
+class ArticleStore:
+    # Number of queued articles written per transaction.
+    # Committing once per article makes bulk scraping wait on disk syncs.
+    BATCH_SIZE = 50
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS articles (
+            id INTEGER PRIMARY KEY,
+            title TEXT NOT NULL UNIQUE,
+            revision INTEGER,
+            size INTEGER,
+            disambiguation INTEGER NOT NULL DEFAULT 0,
+            fetched_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS paragraphs (
+            article_id INTEGER NOT NULL REFERENCES articles(id) ON DELETE CASCADE,
+            position INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            PRIMARY KEY (article_id, position)
+        );
+        CREATE TABLE IF NOT EXISTS facts (
+            article_id INTEGER NOT NULL REFERENCES articles(id) ON DELETE CASCADE,
+            category TEXT NOT NULL,
+            value TEXT NOT NULL,
+            position INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS facts_by_article ON facts(article_id);
+        CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5(title, body);
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.pending = []
+        self.conn = sqlite3.connect(path)
+        # WAL lets readers keep going while a batch is being written,
+        # and NORMAL sync is durable across application crashes.
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(self.SCHEMA)
+        # Databases made before facts kept their position in the article
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(facts)")]
+        if 'position' not in columns:
+            self.conn.execute("ALTER TABLE facts ADD COLUMN position INTEGER")
+
+
+    # Queue an Article to be saved, writing the queue once it is full
+    # size is the number of bytes downloaded for the page, if known
+    def save_article(self, article, size=None):
+        self.pending.append((article, size))
+        if len(self.pending) >= self.BATCH_SIZE:
+            self.flush()
+
+
+    # Write all queued articles in a single transaction
+    def flush(self):
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        now = time.time()
+        with self.conn:
+            for article, size in batch:
+                article_id = self._replace_article(article, size, now)
+                self.conn.executemany(
+                    "INSERT INTO paragraphs (article_id, position, text) VALUES (?, ?, ?)",
+                    [(article_id, p.position, p.text) for p in article.paragraphs]
+                )
+                self.conn.executemany(
+                    "INSERT INTO facts (article_id, category, value, position) VALUES (?, ?, ?, ?)",
+                    [(article_id, f.category, f.text, f.position) for f in article.facts]
+                )
+                self.conn.execute(
+                    "INSERT INTO articles_fts (rowid, title, body) VALUES (?, ?, ?)",
+                    (article_id, article.title, '\n'.join(article.texts()))
+                )
+
+
+    # Insert or overwrite the article row, clearing anything stored for an
+    # older revision. Returns the article id.
+    def _replace_article(self, article, size, fetched_at):
+        values = (article.revision, size, int(article.disambiguation), fetched_at)
+        row = self.conn.execute(
+            "SELECT id FROM articles WHERE title = ?", (article.title,)
+        ).fetchone()
+        if row is None:
+            cursor = self.conn.execute(
+                "INSERT INTO articles (revision, size, disambiguation, fetched_at, title) "
+                "VALUES (?, ?, ?, ?, ?)",
+                values + (article.title,)
+            )
+            return cursor.lastrowid
+
+        article_id = row[0]
+        self.conn.execute(
+            "UPDATE articles SET revision = ?, size = ?, disambiguation = ?, fetched_at = ? "
+            "WHERE id = ?",
+            values + (article_id,)
+        )
+        self.conn.execute("DELETE FROM paragraphs WHERE article_id = ?", (article_id,))
+        self.conn.execute("DELETE FROM facts WHERE article_id = ?", (article_id,))
+        self.conn.execute("DELETE FROM articles_fts WHERE rowid = ?", (article_id,))
+        return article_id
+
+
+    # Convert free text into an FTS5 query that matches every word.
+    # Each word is quoted so punctuation can't be read as query syntax.
+    # column limits the match to one column, e.g. 'title'
+    def _fts_query(self, text, column=None):
+        words = text.replace('_', ' ').split()
+        prefix = f"{column} : " if column else ''
+        return ' AND '.join(prefix + '"' + w.replace('"', '""') + '"' for w in words)
+
+
+    # Full text search over stored articles
+    # With title_only=True only titles are searched, not paragraph text
+    # Returns a list of titles, best match first (title matches weigh more)
+    def search(self, text, limit=10, title_only=False):
+        self.flush()
+        query = self._fts_query(text, 'title' if title_only else None)
+        if not query:
+            return []
+        rows = self.conn.execute(
+            "SELECT title FROM articles_fts WHERE articles_fts MATCH ? "
+            "ORDER BY bm25(articles_fts, 10.0, 1.0) LIMIT ?",
+            (query, limit)
+        ).fetchall()
+        return [r[0] for r in rows]
+
+
+    # Load a stored article
+    # Returns an Article, or None if the title isn't stored
+    def get_article(self, title):
+        self.flush()
+        row = self.conn.execute(
+            "SELECT id, title, revision, disambiguation FROM articles WHERE title = ?",
+            (title,)
+        ).fetchone()
+        if row is None:
+            return None
+        article_id, title, revision, disambiguation = row
+        paragraphs = [r[0] for r in self.conn.execute(
+            "SELECT text FROM paragraphs WHERE article_id = ? ORDER BY position",
+            (article_id,)
+        )]
+        # Facts stored without a position keep the order they were saved in
+        facts = {}
+        for category, value, position in self.conn.execute(
+            "SELECT category, value, position FROM facts WHERE article_id = ? "
+            "ORDER BY position, rowid", (article_id,)
+        ):
+            facts.setdefault(category, {}).setdefault(value, position)
+        return Article(title, revision, paragraphs, facts, bool(disambiguation))
+
+
+    # Look up the stored revision and page size of each title
+    # Returns dictionary of title -> (revision, size) for stored titles
+    def get_revisions(self, titles):
+        self.flush()
+        revisions = {}
+        # Stay well under SQLite's limit on bound parameters
+        for i in range(0, len(titles), 500):
+            batch = titles[i:i + 500]
+            marks = ', '.join('?' * len(batch))
+            for title, revision, size in self.conn.execute(
+                f"SELECT title, revision, size FROM articles WHERE title IN ({marks})",
+                batch
+            ):
+                revisions[title] = (revision, size)
+        return revisions
+
+
+    # Stream (article id, category, value) for every stored fact
+    def iter_facts(self):
+        self.flush()
+        return self.conn.execute(
+            "SELECT article_id, category, value FROM facts ORDER BY article_id"
+        )
+
+
+    # Write anything still queued and close the database
+    def close(self):
+        self.flush()
+        self.conn.close()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+# Batch price and phone number extraction over large text streams
+# The price (ex3_3) and phone (ex3_4) extraction from examples/03_regex_formatting.py
+# as a reusable API. Lines are read lazily, split into chunks, matched in worker
+# processes and returned as NumPy column arrays.
+#
+#   prices = extract_prices("listings.txt")
+#   prices['amount'][prices['currency'] == 'USD'].sum()
+#
+# Run this file to benchmark throughput on synthetic lines.
+
+import collections
+import itertools
+import multiprocessing
+import os
+import re
+import sys
+import time
+import numpy as np
+import patterns
+from fact_table import CURRENCY_SYMBOLS, CURRENCY_WORDS, parse_number
+
+# Lines per chunk handed to a worker. Large enough that pickling results
+# costs little next to matching them.
+CHUNK_SIZE = 20000
+
+# Digit runs shorter than this are numbers, not phone numbers
+MIN_PHONE_DIGITS = 6
+
+NON_DIGITS = re.compile(r'\D')
+
+# Chunks queued or being matched per worker. Pool.imap would read the whole
+# source ahead of the workers, so chunks are submitted as results come back.
+CHUNKS_IN_FLIGHT = 2
+
+
+# Yield lines from a file path, an open file or any iterable of strings
+def iter_lines(source):
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, encoding='utf-8', errors='replace') as f:
+            yield from f
+    else:
+        yield from source
+
+
+# Yield (first line number, list of lines) chunks
+def iter_chunks(lines, chunk_size):
+    lines = iter(lines)
+    start = 0
+    while True:
+        chunk = list(itertools.islice(lines, chunk_size))
+        if not chunk:
+            return
+        yield start, chunk
+        start += len(chunk)
+
+
+# Find prices in a chunk, normalised like ex3_3
+# Returns lists of (line numbers, amounts, currency codes, raw matches)
+def _prices_in_chunk(job):
+    start, lines = job
+    rows, amounts, currencies, raws = [], [], [], []
+    for n, line in enumerate(lines, start):
+        for price, word in patterns.PRICE_PATTERN.findall(line):
+            amount = parse_number(price.lstrip('$£€'))
+            if amount is None:
+                continue
+            if price[0] in CURRENCY_SYMBOLS:
+                currency = CURRENCY_SYMBOLS[price[0]]
+            elif word:
+                currency = CURRENCY_WORDS[word.lower().rstrip('s')]
+            else:
+                currency = ''
+            rows.append(n)
+            amounts.append(amount)
+            currencies.append(currency)
+            raws.append((price + word).strip())
+    return rows, amounts, currencies, raws
+
+
+# Find phone numbers in a chunk, split into components like ex3_4
+# Returns lists of (line numbers, leading parts, last blocks, digits only)
+def _phones_in_chunk(job):
+    start, lines = job
+    rows, leads, lasts, digits = [], [], [], []
+    for n, line in enumerate(lines, start):
+        for whole, lead, last in patterns.PHONE_PATTERN.findall(line):
+            number = NON_DIGITS.sub('', whole)
+            if len(number) < MIN_PHONE_DIGITS:
+                continue
+            rows.append(n)
+            leads.append(lead.strip())
+            lasts.append(last.strip(' -'))
+            # Keep the + of international numbers
+            digits.append(('+' if '+' in lead else '') + number)
+    return rows, leads, lasts, digits
+
+
+# Run a chunk function over the source, in parallel when workers > 1
+# Yields the per-chunk results in order
+def _map_chunks(function, source, workers, chunk_size):
+    chunks = iter_chunks(iter_lines(source), chunk_size)
+    if workers == 1:
+        yield from map(function, chunks)
+        return
+    with multiprocessing.Pool(workers) as pool:
+        pending = collections.deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(function, (chunk,)))
+            if len(pending) >= workers * CHUNKS_IN_FLIGHT:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+
+def _columns(names, dtypes, results):
+    lists = [[] for _ in names]
+    for result in results:
+        for column, values in zip(lists, result):
+            column.extend(values)
+    return {name: np.array(values, dtype=dtype)
+            for name, dtype, values in zip(names, dtypes, lists)}
+
+
+# Extract prices from a file path or iterable of lines
+# Returns dictionary of column arrays:
+#   line (int64), amount (float64), currency (ISO code or ''), raw (matched text)
+def extract_prices(source, workers=None, chunk_size=CHUNK_SIZE):
+    workers = workers or os.cpu_count() or 1
+    results = _map_chunks(_prices_in_chunk, source, workers, chunk_size)
+    return _columns(('line', 'amount', 'currency', 'raw'),
+                    (np.int64, np.float64, str, str), results)
+
+
+# Extract phone numbers from a file path or iterable of lines
+# Returns dictionary of column arrays:
+#   line (int64), lead (e.g. "(+61)"), last (final block), digits (e.g. "+61412345678")
+def extract_phones(source, workers=None, chunk_size=CHUNK_SIZE):
+    workers = workers or os.cpu_count() or 1
+    results = _map_chunks(_phones_in_chunk, source, workers, chunk_size)
+    return _columns(('line', 'lead', 'last', 'digits'),
+                    (np.int64, str, str, str), results)
+
+
+def synthetic_lines(count):
+    samples = [
+        "Price: $1,234.56 each",
+        "Cost AUD $99.00 (inc tax) call (02) 5550 1234",
+        "€25.50 or $35.00 USD",
+        "my number is +61 412 345 678",
+        "1 000 000 DOLLARS!",
+        "nothing to see on this line at all",
+    ]
+    return [samples[i % len(samples)] for i in range(count)]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    lines = synthetic_lines(count)
+    for workers in sorted({1, os.cpu_count() or 1}):
+        start = time.perf_counter()
+        prices = extract_prices(lines, workers=workers)
+        phones = extract_phones(lines, workers=workers)
+        elapsed = time.perf_counter() - start
+        print(f"{workers:>3} workers: {count:,} lines in {elapsed:.2f}s "
+              f"({count / elapsed * 60:,.0f} lines/minute, "
+              f"{len(prices['line']):,} prices, {len(phones['line']):,} phones)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+
+# Bulk scraping across several machines
+# Each machine only gets its own politeness budget, so covering more titles
+# means more machines. A coordinator and any number of workers share one
+# SQLite queue file (on a shared disk, or all on one machine for testing):
+#   - the coordinator adds the titles, normalised to their canonical form
+#   - each title belongs to a worker chosen by consistent hashing of its title,
+#     so when a worker joins or leaves only the titles it owned move, and a
+#     title always goes back to the worker whose caches already know it
+#   - a worker leases a batch of its titles, fetches and extracts them with the
+#     scraper, and stores each result with its lease still held. Leases are
+#     renewed while the batch is worked on.
+#   - a worker that stops sending heartbeats is dropped from the ring. Its
+#     leases expire and its titles go to the workers that remain.
+#   - the coordinator writes every result to one JSON lines file, in the same
+#     format as jobs.py
+# A result is only accepted from the worker still holding the title's lease, so
+# a worker that stalled past its lease can't add a duplicate.
+#
+#   python3 cluster.py coordinator queue.db titles.txt articles.jsonl
+#   python3 cluster.py worker queue.db          (on each machine)
+#   python3 cluster.py demo                     (local processes, one killed)
+
+import argparse
+import bisect
+import collections
+import hashlib
+import json
+import os
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from jobs import article_record
+from titles import TitleResolver, normalise_title
+
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS titles (
+        id INTEGER PRIMARY KEY,
+        title TEXT NOT NULL UNIQUE,
+        owner TEXT,
+        state TEXT NOT NULL DEFAULT 'pending',
+        worker TEXT,
+        lease INTEGER NOT NULL DEFAULT 0,
+        lease_expires REAL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        error TEXT
+    );
+    CREATE INDEX IF NOT EXISTS titles_by_owner ON titles(state, owner);
+    CREATE TABLE IF NOT EXISTS workers (
+        name TEXT PRIMARY KEY,
+        last_seen REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS results (
+        title_id INTEGER PRIMARY KEY REFERENCES titles(id),
+        record TEXT NOT NULL,
+        worker TEXT NOT NULL
+    );
+"""
+
+# Seconds without a heartbeat before a worker is dropped from the ring
+WORKER_TIMEOUT = 10.0
+HEARTBEAT_INTERVAL = 2.0
+
+
+def connect(path):
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    # WAL lets the coordinator read while workers write
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+class HashRing:
+    # Points per worker on the ring; more points spread titles more evenly
+    REPLICAS = 64
+
+    def __init__(self, nodes=()):
+        self.points = []
+        self.owners = {}
+        for node in nodes:
+            for i in range(self.REPLICAS):
+                point = self.hash(f"{node}#{i}")
+                self.points.append(point)
+                self.owners[point] = node
+        self.points.sort()
+
+
+    # A stable hash, the same in every process (unlike hash())
+    @staticmethod
+    def hash(key):
+        return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+    # The node owning key: the first point clockwise from the key's hash
+    def owner(self, key):
+        if not self.points:
+            return None
+        i = bisect.bisect(self.points, self.hash(key)) % len(self.points)
+        return self.owners[self.points[i]]
+
+
+class Coordinator:
+    MAX_ATTEMPTS = 3
+
+    # worker_timeout is the seconds without a heartbeat before a worker is
+    # dropped from the ring and its pending titles go to the others
+    def __init__(self, path, worker_timeout=WORKER_TIMEOUT):
+        self.conn = connect(path)
+        self.worker_timeout = worker_timeout
+
+
+    # Queue titles, normalised and resolved to their canonical titles
+    # resolver is an optional TitleResolver with known redirects
+    # Returns the number of titles not already queued
+    def add_titles(self, titles, resolver=None):
+        titles = [resolver.resolve(t) if resolver else normalise_title(t) for t in titles]
+        before = self.conn.total_changes
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany("INSERT OR IGNORE INTO titles (title) VALUES (?)",
+                                  [(t,) for t in dict.fromkeys(titles) if t])
+        return self.conn.total_changes - before
+
+
+    def live_workers(self):
+        rows = self.conn.execute("SELECT name FROM workers WHERE last_seen > ? ORDER BY name",
+                                 (time.time() - self.worker_timeout,))
+        return [name for name, in rows]
+
+
+    # Give every pending title to its owner on the ring of live workers
+    # Returns the number of titles that changed owner
+    def rebalance(self):
+        ring = HashRing(self.live_workers())
+        moves = []
+        for title_id, title, owner in self.conn.execute(
+                "SELECT id, title, owner FROM titles WHERE state = 'pending'"):
+            new_owner = ring.owner(title)
+            if new_owner != owner:
+                moves.append((new_owner, title_id))
+        if moves:
+            with self.conn:
+                self.conn.execute("BEGIN")
+                self.conn.executemany("UPDATE titles SET owner = ? WHERE id = ?", moves)
+        return len(moves)
+
+
+    # Put titles whose lease ran out back in the queue, or fail them after MAX_ATTEMPTS
+    # Returns the number of expired leases
+    def reap(self):
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            expired = self.conn.execute(
+                "UPDATE titles SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "error = CASE WHEN attempts >= ? THEN 'lease expired' ELSE error END, "
+                "worker = NULL WHERE state = 'leased' AND lease_expires < ?",
+                (self.MAX_ATTEMPTS, self.MAX_ATTEMPTS, time.time())).rowcount
+        return expired
+
+
+    # Number of titles in each state
+    def counts(self):
+        counts = collections.Counter({'pending': 0, 'leased': 0, 'done': 0, 'failed': 0})
+        counts.update(dict(self.conn.execute("SELECT state, COUNT(*) FROM titles GROUP BY state")))
+        return counts
+
+
+    # Rebalance and reap until every title is done or failed
+    def run(self, poll=1.0, report=None):
+        while True:
+            self.reap()
+            self.rebalance()
+            counts = self.counts()
+            if report:
+                report(counts, self.live_workers())
+            if not counts['pending'] and not counts['leased']:
+                return counts
+            time.sleep(poll)
+
+
+    # Write every result to one JSON lines file, in the order titles were added
+    # Returns the number of lines written
+    def merge(self, output_path):
+        rows = self.conn.execute(
+            "SELECT record FROM results JOIN titles ON titles.id = results.title_id ORDER BY titles.id")
+        count = 0
+        with open(output_path, 'w', encoding='utf-8') as f:
+            for record, in rows:
+                f.write(record + '\n')
+                count += 1
+        return count
+
+
+    def close(self):
+        self.conn.close()
+
+
+class Worker:
+    # Titles leased at a time, and so fetched ahead of the one being extracted
+    BATCH_SIZE = 16
+    LEASE = 60.0
+
+    # scraper is a WikipediaScraper; name defaults to host name and process id
+    def __init__(self, path, scraper, name=None, lease=LEASE):
+        self.conn = connect(path)
+        self.scraper = scraper
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.lease = lease
+        self.last_heartbeat = 0
+
+
+    def heartbeat(self):
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.execute("INSERT OR REPLACE INTO workers (name, last_seen) VALUES (?, ?)",
+                              (self.name, time.time()))
+        self.last_heartbeat = time.monotonic()
+
+
+    # Lease up to BATCH_SIZE of this worker's pending titles
+    # Returns list of (title id, title, lease token)
+    def claim(self):
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            rows = self.conn.execute(
+                "SELECT id, title, lease FROM titles WHERE state = 'pending' AND owner = ? "
+                "ORDER BY id LIMIT ?", (self.name, self.BATCH_SIZE)).fetchall()
+            self.conn.executemany(
+                "UPDATE titles SET state = 'leased', worker = ?, lease = lease + 1, "
+                "lease_expires = ?, attempts = attempts + 1 WHERE id = ?",
+                [(self.name, time.time() + self.lease, title_id) for title_id, _, _ in rows])
+        return [(title_id, title, lease + 1) for title_id, title, lease in rows]
+
+
+    # Extend the leases still held on a batch, and send a heartbeat
+    def renew(self, batch):
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "UPDATE titles SET lease_expires = ? WHERE id = ? AND lease = ? AND state = 'leased'",
+                [(time.time() + self.lease, title_id, lease) for title_id, _, lease in batch])
+            self.conn.execute("INSERT OR REPLACE INTO workers (name, last_seen) VALUES (?, ?)",
+                              (self.name, time.time()))
+        self.last_heartbeat = time.monotonic()
+
+
+    # Store a title's result if its lease is still held
+    # record is None for a title that failed. Returns False if the lease was lost.
+    def finish(self, title_id, lease, record=None, error=None):
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            state = 'done' if record is not None else 'failed'
+            held = self.conn.execute(
+                "UPDATE titles SET state = ?, error = ?, worker = NULL "
+                "WHERE id = ? AND lease = ? AND state = 'leased'",
+                (state, error, title_id, lease)).rowcount
+            if held and record is not None:
+                self.conn.execute("INSERT OR REPLACE INTO results (title_id, record, worker) "
+                                  "VALUES (?, ?, ?)",
+                                  (title_id, json.dumps(record, ensure_ascii=False), self.name))
+        return bool(held)
+
+
+    # Fetch and extract a leased batch, fetching every page of it at once
+    # Returns the number of results accepted
+    def process(self, batch):
+        site = self.scraper.site
+        futures = [site.submit(site.page_url(self.scraper.form_query(title)))
+                   for _, title, _ in batch]
+        accepted = 0
+        for (title_id, title, lease), future in zip(batch, futures):
+            if time.monotonic() - self.last_heartbeat > min(HEARTBEAT_INTERVAL, self.lease / 2):
+                self.renew(batch)
+            try:
+                response = future.result()
+                if response.status_code == 404:
+                    self.finish(title_id, lease, error="missing")
+                    continue
+                if response.status_code != 200:
+                    raise IOError(f"HTTP {response.status_code}")
+            except Exception:
+                # Leave the lease to expire, so the title is retried
+                continue
+            article = self.scraper.extract_article(response.text, self.scraper.form_query(title))
+            accepted += self.finish(title_id, lease, article_record(title, article))
+        return accepted
+
+
+    # Work until titles have been queued and none are pending or leased anywhere
+    # Returns the number of results accepted
+    def run(self, poll=0.5):
+        accepted = 0
+        self.heartbeat()
+        while True:
+            batch = self.claim()
+            if batch:
+                accepted += self.process(batch)
+                continue
+            queued, remaining = self.conn.execute(
+                "SELECT COUNT(*), COUNT(*) FILTER (WHERE state IN ('pending', 'leased')) "
+                "FROM titles").fetchone()
+            if queued and not remaining:
+                return accepted
+            if time.monotonic() - self.last_heartbeat > HEARTBEAT_INTERVAL:
+                self.heartbeat()
+            time.sleep(poll)
+
+
+    # Leave the ring straight away rather than after WORKER_TIMEOUT
+    def close(self):
+        with self.conn:
+            self.conn.execute("DELETE FROM workers WHERE name = ?", (self.name,))
+        self.conn.close()
+
+
+def print_progress(counts, workers):
+    print(f"\r{counts['done']:,} done, {counts['failed']:,} failed, {counts['leased']:,} leased, "
+          f"{counts['pending']:,} pending, {len(workers)} workers ", end='', flush=True)
+
+
+def coordinator(args):
+    resolver = TitleResolver(args.titles_map) if args.titles_map else None
+    coord = Coordinator(args.queue)
+    with open(args.titles, encoding='utf-8') as f:
+        added = coord.add_titles(f.read().splitlines(), resolver)
+    print(f"Queued {added:,} new titles")
+    counts = coord.run(report=print_progress)
+    print()
+    written = coord.merge(args.output)
+    print(f"{counts['done']:,} done, {counts['failed']:,} failed; "
+          f"{written:,} articles written to {args.output}")
+    coord.close()
+
+
+def worker(args):
+    from jobs import simulated_scraper
+    from sites import WikipediaSite
+    from wikipedia_scraper import WikipediaScraper
+    if args.simulate is not None:
+        scraper = simulated_scraper(args.simulate)
+    else:
+        scraper = WikipediaScraper(site=WikipediaSite(lang=args.lang))
+    w = Worker(args.queue, scraper, name=args.name, lease=args.lease)
+    try:
+        accepted = w.run()
+    finally:
+        w.close()
+    print(f"{w.name}: {accepted:,} articles")
+
+
+# Several worker processes on one queue, one of them killed partway through
+def demo(args):
+    titles = [f"Topic {i}" for i in range(args.count)]
+    with tempfile.TemporaryDirectory() as tmp:
+        queue = os.path.join(tmp, 'queue.db')
+        output = os.path.join(tmp, 'articles.jsonl')
+        coord = Coordinator(queue, worker_timeout=2 * HEARTBEAT_INTERVAL + 1)
+        coord.add_titles(titles)
+
+        command = [sys.executable, os.path.abspath(__file__), 'worker', queue,
+                   '--simulate', '0.02', '--lease', '3']
+        workers = [subprocess.Popen(command + ['--name', f"worker-{i}"], stdout=subprocess.DEVNULL)
+                   for i in range(args.workers)]
+        start = time.perf_counter()
+        killed = False
+
+        def report(counts, live):
+            nonlocal killed
+            print_progress(counts, live)
+            if not killed and counts['done'] > args.count // 4:
+                workers[0].send_signal(signal.SIGKILL)
+                killed = True
+                print("\nKilled worker-0")
+
+        counts = coord.run(poll=0.5, report=report)
+        elapsed = time.perf_counter() - start
+        print()
+        for process in workers:
+            process.wait()
+        coord.merge(output)
+        by_worker = collections.Counter(
+            worker for worker, in coord.conn.execute("SELECT worker FROM results"))
+        coord.close()
+
+        with open(output, encoding='utf-8') as f:
+            written = [json.loads(line)['query'] for line in f]
+        duplicates = sum(1 for n in collections.Counter(written).values() if n > 1)
+        lost = len(set(titles) - set(written))
+        print(f"{len(written):,} articles from {args.workers} workers in {elapsed:.1f}s: "
+              f"{duplicates} duplicated, {lost} lost, {counts['failed']} failed")
+        for name, count in sorted(by_worker.items()):
+            print(f"\t{name}: {count:,}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk scraping with a coordinator and workers")
+    commands = parser.add_subparsers(dest='command')
+    coord_parser = commands.add_parser('coordinator', help="queue titles, wait for workers, merge results")
+    coord_parser.add_argument('queue', help="SQLite queue file shared with the workers")
+    coord_parser.add_argument('titles', help="file of titles, one per line")
+    coord_parser.add_argument('output', help="JSON lines file the results are merged into")
+    coord_parser.add_argument('--titles-map', metavar='FILE',
+                              help="TitleResolver file of known redirects, to queue canonical titles")
+    worker_parser = commands.add_parser('worker', help="scrape titles from a queue")
+    worker_parser.add_argument('queue')
+    worker_parser.add_argument('--name', help="worker name, host name and pid by default")
+    worker_parser.add_argument('--lang', default='en', help="Wikipedia language edition")
+    worker_parser.add_argument('--lease', type=float, default=Worker.LEASE,
+                               help="seconds a leased title is held before it's reassigned")
+    worker_parser.add_argument('--simulate', type=float, metavar='SECONDS', help=argparse.SUPPRESS)
+    demo_parser = commands.add_parser('demo', help="run local workers, killing one partway")
+    demo_parser.add_argument('--count', type=int, default=1000)
+    demo_parser.add_argument('--workers', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.command == 'coordinator':
+        coordinator(args)
+    elif args.command == 'worker':
+        worker(args)
+    elif args.command == 'demo':
+        demo(args)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
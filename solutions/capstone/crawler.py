@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+
+# Concurrent pagination crawler
+# The examples only scrape the first page of quotes.toscrape.com. Crawler
+# follows a site's "next" links to the end, and fans out to linked detail pages
+# (e.g. author pages) on a thread pool:
+#   - the next page is requested as soon as its link is found, so it downloads
+#     while the current page is being parsed
+#   - detail pages are requested concurrently as each page is parsed
+#   - requests for a URL in flight share the one response, and URLs already
+#     crawled aren't requested again
+#
+# What to extract is passed in, so the crawler works for any paginated site.
+# Pages can come from the web (a Site from sites.py, whose text method fetches
+# through the shared scheduler) or from a local copy of the site (LocalFetcher),
+# which is how it is tested offline.
+#
+#   crawler = Crawler(QuotesSite().text)
+#   for kind, url, data in crawler.crawl(QUOTES_START_URL, **quotes_site()):
+#       ...
+#
+# Run this file to crawl a generated local copy of quotes.toscrape.com,
+# or pass a URL or a mirror directory to crawl that instead.
+
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from urllib.parse import urljoin, urlsplit
+from fast_extract import Field, HybridExtractor, QUOTES_FIELDS, unescape
+
+QUOTES_START_URL = "http://quotes.toscrape.com/"
+
+
+# Serves pages from a local copy of a site, laid out like `wget --mirror`:
+#   http://host/page/2/  ->  root/page/2/index.html
+# delay simulates network latency in seconds
+class LocalFetcher:
+    def __init__(self, root, delay=0.0):
+        self.root = root
+        self.delay = delay
+
+    def path_for(self, url):
+        path = urlsplit(url).path.lstrip('/')
+        if not path or path.endswith('/'):
+            path += 'index.html'
+        elif not os.path.splitext(path)[1]:
+            path += '/index.html'
+        return os.path.join(self.root, *path.split('/'))
+
+    def __call__(self, url):
+        if self.delay:
+            time.sleep(self.delay)
+        with open(self.path_for(url), encoding='utf-8') as f:
+            return f.read()
+
+
+class Crawler:
+    WORKERS = 8
+
+    # fetch is a callable taking a URL and returning the page HTML
+    def __init__(self, fetch, workers=WORKERS):
+        self.fetch = fetch
+        self.workers = workers
+        self.lock = threading.Lock()
+        # Requests in flight by URL; finished ones are dropped with their pages
+        self.futures = {}
+        self.seen = set()
+        self.requests = 0
+        self.coalesced = 0
+
+
+    # Future for the page at url, shared by every caller asking for it while it's in flight
+    # Returns (future, True if this call started the request), or (None, False)
+    # if the URL has already been crawled
+    def get(self, pool, url):
+        with self.lock:
+            future = self.futures.get(url)
+            if future is not None or url in self.seen:
+                self.coalesced += 1
+                return future, False
+            self.requests += 1
+            self.seen.add(url)
+            future = self.futures[url] = pool.submit(self.fetch, url)
+        # Outside the lock: the callback runs here if the request has already finished
+        future.add_done_callback(lambda _: self._finished(url))
+        return future, True
+
+
+    def _finished(self, url):
+        with self.lock:
+            self.futures.pop(url, None)
+
+
+    # Crawl from start_url, yielding (kind, url, data) tuples:
+    #   ('page', url, parse_page(url, html)) for each page, in order
+    #   ('detail', url, parse_detail(url, html)) for each linked page
+    #   ('error', url, exception) for pages that couldn't be fetched
+    # next_link(html) returns the next page's href or None. It should be cheap,
+    # since the next page isn't requested until it returns.
+    # detail_links(data) returns hrefs to fetch from a parsed page's data.
+    def crawl(self, start_url, parse_page, next_link, detail_links=None,
+              parse_detail=None, max_pages=None):
+        with ThreadPoolExecutor(self.workers) as pool:
+            details = {}
+            url = start_url
+            future, _ = self.get(pool, url)
+            pages = 0
+            while url is not None:
+                try:
+                    page_html = future.result()
+                except Exception as e:
+                    yield 'error', url, e
+                    break
+                pages += 1
+
+                # Prefetch the next page before parsing this one
+                next_url = None
+                if max_pages is None or pages < max_pages:
+                    href = next_link(page_html)
+                    if href:
+                        next_url = urljoin(url, href)
+                        next_future, _ = self.get(pool, next_url)
+                        # A next link back to a page already crawled ends the loop
+                        if next_future is None:
+                            next_url = None
+
+                data = parse_page(url, page_html)
+                yield 'page', url, data
+
+                if detail_links and parse_detail:
+                    for href in detail_links(data):
+                        detail_url = urljoin(url, href)
+                        # A page linked again is merged into the first request
+                        detail, new = self.get(pool, detail_url)
+                        if new:
+                            details[detail] = detail_url
+                # Hand back detail pages that have finished so far
+                yield from self._finished_details(details, parse_detail, block=False)
+
+                url = next_url
+                if url is not None:
+                    future = next_future
+
+            while details:
+                yield from self._finished_details(details, parse_detail, block=True)
+
+
+    def _finished_details(self, details, parse_detail, block):
+        if not details:
+            return
+        done, _ = wait(details, timeout=None if block else 0, return_when=FIRST_COMPLETED)
+        for future in done:
+            detail_url = details.pop(future)
+            try:
+                page_html = future.result()
+            except Exception as e:
+                yield 'error', detail_url, e
+                continue
+            yield 'detail', detail_url, parse_detail(detail_url, page_html)
+
+
+# quotes.toscrape.com: quotes on each page, and an about page for each author
+AUTHOR_LINK_FIELD = Field('author_links', r'<a href="(/author/[^"]*)">',
+                          lambda soup: [a['href'] for a in soup.select('.quote a[href^="/author/"]')],
+                          clean=unescape)
+
+AUTHOR_FIELDS = [
+    Field('name', r'<h3 class="author-title">(.*?)</h3>',
+          lambda soup: [h.get_text() for h in soup.select('h3.author-title')],
+          clean=unescape, many=False),
+    Field('born', r'<span class="author-born-date">(.*?)</span>',
+          lambda soup: [s.get_text() for s in soup.select('span.author-born-date')],
+          clean=unescape, many=False),
+    Field('location', r'<span class="author-born-location">(?:in )?(.*?)</span>',
+          lambda soup: [s.get_text().removeprefix('in ') for s in soup.select('span.author-born-location')],
+          clean=unescape, many=False),
+]
+
+
+# Keyword arguments for Crawler.crawl on quotes.toscrape.com
+def quotes_site():
+    pages = HybridExtractor(QUOTES_FIELDS + [AUTHOR_LINK_FIELD])
+    authors = HybridExtractor(AUTHOR_FIELDS)
+    next_field = QUOTES_FIELDS[-1]
+    return {
+        'parse_page': lambda url, page_html: pages.extract(page_html),
+        'next_link': lambda page_html: next_field.result(next_field.fast_values(page_html)),
+        'detail_links': lambda data: data['author_links'],
+        'parse_detail': lambda url, page_html: authors.extract(page_html),
+    }
+
+
+SAMPLE_AUTHORS = [
+    ("Albert Einstein", "March 14, 1879", "Ulm, Germany"),
+    ("J.K. Rowling", "July 31, 1965", "Yate, South Gloucestershire, England"),
+    ("Jane Austen", "December 16, 1775", "Steventon Rectory, Hampshire, The United Kingdom"),
+    ("Marilyn Monroe", "June 01, 1926", "The United States"),
+    ("André Gide", "November 22, 1869", "Paris, France"),
+    ("Thomas A. Edison", "February 11, 1847", "Milan, Ohio, The United States"),
+    ("Eleanor Roosevelt", "October 11, 1884", "The United States"),
+    ("Steve Martin", "August 14, 1945", "Waco, Texas, The United States"),
+]
+
+
+def author_slug(name):
+    name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode()
+    return re.sub(r'[^A-Za-z0-9]+', '-', name).strip('-')
+
+
+# Write a local copy of quotes.toscrape.com with the same markup, for offline runs
+# Returns the number of files written
+def write_sample_site(root, pages=10, per_page=10):
+    def write(path, body):
+        os.makedirs(os.path.join(root, path), exist_ok=True)
+        with open(os.path.join(root, path, 'index.html'), 'w', encoding='utf-8') as f:
+            f.write('<!DOCTYPE html>\n<html lang="en">\n<head>\n\t<meta charset="UTF-8">\n'
+                    f'\t<title>Quotes to Scrape</title>\n</head>\n<body>\n'
+                    f'<div class="container">\n{body}\n</div>\n</body>\n</html>\n')
+
+    written = 0
+    for n in range(1, pages + 1):
+        quotes = []
+        for i in range(per_page):
+            name = SAMPLE_AUTHORS[(n * per_page + i) % len(SAMPLE_AUTHORS)][0]
+            quotes.append(
+                '<div class="quote" itemscope itemtype="http://schema.org/CreativeWork">\n'
+                f'\t<span class="text" itemprop="text">“Quote {i + 1} on page {n}, it&#39;s a good one.”</span>\n'
+                f'\t<span>by <small class="author" itemprop="author">{name}</small>\n'
+                f'\t<a href="/author/{author_slug(name)}">(about)</a>\n\t</span>\n</div>')
+        pager = ''
+        if n < pages:
+            pager = (f'<li class="next">\n\t<a href="/page/{n + 1}/">Next '
+                     '<span aria-hidden="true">&rarr;</span></a>\n</li>')
+        write('' if n == 1 else f'page/{n}', '\n'.join(quotes)
+              + f'\n<nav>\n<ul class="pager">\n{pager}\n</ul>\n</nav>')
+        written += 1
+
+    for name, born, location in SAMPLE_AUTHORS:
+        write(f'author/{author_slug(name)}',
+              f'<div class="author-details">\n\t<h3 class="author-title">{name}</h3>\n'
+              f'\t<p><strong>Born:</strong> <span class="author-born-date">{born}</span>\n'
+              f'\t<span class="author-born-location">in {location}</span></p>\n</div>')
+        written += 1
+    return written
+
+
+def run_crawl(fetch, start_url, workers):
+    crawler = Crawler(fetch, workers)
+    counts = {'page': 0, 'detail': 0, 'error': 0}
+    quotes = 0
+    start = time.perf_counter()
+    for kind, url, data in crawler.crawl(start_url, **quotes_site()):
+        counts[kind] += 1
+        if kind == 'page':
+            quotes += len(data['quotes'])
+        elif kind == 'error':
+            print(f"\tFailed to fetch {url}: {data}")
+    elapsed = time.perf_counter() - start
+    print(f"{workers:>3} workers: {counts['page']} pages, {quotes} quotes, "
+          f"{counts['detail']} authors in {elapsed:.2f}s "
+          f"({crawler.requests} requests, {crawler.coalesced} duplicates merged)")
+
+
+def main():
+    source = sys.argv[1] if len(sys.argv) > 1 else None
+    if source and source.startswith(('http://', 'https://')):
+        from sites import QuotesSite
+        run_crawl(QuotesSite(base_url=source).text, source, Crawler.WORKERS)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if source is None:
+            source = tmp
+            write_sample_site(source)
+            print(f"Crawling a generated copy of {QUOTES_START_URL} with 50ms simulated latency")
+        fetch = LocalFetcher(source, delay=0.05)
+        for workers in (1, Crawler.WORKERS):
+            run_crawl(fetch, QUOTES_START_URL, workers)
+
+
+if __name__ == "__main__":
+    main()
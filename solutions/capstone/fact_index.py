@@ -0,0 +1,535 @@
+#!/usr/bin/env python3
+
+# Inverted index from extracted facts to articles
+# Answers "which articles mention 1991" or "which mention Paris, France"
+# without rescanning every article. Each term is a category and a normalised
+# fact value ("Dates", "1991"), and maps to a posting list of the ids of the
+# articles it was extracted from.
+#
+# Article ids only ever grow, so a posting list is stored as the gaps between
+# consecutive ids, each written as a varint (7 bits per byte, high bit set on
+# all but the last byte). Common facts appear in nearly every article and
+# their gaps fit in one byte each.
+#
+# Adding an article appends to the end of its terms' lists. An article scraped
+# again gets a new id, and its old one is dropped from the lists on save.
+# save() writes one file:
+#   MAGIC, header offset and length, posting lists,
+#   term table (sorted by term: posting list offset, length, count, last id),
+#   term strings, title strings (by article id), article ids sorted by title,
+#   JSON header (where each table is and how long it is)
+# Loading maps the file into memory and reads only the header, so opening an
+# index takes the same time whatever its size. Terms and titles are found by
+# binary search of the tables in place, reading a few pages each, and a query
+# only reads the posting lists it needs. Lists loaded from the file and
+# appended to since are read as one. Articles and terms added since loading
+# are kept in memory until save().
+#
+#   index = FactIndex("facts.idx")
+#   index.add(article.title, article.facts_by_category())
+#   index.query(all_of=["1991", "Locations:Paris, France"])
+#   index.save()
+#
+#   python3 fact_index.py build articles.jsonl facts.idx   (output of jobs.py)
+#   python3 fact_index.py query facts.idx 1991 "Locations:Paris, France"
+#   python3 fact_index.py bench
+
+import argparse
+import bisect
+import json
+import mmap
+import os
+import random
+import struct
+import tempfile
+import threading
+import time
+import unicodedata
+
+CATEGORIES = ['Dates', 'Money', 'Measurements', 'Quotes', 'Locations']
+
+# Separates a term's category from its value
+SEPARATOR = '\x1f'
+
+
+# Normalise a fact value so spellings of the same fact share a term
+# "Paris,  France" and "paris, france" -> "paris, france"
+def normalise_value(value):
+    value = unicodedata.normalize('NFKC', value).casefold()
+    return ' '.join(value.split()).strip(' .,;:\'"“”')
+
+
+def make_term(category, value):
+    return f"{category}{SEPARATOR}{normalise_value(value)}"
+
+
+def encode_varint(n, out):
+    while n > 0x7f:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+# Article ids of a posting list, in increasing order
+def decode_postings(data):
+    ids = []
+    current = 0
+    n = 0
+    shift = 0
+    for byte in data:
+        n |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        current += n
+        ids.append(current)
+        n = 0
+        shift = 0
+    return ids
+
+
+def encode_postings(ids):
+    out = bytearray()
+    previous = 0
+    for i in ids:
+        encode_varint(i - previous, out)
+        previous = i
+    return out
+
+
+class FactIndex:
+    MAGIC = b'FACTIDX2'
+    HEADER = struct.Struct('<8sQQ')
+    # A term's posting list offset and length, number of articles and last article id
+    TERM = struct.Struct('<QQQQ')
+    OFFSET = struct.Struct('<Q')
+
+    # path is the index file, loaded if it exists and written by save()
+    def __init__(self, path=None):
+        self.path = path
+        # Articles added since loading, whose ids follow on from the stored ones
+        self.new_titles = []
+        self.new_ids = {}
+        # Ids of articles since scraped again
+        self.replaced = set()
+        # term -> postings appended since loading, following on from the stored ones
+        self.added = {}
+        # term -> [number of articles, last article id], for terms appended to since loading
+        self.terms = {}
+        self.file = None
+        self.map = None
+        # Where the tables are in the file, and their sizes
+        self.layout = {'terms': 0, 'titles': 0, 'live': 0, 'postings': 0}
+        # Table name -> its 8-byte integers, read straight from the map
+        self.tables = {}
+        self.lock = threading.Lock()
+        if path and os.path.exists(path):
+            self._load()
+
+
+    # Only the header is read; the tables are searched in place
+    def _load(self):
+        self.file = open(self.path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, offset, length = self.HEADER.unpack_from(self.map)
+        if magic != self.MAGIC:
+            raise ValueError(f"{self.path} is not a fact index")
+        self.layout = json.loads(self.map[offset:offset + length])
+        sizes = {'term_table': 4 * self.layout['terms'], 'term_offsets': self.layout['terms'] + 1,
+                 'title_offsets': self.layout['titles'] + 1, 'by_title': self.layout['live']}
+        view = memoryview(self.map)
+        for table, size in sizes.items():
+            start = self.layout[table]
+            self.tables[table] = view[start:start + size * self.OFFSET.size].cast('Q')
+        view.release()
+
+
+    def _offset(self, table, i):
+        return self.tables[table][i]
+
+
+    # (posting list offset, length, count, last id) of stored term i
+    def _term_record(self, i):
+        table = self.tables['term_table']
+        return table[4 * i], table[4 * i + 1], table[4 * i + 2], table[4 * i + 3]
+
+
+    # Bytes of entry i of a table of strings stored as offsets into a blob
+    def _string(self, table, i):
+        start = self.layout[table + '_strings']
+        return self.map[start + self._offset(table + '_offsets', i):
+                        start + self._offset(table + '_offsets', i + 1)]
+
+
+    # Index of a term in the stored term table, or None
+    def _find_term(self, term):
+        if not self.layout['terms']:
+            return None
+        key = term.encode('utf-8')
+        terms = TableView(self.layout['terms'], lambda i: self._string('term', i))
+        i = bisect.bisect_left(terms, key)
+        return i if i < len(terms) and terms[i] == key else None
+
+
+    # (number of articles, last article id) of a term, or None if it isn't indexed
+    def _stats(self, term):
+        if term in self.terms:
+            return self.terms[term]
+        i = self._find_term(term)
+        if i is None:
+            return None
+        _, _, count, last = self._term_record(i)
+        return [count, last]
+
+
+    def _title(self, article_id):
+        stored = self.layout['titles']
+        if article_id >= stored:
+            return self.new_titles[article_id - stored]
+        # Titles of replaced articles are stored empty
+        return self._string('title', article_id).decode('utf-8') or None
+
+
+    # Current id of a title, or None
+    def _id(self, title):
+        if title in self.new_ids:
+            return self.new_ids[title]
+        if not self.layout['live']:
+            return None
+        key = title.encode('utf-8')
+        by_title = TableView(self.layout['live'], lambda k: self._string('title', self._offset('by_title', k)))
+        k = bisect.bisect_left(by_title, key)
+        if k < len(by_title) and by_title[k] == key:
+            return self._offset('by_title', k)
+        return None
+
+
+    def __contains__(self, title):
+        with self.lock:
+            return self._id(title) is not None
+
+
+    # Number of articles indexed, not counting replaced ones
+    def __len__(self):
+        return self.layout['live'] + len(self.new_titles) - len(self.replaced)
+
+
+    def term_count(self):
+        with self.lock:
+            return self.layout['terms'] + sum(1 for t in self.terms if self._find_term(t) is None)
+
+
+    # Index an article's facts, a dictionary of category -> values as returned
+    # by extract_key_facts. An article indexed before is replaced.
+    def add(self, title, facts):
+        with self.lock:
+            previous = self._id(title)
+            if previous is not None:
+                self.replaced.add(previous)
+            article_id = self.layout['titles'] + len(self.new_titles)
+            self.new_titles.append(title)
+            self.new_ids[title] = article_id
+            terms = {make_term(category, value)
+                     for category, values in facts.items() for value in values}
+            for term in terms:
+                if not term.endswith(SEPARATOR):
+                    self._append(term, article_id)
+            return article_id
+
+
+    def add_article(self, article):
+        return self.add(article.title, article.facts_by_category())
+
+
+    def _append(self, term, article_id):
+        stats = self.terms.get(term)
+        if stats is None:
+            stats = self.terms[term] = self._stats(term) or [0, 0]
+        encode_varint(article_id - stats[1], self.added.setdefault(term, bytearray()))
+        stats[0] += 1
+        stats[1] = article_id
+
+
+    # Posting list bytes of a term: the stored list, then anything appended since
+    def _posting_data(self, term):
+        data = b''
+        i = self._find_term(term)
+        if i is not None:
+            start, length, _, _ = self._term_record(i)
+            data = self.map[start:start + length]
+        return data + self.added.get(term, b'')
+
+
+    def _postings(self, term):
+        return decode_postings(self._posting_data(term))
+
+
+    # Terms a query term stands for: "Category:value" is that category only,
+    # a bare value matches it in every category
+    def expand(self, query):
+        category, _, value = query.partition(':')
+        if category.strip().title() in CATEGORIES and value.strip():
+            return [make_term(category.strip().title(), value)]
+        return [make_term(category, query) for category in CATEGORIES]
+
+
+    # Article ids matching any of the terms
+    def _union(self, terms):
+        ids = set()
+        for term in terms:
+            ids.update(self._postings(term))
+        return ids
+
+
+    # Titles of articles matching every query in all_of and at least one in any_of
+    # Queries are fact values, optionally prefixed with a category ("Dates:1991")
+    def query(self, all_of=(), any_of=()):
+        with self.lock:
+            groups = [self.expand(q) for q in all_of]
+            if any_of:
+                groups.append([term for q in any_of for term in self.expand(q)])
+            if not groups:
+                return []
+            # Start from the rarest group so the candidate set is small from the start
+            groups.sort(key=lambda terms: sum((self._stats(t) or (0,))[0] for t in terms))
+            candidates = self._union(groups[0])
+            for terms in groups[1:]:
+                if not candidates:
+                    break
+                candidates &= self._union(terms)
+            candidates -= self.replaced
+            return [self._title(i) for i in sorted(candidates)]
+
+
+    # Number of articles each term of a query matches, most common first
+    def counts(self, query):
+        with self.lock:
+            found = []
+            for term in self.expand(query):
+                stats = self._stats(term)
+                if stats:
+                    found.append((term.split(SEPARATOR)[0], stats[0]))
+        return sorted(found, key=lambda item: item[1], reverse=True)
+
+
+    # Write the index to path, dropping replaced articles from the posting lists
+    # Writes to a temporary file first so an interrupted save keeps the old index
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            stored = [self._string('term', i).decode('utf-8') for i in range(self.layout['terms'])]
+            titles = [self._title(i) for i in range(self.layout['titles'] + len(self.new_titles))]
+            for i in self.replaced:
+                titles[i] = None
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp = tempfile.mkstemp(dir=directory, prefix='.facts-')
+            records, terms = [], []
+            with os.fdopen(fd, 'wb') as f:
+                f.write(self.HEADER.pack(self.MAGIC, 0, 0))
+                # Sorted by code point, which is also UTF-8 byte order
+                for term in sorted(set(stored).union(self.terms)):
+                    data = self._posting_data(term)
+                    if self.replaced:
+                        ids = [i for i in decode_postings(data) if i not in self.replaced]
+                        if not ids:
+                            continue
+                        data = encode_postings(ids)
+                        count, last = len(ids), ids[-1]
+                    else:
+                        count, last = self._stats(term)
+                    records.append(self.TERM.pack(f.tell(), len(data), count, last))
+                    terms.append(term.encode('utf-8'))
+                    f.write(data)
+                layout = {'terms': len(terms), 'titles': len(titles),
+                          'live': sum(1 for t in titles if t is not None),
+                          'postings': f.tell() - self.HEADER.size}
+                encoded = [(t or '').encode('utf-8') for t in titles]
+                by_title = sorted((i for i, t in enumerate(titles) if t is not None),
+                                  key=encoded.__getitem__)
+                layout['term_table'] = f.tell()
+                f.write(b''.join(records))
+                self._write_strings(f, layout, 'term', terms)
+                self._write_strings(f, layout, 'title', encoded)
+                layout['by_title'] = f.tell()
+                f.write(b''.join(self.OFFSET.pack(i) for i in by_title))
+                offset = f.tell()
+                header = json.dumps(layout).encode('utf-8')
+                f.write(header)
+                f.seek(0)
+                f.write(self.HEADER.pack(self.MAGIC, offset, len(header)))
+                f.flush()
+                os.fsync(f.fileno())
+            self._close_map()
+            os.replace(tmp, self.path)
+            self.new_titles = []
+            self.new_ids = {}
+            self.added = {}
+            self.terms = {}
+            self.replaced = set()
+            self._load()
+
+
+    # Write strings as an array of offsets followed by their bytes
+    def _write_strings(self, f, layout, table, strings):
+        layout[table + '_offsets'] = f.tell()
+        position = 0
+        offsets = [self.OFFSET.pack(0)]
+        for s in strings:
+            position += len(s)
+            offsets.append(self.OFFSET.pack(position))
+        f.write(b''.join(offsets))
+        layout[table + '_strings'] = f.tell()
+        f.write(b''.join(strings))
+
+
+    def _close_map(self):
+        for table in self.tables.values():
+            table.release()
+        self.tables = {}
+        if self.map:
+            self.map.close()
+            self.file.close()
+            self.map = None
+            self.file = None
+
+
+    def close(self):
+        with self.lock:
+            self._close_map()
+
+
+# A stored table as a sequence for bisect; get(i) reads entry i
+class TableView:
+    def __init__(self, length, get):
+        self.length = length
+        self.get = get
+
+    def __getitem__(self, i):
+        return self.get(i)
+
+    def __len__(self):
+        return self.length
+
+
+# Add the articles of a jobs.py output file to the index
+def build(args):
+    index = FactIndex(args.index)
+    added = 0
+    with open(args.articles, encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            if not record['disambiguation']:
+                index.add(record['title'], record['facts'])
+                added += 1
+    index.save()
+    print(f"Indexed {added:,} articles; {len(index):,} articles and "
+          f"{index.term_count():,} distinct facts in {args.index}")
+
+
+def query(args):
+    index = FactIndex(args.index)
+    start = time.perf_counter()
+    if args.any:
+        titles = index.query(any_of=args.facts)
+    else:
+        titles = index.query(all_of=args.facts)
+    elapsed = time.perf_counter() - start
+    for fact in args.facts:
+        counts = ', '.join(f"{category} {count:,}" for category, count in index.counts(fact))
+        print(f"{fact!r}: {counts or 'no articles'}")
+    print(f"{len(titles):,} articles ({elapsed * 1000:.2f}ms)")
+    for title in titles[:args.limit]:
+        print(f"\t{title}")
+    index.close()
+
+
+PLACES = ["Paris, France", "London", "Berlin, Germany", "Sydney, Australia", "England",
+          "Tokyo, Japan", "Rome, Italy"] + [f"Town{i}" for i in range(2000)]
+
+
+# Random facts with a long tail, like those of real articles
+def synthetic_facts(rng):
+    return {
+        'Dates': {str(int(rng.paretovariate(1.2) * 10) + 1900) for _ in range(rng.randint(0, 6))},
+        'Money': {f"${rng.randint(1, 999)} million" for _ in range(rng.randint(0, 2))},
+        'Measurements': {f"{rng.randint(1, 5000)} km" for _ in range(rng.randint(0, 3))},
+        'Quotes': set(),
+        'Locations': {PLACES[min(int(rng.expovariate(0.05)), len(PLACES) - 1)]
+                      for _ in range(rng.randint(0, 4))},
+    }
+
+
+def bench(args):
+    rng = random.Random(0)
+    articles = [(f"Article {i}", synthetic_facts(rng)) for i in range(args.count)]
+    queries = [["1991"], ["Locations:Paris, France"], ["1991", "Paris, France"], ["Town500"]]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'facts.idx')
+        index = FactIndex(path)
+        start = time.perf_counter()
+        for title, facts in articles:
+            index.add(title, facts)
+        added = time.perf_counter() - start
+        start = time.perf_counter()
+        index.save()
+        saved = time.perf_counter() - start
+        raw = sum(len(json.dumps({c: sorted(v) for c, v in facts.items()}))
+                  for _, facts in articles)
+        postings = index.layout['postings']
+        print(f"{args.count:,} articles: added in {added:.2f}s, saved in {saved:.2f}s")
+        print(f"\t{os.path.getsize(path) / 1024:,.0f} KB on disk "
+              f"({postings / 1024:,.0f} KB of posting lists) for {raw / 1024:,.0f} KB of facts")
+
+        start = time.perf_counter()
+        index = FactIndex(path)
+        print(f"\topened in {(time.perf_counter() - start) * 1000:.2f}ms")
+        for q in queries:
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                found = index.query(all_of=q)
+            indexed = (time.perf_counter() - start) / args.repeat
+
+            terms = [index.expand(t) for t in q]
+            start = time.perf_counter()
+            scanned = [title for title, facts in articles
+                       if all(any(make_term(c, v) in group for c, values in facts.items()
+                                  for v in values) for group in map(set, terms))]
+            scan = time.perf_counter() - start
+            assert scanned == found, q
+            print(f"\t{' AND '.join(q):32} {len(found):>7,} articles: "
+                  f"index {indexed * 1000:7.2f}ms, rescan {scan * 1000:7.0f}ms")
+        index.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inverted index from extracted facts to articles")
+    commands = parser.add_subparsers(dest='command')
+    build_parser = commands.add_parser('build', help="add a jobs.py output file to an index")
+    build_parser.add_argument('articles', help="JSON lines file written by jobs.py")
+    build_parser.add_argument('index', help="index file, created if it doesn't exist")
+    query_parser = commands.add_parser('query', help="list articles mentioning facts")
+    query_parser.add_argument('index')
+    query_parser.add_argument('facts', nargs='+',
+                              help="fact values, optionally as CATEGORY:VALUE")
+    query_parser.add_argument('--any', action='store_true',
+                              help="match articles with any of the facts instead of all")
+    query_parser.add_argument('--limit', type=int, default=20)
+    bench_parser = commands.add_parser('bench', help="compare queries against rescanning articles")
+    bench_parser.add_argument('--count', type=int, default=100_000)
+    bench_parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        build(args)
+    elif args.command == 'query':
+        query(args)
+    elif args.command == 'bench':
+        bench(args)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
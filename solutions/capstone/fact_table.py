@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+
+# Columnar table of extracted facts for analysis across a whole corpus
+# extract_key_facts gives per-article sets of raw strings. This table appends
+# them into NumPy arrays along with values parsed out of the raw text
+# (ISO dates, money amounts and currencies, measures and units), so questions
+# like "facts per year" or "money by currency" are single vectorised operations.
+# Run this file to benchmark appends and aggregation over synthetic facts.
+
+import re
+import sys
+import time
+import numpy as np
+
+MONTHS = {
+    name: i for i, name in enumerate(
+        ['january', 'february', 'march', 'april', 'may', 'june', 'july',
+         'august', 'september', 'october', 'november', 'december'], 1)
+}
+MONTH_NAMES = '|'.join(MONTHS)
+
+DATE_PATTERNS = [
+    # March 15, 2024
+    (re.compile(rf'({MONTH_NAMES})\s+(\d{{1,2}}),?\s+(\d{{4}})', re.IGNORECASE), ('month', 'day', 'year')),
+    # 15 March 2024
+    (re.compile(rf'(\d{{1,2}})\s+({MONTH_NAMES})\s+(\d{{4}})', re.IGNORECASE), ('day', 'month', 'year')),
+    # 03/15/24 or 03/15/2024
+    (re.compile(r'(\d{1,2})/(\d{1,2})/(\d{2,4})'), ('month', 'day', 'year')),
+    # 1991, 1991-2024 or founded in 1991 (start of the range, 1st of January)
+    (re.compile(r'(\d{4})'), ('year',)),
+]
+
+CURRENCY_SYMBOLS = {'$': 'USD', '£': 'GBP', '€': 'EUR', '¥': 'JPY'}
+CURRENCY_WORDS = {'dollar': 'USD', 'pound': 'GBP', 'euro': 'EUR', 'yen': 'JPY'}
+MONEY_PATTERN = re.compile(r'([$£€¥])?\s*(\d[\d,\.\s]*)\s*(dollar|pound|euro|yen)?', re.IGNORECASE)
+
+SCALES = {'hundred': 1e2, 'thousand': 1e3, 'million': 1e6, 'billion': 1e9}
+UNITS = {
+    'metre': 'm', 'metres': 'm', 'm': 'm', 'cm': 'cm', 'mm': 'mm',
+    'kilometer': 'km', 'kilometers': 'km', 'kilometre': 'km', 'kilometres': 'km', 'km': 'km',
+    'feet': 'ft', 'mile': 'mi', 'miles': 'mi', 'inch': 'in', 'inches': 'in',
+    'kg': 'kg', 'kilogram': 'kg', 'kilograms': 'kg', 'pound': 'lb', 'pounds': 'lb',
+    'lb': 'lb', 'lbs': 'lb', 'tonne': 't', 'tonnes': 't', 'ton': 'ton', 'tons': 'ton',
+    'acre': 'acre', 'acres': 'acre', 'year': 'year', 'years': 'year',
+    'people': 'people', 'inhabitants': 'people', 'residents': 'people',
+    'population': 'people', 'students': 'people', 'members': 'people', 'employees': 'people',
+}
+MEASURE_PATTERN = re.compile(
+    r'(\d+(?:,\d{3})*(?:\.\d+)?)\s*(hundred|thousand|million|billion)?\s*(square\s+)?([a-z]+)',
+    re.IGNORECASE
+)
+
+
+# Parse a date fact into numpy datetime64[D], or None if it has no usable date
+def parse_date(text):
+    for pattern, fields in DATE_PATTERNS:
+        match = pattern.search(text)
+        if not match:
+            continue
+        parts = dict(zip(fields, match.groups()))
+        year = int(parts['year'])
+        if year < 100:
+            year += 2000 if year < 50 else 1900
+        month = parts.get('month', '1')
+        month = MONTHS[month.lower()] if not month.isdigit() else int(month)
+        day = int(parts.get('day', 1))
+        try:
+            return np.datetime64(f"{year:04d}-{month:02d}-{day:02d}", 'D')
+        except ValueError:
+            return None
+    return None
+
+
+# Convert digits with separators into a float, or None if it can't be read
+# "1,234.56" -> 1234.56, "1 000 000" -> 1000000.0, "1.234" -> 1.234
+# European style "1.234.567" -> 1234567.0, "1.234,56" -> 1234.56
+def parse_number(digits):
+    digits = re.sub(r'\s', '', digits).rstrip(',.')
+    if not digits:
+        return None
+    if ',' in digits and '.' in digits:
+        # Whichever separator comes last is the decimal point
+        thousands = ',' if digits.rfind('.') > digits.rfind(',') else '.'
+        digits = digits.replace(thousands, '').replace(',', '.')
+    elif digits.count('.') > 1:
+        digits = digits.replace('.', '')
+    else:
+        digits = digits.replace(',', '')
+    try:
+        return float(digits)
+    except ValueError:
+        return None
+
+
+# Parse a money fact into (amount, currency code), or (None, None)
+def parse_money(text):
+    match = MONEY_PATTERN.search(text)
+    if not match or not (match.group(1) or match.group(3)):
+        return (None, None)
+    amount = parse_number(match.group(2))
+    if match.group(1):
+        currency = CURRENCY_SYMBOLS[match.group(1)]
+    else:
+        currency = CURRENCY_WORDS[match.group(3).lower()]
+    return (amount, currency)
+
+
+# Parse a measurement fact into (value, unit), or (None, None)
+# "10 million people" -> (10000000.0, 'people'), "300 square miles" -> (300.0, 'sq mi')
+def parse_measure(text):
+    match = MEASURE_PATTERN.search(text)
+    if not match:
+        return (None, None)
+    number, scale, square, unit = match.groups()
+    unit = UNITS.get(unit.lower())
+    if unit is None:
+        return (None, None)
+    value = float(number.replace(',', '')) * SCALES.get((scale or '').lower(), 1)
+    return (value, ('sq ' + unit) if square else unit)
+
+
+class FactTable:
+    # Appends are collected in lists and moved into arrays in chunks,
+    # so building a table of millions of facts doesn't copy arrays per fact
+    CHUNK_SIZE = 65536
+
+    NAT = np.datetime64('NaT', 'D')
+    COLUMNS = ('article', 'category', 'date', 'amount', 'currency', 'measure', 'unit')
+    DTYPES = {
+        'article': np.int64,
+        'category': np.uint8,
+        'date': 'datetime64[D]',
+        'amount': np.float64,
+        'currency': np.uint8,
+        'measure': np.float64,
+        'unit': np.uint16,
+    }
+
+    def __init__(self):
+        # Labels are stored once and referenced by small integer codes
+        self.labels = {'category': [], 'currency': [''], 'unit': ['']}
+        self._codes = {name: {v: i for i, v in enumerate(values)}
+                       for name, values in self.labels.items()}
+        self._chunks = {name: [] for name in self.COLUMNS}
+        self._texts = []
+        self._pending = {name: [] for name in self.COLUMNS}
+        self._pending_text = []
+        self._length = 0
+
+
+    def __len__(self):
+        return self._length + len(self._pending_text)
+
+
+    def _code(self, name, label):
+        codes = self._codes[name]
+        if label not in codes:
+            codes[label] = len(self.labels[name])
+            self.labels[name].append(label)
+        return codes[label]
+
+
+    # Append one fact, parsing normalised values from its raw text
+    def append(self, article_id, category, text):
+        pending = self._pending
+        pending['article'].append(article_id)
+        pending['category'].append(self._code('category', category))
+        date, amount, currency, measure, unit = self.NAT, np.nan, 0, np.nan, 0
+        if category == 'Dates':
+            date = parse_date(text)
+            if date is None:
+                date = self.NAT
+        elif category == 'Money':
+            value, code = parse_money(text)
+            if value is not None:
+                amount, currency = value, self._code('currency', code)
+        elif category == 'Measurements':
+            value, code = parse_measure(text)
+            if value is not None:
+                measure, unit = value, self._code('unit', code)
+        pending['date'].append(date)
+        pending['amount'].append(amount)
+        pending['currency'].append(currency)
+        pending['measure'].append(measure)
+        pending['unit'].append(unit)
+        self._pending_text.append(text)
+        if len(self._pending_text) >= self.CHUNK_SIZE:
+            self._flush()
+
+
+    # Append every fact of an article
+    # facts is the dictionary returned by extract_key_facts
+    def append_article(self, article_id, facts):
+        for category, values in facts.items():
+            for value in values:
+                self.append(article_id, category, value)
+
+
+    def _flush(self):
+        if not self._pending_text:
+            return
+        for name in self.COLUMNS:
+            self._chunks[name].append(np.array(self._pending[name], dtype=self.DTYPES[name]))
+            self._pending[name] = []
+        self._texts.extend(self._pending_text)
+        self._length += len(self._pending_text)
+        self._pending_text = []
+
+
+    # Return a column as one contiguous array
+    def column(self, name):
+        self._flush()
+        chunks = self._chunks[name]
+        if len(chunks) != 1:
+            merged = np.concatenate(chunks) if chunks else np.array([], dtype=self.DTYPES[name])
+            self._chunks[name] = chunks = [merged]
+        return chunks[0]
+
+
+    # Raw text of the fact at a row
+    def text(self, row):
+        self._flush()
+        return self._texts[row]
+
+
+    # Boolean mask of rows in a category
+    def category_mask(self, category):
+        code = self._codes['category'].get(category)
+        if code is None:
+            return np.zeros(len(self), dtype=bool)
+        return self.column('category') == code
+
+
+    # Count dated facts per year (or 'M' for month, 'D' for day)
+    # Returns (bucket start dates, counts)
+    def date_histogram(self, unit='Y'):
+        dates = self.column('date')
+        dates = dates[~np.isnat(dates)].astype(f'datetime64[{unit}]')
+        buckets, counts = np.unique(dates, return_counts=True)
+        return buckets, counts
+
+
+    # Sum money amounts per currency
+    # Returns dictionary of currency code -> total
+    def money_totals(self):
+        amounts = self.column('amount')
+        currencies = self.column('currency')
+        known = (currencies > 0) & ~np.isnan(amounts)
+        totals = np.bincount(currencies[known], weights=amounts[known],
+                             minlength=len(self.labels['currency']))
+        return {code: totals[i] for i, code in enumerate(self.labels['currency']) if i and totals[i]}
+
+
+    # Sum measures per unit
+    # Returns dictionary of unit -> total
+    def measure_totals(self):
+        measures = self.column('measure')
+        units = self.column('unit')
+        known = (units > 0) & ~np.isnan(measures)
+        totals = np.bincount(units[known], weights=measures[known],
+                             minlength=len(self.labels['unit']))
+        return {unit: totals[i] for i, unit in enumerate(self.labels['unit']) if i and totals[i]}
+
+
+    # Count facts per article in a category
+    # Returns (article ids, counts)
+    def facts_per_article(self, category):
+        articles = self.column('article')[self.category_mask(category)]
+        return np.unique(articles, return_counts=True)
+
+
+    # Build a table from every fact saved in an ArticleStore
+    @classmethod
+    def from_store(cls, store):
+        table = cls()
+        for article_id, category, value in store.iter_facts():
+            table.append(article_id, category, value)
+        return table
+
+
+    # Save as a compressed .npz file
+    # Raw text is stored as one UTF-8 buffer plus offsets rather than Python objects
+    def save(self, path):
+        self._flush()
+        encoded = [t.encode('utf-8') for t in self._texts]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        arrays = {name: self.column(name) for name in self.COLUMNS}
+        arrays['dates'] = arrays.pop('date').astype(np.int64)
+        for name, values in self.labels.items():
+            arrays[f'labels_{name}'] = np.array(values, dtype=str)
+        np.savez_compressed(
+            path,
+            text=np.frombuffer(b''.join(encoded), dtype=np.uint8),
+            text_offsets=offsets,
+            **arrays
+        )
+
+
+    # Load a table written by save
+    @classmethod
+    def load(cls, path):
+        table = cls()
+        with np.load(path) as data:
+            for name in table.labels:
+                table.labels[name] = [str(v) for v in data[f'labels_{name}']]
+                table._codes[name] = {v: i for i, v in enumerate(table.labels[name])}
+            for name in cls.COLUMNS:
+                key = 'dates' if name == 'date' else name
+                values = data[key]
+                if name == 'date':
+                    values = values.astype('datetime64[D]')
+                table._chunks[name] = [values]
+            buffer = data['text'].tobytes()
+            offsets = data['text_offsets']
+        table._texts = [buffer[offsets[i]:offsets[i + 1]].decode('utf-8')
+                        for i in range(len(offsets) - 1)]
+        table._length = len(table._texts)
+        return table
+
+
+# Build a table of synthetic facts and time appends and aggregations
+def benchmark(count):
+    samples = [
+        ('Dates', 'March 15, 1991'), ('Dates', '1850'), ('Dates', '15 June 2004'),
+        ('Money', '$1,234.56'), ('Money', '5 pounds'), ('Money', '€25.50'),
+        ('Measurements', '300 kilometres'), ('Measurements', '10 million people'),
+        ('Quotes', 'Sheep are quite remarkable animals'), ('Locations', 'Paris, France'),
+    ]
+    table = FactTable()
+    start = time.perf_counter()
+    for i in range(count):
+        category, text = samples[i % len(samples)]
+        table.append(i // 20, category, text)
+    table.column('article')
+    appended = time.perf_counter() - start
+
+    start = time.perf_counter()
+    table.date_histogram()
+    table.money_totals()
+    table.measure_totals()
+    aggregated = time.perf_counter() - start
+    return table, appended, aggregated
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    table, appended, aggregated = benchmark(count)
+    print(f"Appended {count:,} facts in {appended:.2f}s ({count / appended:,.0f} facts/s)")
+    print(f"Date histogram, money and measure totals in {aggregated * 1000:.1f}ms")
+    print("Money totals:", {k: round(v, 2) for k, v in table.money_totals().items()})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+
+# Field extraction with a fast regex path and a BeautifulSoup fallback
+# examples/01_basic_requests.py ex1_6 pulls titles and quotes out of
+# quotes.toscrape.com with regex, examples/02_beautifulsoup_basics.py ex2_1 does
+# the same with BeautifulSoup. Regex is much faster but breaks silently when the
+# markup changes, so HybridExtractor runs both paths on the first few pages.
+# A field whose regex agrees with the DOM on every sampled page switches to the
+# regex alone. A field that disagrees falls back to the DOM for good.
+#
+#   extractor = HybridExtractor(QUOTES_FIELDS)
+#   for page in pages:
+#       data = extractor.extract(page)
+#   extractor.print_report()
+#
+# Run this file with HTML files or URLs to see the per-field speed difference.
+
+import html
+import re
+import sys
+import time
+from bs4 import BeautifulSoup
+
+
+class Field:
+    # name:    key in the extracted dictionary
+    # pattern: regex whose first group is the value, found with findall
+    # dom:     function taking a BeautifulSoup and returning a list of values
+    # clean:   applied to every value from both paths before comparing them
+    # many:    False to return only the first value (or None)
+    def __init__(self, name, pattern, dom, clean=str.strip, many=True):
+        self.name = name
+        self.pattern = re.compile(pattern, re.DOTALL)
+        self.dom = dom
+        self.clean = clean
+        self.many = many
+
+    def fast_values(self, page_html):
+        return [self.clean(v) for v in self.pattern.findall(page_html)]
+
+    def dom_values(self, soup):
+        return [self.clean(v) for v in self.dom(soup)]
+
+    def result(self, values):
+        if self.many:
+            return values
+        return values[0] if values else None
+
+
+# Quotes are wrapped in curly quotes, e.g. “The world as we have created it...”
+def strip_quote_marks(text):
+    return html.unescape(text).strip().strip('“”"')
+
+
+def unescape(text):
+    return html.unescape(text).strip()
+
+
+QUOTES_FIELDS = [
+    Field('title', r'<title>(.*?)</title>',
+          lambda soup: [soup.title.get_text()] if soup.title else [],
+          clean=unescape, many=False),
+    Field('quotes', r'<span class="text" itemprop="text">(.*?)</span>',
+          lambda soup: [s.get_text() for s in soup.find_all('span', class_='text', itemprop='text')],
+          clean=strip_quote_marks),
+    Field('authors', r'<small class="author" itemprop="author">(.*?)</small>',
+          lambda soup: [s.get_text() for s in soup.find_all('small', class_='author')],
+          clean=unescape),
+    Field('next', r'<li class="next">\s*<a href="(.*?)"',
+          lambda soup: [a['href'] for a in soup.select('li.next > a')],
+          clean=unescape, many=False),
+]
+
+
+class FieldStats:
+    def __init__(self):
+        self.mode = 'sampling'
+        self.fast_time = 0.0
+        self.fast_pages = 0
+        self.dom_time = 0.0
+        self.dom_pages = 0
+        self.disagreements = 0
+
+
+class HybridExtractor:
+    # Pages on which both paths run before trusting the regex
+    SAMPLE_SIZE = 5
+
+    def __init__(self, fields, sample_size=SAMPLE_SIZE):
+        self.fields = fields
+        self.sample_size = sample_size
+        self.stats = {f.name: FieldStats() for f in fields}
+        self.pages = 0
+        self.parse_time = 0.0
+        self.parses = 0
+
+
+    # Extract every field from a page
+    # Returns dictionary of field name -> value
+    def extract(self, page_html):
+        sampling = self.pages < self.sample_size
+        self.pages += 1
+        needs_dom = sampling or any(s.mode == 'dom' for s in self.stats.values())
+
+        soup = None
+        if needs_dom:
+            start = time.perf_counter()
+            soup = BeautifulSoup(page_html, 'html.parser')
+            self.parse_time += time.perf_counter() - start
+            self.parses += 1
+
+        data = {}
+        for field in self.fields:
+            stats = self.stats[field.name]
+            if stats.mode != 'dom':
+                start = time.perf_counter()
+                fast = field.fast_values(page_html)
+                stats.fast_time += time.perf_counter() - start
+                stats.fast_pages += 1
+            if soup is not None and (sampling or stats.mode == 'dom'):
+                start = time.perf_counter()
+                dom = field.dom_values(soup)
+                stats.dom_time += time.perf_counter() - start
+                stats.dom_pages += 1
+
+            if stats.mode == 'dom':
+                data[field.name] = field.result(dom)
+                continue
+            if sampling and fast != dom:
+                # The regex is wrong for this markup, so stop trusting it
+                stats.disagreements += 1
+                stats.mode = 'dom'
+                data[field.name] = field.result(dom)
+                continue
+            data[field.name] = field.result(fast)
+
+        if soup is not None:
+            soup.decompose()
+        if self.pages == self.sample_size:
+            for stats in self.stats.values():
+                if stats.mode == 'sampling':
+                    stats.mode = 'fast'
+        return data
+
+
+    # Per field: which path is used, and average time per page on each path
+    # DOM time includes the page parse, which is only skipped if every field is fast
+    def report(self):
+        parse = self.parse_time / self.parses if self.parses else 0.0
+        rows = []
+        for field in self.fields:
+            stats = self.stats[field.name]
+            fast = stats.fast_time / stats.fast_pages if stats.fast_pages else None
+            dom = stats.dom_time / stats.dom_pages + parse if stats.dom_pages else None
+            speedup = dom / fast if fast and dom else None
+            rows.append({
+                'field': field.name,
+                'mode': stats.mode,
+                'fast_ms': None if fast is None else fast * 1000,
+                'dom_ms': None if dom is None else dom * 1000,
+                'speedup': speedup,
+                'disagreements': stats.disagreements,
+            })
+        return rows
+
+
+    def print_report(self):
+        def ms(value):
+            return '-' if value is None else f"{value:.3f}ms"
+        print(f"{'field':10} {'path':8} {'regex':>10} {'dom':>10} {'speedup':>8}")
+        for row in self.report():
+            speedup = '-' if row['speedup'] is None else f"{row['speedup']:.0f}x"
+            print(f"{row['field']:10} {row['mode']:8} {ms(row['fast_ms']):>10} "
+                  f"{ms(row['dom_ms']):>10} {speedup:>8}")
+
+
+def load_page(source):
+    if source.startswith(('http://', 'https://')):
+        import requests
+        return requests.get(source, timeout=10).text
+    with open(source, encoding='utf-8') as f:
+        return f.read()
+
+
+def main():
+    sources = sys.argv[1:] or ["http://quotes.toscrape.com/"]
+    pages = [load_page(s) for s in sources]
+    extractor = HybridExtractor(QUOTES_FIELDS)
+    # Go round the pages enough times to get past the sample
+    rounds = max(1, 200 // len(pages))
+    for _ in range(rounds):
+        for page in pages:
+            extractor.extract(page)
+    print(f"Extracted {extractor.pages} pages, DOM parsed {extractor.parses} times")
+    extractor.print_report()
+
+
+if __name__ == "__main__":
+    main()
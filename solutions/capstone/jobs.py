@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+
+# Resumable bulk scrape jobs
+# JobRunner fetches and extracts a list of titles with the scraper's
+# extraction path and writes one JSON line per article to an output file.
+# Progress goes to an append-only write-ahead log:
+#   {"op": "start", "title": ...}                 title handed to a fetcher
+#   {"op": "done", "title": ..., "end": offset}   its output line is written,
+#                                                 and the output file ends here
+#   {"op": "failed", "title": ..., "error": ..., "permanent": ...}
+#                                                 given up on after retries
+#   {"op": "lost", "end": offset}                 the output file was found
+#                                                 shorter than logged (OS crash)
+#
+# On restart the log is replayed. The output file is cut back to the end of the
+# last completed title, removing a line half-written (or written but not yet
+# logged) when the process died, and titles started but not done go first.
+# If the output is shorter than the log says, titles whose lines are missing
+# are done again. So every title appears in the output exactly once however
+# often the job stops.
+#
+# Failed fetches are retried with exponential backoff. Titles that still fail
+# because of the network are tried again when the job is resumed; missing
+# pages are not.
+#
+# Each record is a single buffered write, and fsync only happens every
+# SYNC_INTERVAL seconds, so logging costs little next to fetching. The output
+# file is fsynced first, so the log never records lines that aren't on disk.
+# The log is compacted into a snapshot record once it has COMPACT_EVERY records.
+#
+#   python3 jobs.py run titles.txt articles.jsonl     (run again to resume)
+#   python3 jobs.py bench                             (overhead and crash/resume check)
+
+import argparse
+import collections
+import heapq
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from titles import normalise_title
+
+
+class JobLog:
+    COMPACT_EVERY = 100_000
+    SYNC_INTERVAL = 1.0
+
+    # path is the log file, or None to keep no log (for comparison)
+    # before_sync is called before the log is made durable, e.g. to fsync the output
+    def __init__(self, path, before_sync=None):
+        self.path = path
+        self.before_sync = before_sync
+        # Title -> end of its output line
+        self.done = {}
+        self.failed = {}
+        self.permanent = set()
+        self.in_flight = set()
+        self.output_end = 0
+        self.records = 0
+        self.file = None
+        self.last_sync = time.monotonic()
+        if path:
+            if os.path.exists(path):
+                self._replay()
+            self.file = open(path, 'ab')
+
+
+    # Apply every complete record, dropping a torn last line
+    def _replay(self):
+        good = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                self._apply(record)
+                good += len(line)
+        if good < os.path.getsize(self.path):
+            with open(self.path, 'r+b') as f:
+                f.truncate(good)
+
+
+    def _apply(self, record):
+        op = record['op']
+        self.records += 1
+        if op == 'snapshot':
+            done = record['done']
+            # Older snapshots only listed the titles
+            self.done = dict(done) if isinstance(done, dict) else dict.fromkeys(done, record['end'])
+            self.failed = dict(record['failed'])
+            self.permanent = set(record.get('permanent', ()))
+            self.in_flight = set(record['in_flight'])
+            self.output_end = record['end']
+        elif op == 'start':
+            self.in_flight.add(record['title'])
+        elif op == 'done':
+            title = record['title']
+            self.in_flight.discard(title)
+            self.failed.pop(title, None)
+            self.permanent.discard(title)
+            self.done[title] = record['end']
+            self.output_end = record['end']
+        elif op == 'failed':
+            title = record['title']
+            self.in_flight.discard(title)
+            self.failed[title] = record['error']
+            if record.get('permanent'):
+                self.permanent.add(title)
+            else:
+                self.permanent.discard(title)
+        elif op == 'lost':
+            end = record['end']
+            self.done = {title: e for title, e in self.done.items() if e <= end}
+            self.output_end = max(self.done.values(), default=0)
+
+
+    def _append(self, record):
+        self._apply(record)
+        if not self.file:
+            return
+        self.file.write(json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n')
+        self.file.flush()
+        if self.records >= self.COMPACT_EVERY:
+            self.compact()
+        elif time.monotonic() - self.last_sync > self.SYNC_INTERVAL:
+            self.sync()
+
+
+    def started(self, title):
+        self._append({'op': 'start', 'title': title})
+
+
+    # Call after the title's output is written and flushed; end is the output size
+    def finished(self, title, end):
+        self._append({'op': 'done', 'title': title, 'end': end})
+
+
+    # permanent failures (missing pages) aren't retried when the job is resumed
+    def failed_title(self, title, error, permanent=False):
+        self._append({'op': 'failed', 'title': title, 'error': str(error), 'permanent': permanent})
+
+
+    # Forget titles whose output lines lie past size, the length of the output found
+    # Returns the titles to do again
+    def lost(self, size):
+        missing = [title for title, end in self.done.items() if end > size]
+        self._append({'op': 'lost', 'end': size})
+        return missing
+
+
+    def sync(self):
+        if self.file:
+            if self.before_sync:
+                self.before_sync()
+            os.fsync(self.file.fileno())
+        self.last_sync = time.monotonic()
+
+
+    # Replace the log with one snapshot record of the current state
+    def compact(self):
+        snapshot = {'op': 'snapshot', 'done': dict(sorted(self.done.items())),
+                    'failed': self.failed, 'permanent': sorted(self.permanent),
+                    'in_flight': sorted(self.in_flight), 'end': self.output_end}
+        if self.before_sync:
+            self.before_sync()
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.joblog-')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(json.dumps(snapshot, ensure_ascii=False).encode('utf-8') + b'\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.file.close()
+        os.replace(tmp, self.path)
+        self.file = open(self.path, 'ab')
+        self.records = 1
+        self.last_sync = time.monotonic()
+
+
+    def close(self):
+        if self.file:
+            self.sync()
+            self.file.close()
+            self.file = None
+
+
+# One output line for an article
+def article_record(query, article):
+    texts = article.texts()
+    return {
+        'query': query,
+        'title': article.title,
+        'revision': article.revision,
+        'disambiguation': article.disambiguation,
+        'intro': texts[0] if texts else None,
+        'facts': {category: sorted(values)
+                  for category, values in article.facts_by_category().items()},
+    }
+
+
+class JobRunner:
+    # Pages requested ahead of the one being extracted
+    WINDOW = 16
+    MAX_ATTEMPTS = 5
+    # Seconds before the first retry of a failed fetch, doubling for each one after
+    RETRY_DELAY = 0.5
+
+    # scraper is a WikipediaScraper; its site's scheduler does the fetching
+    # log_path defaults to the output path with .wal appended
+    def __init__(self, scraper, output_path, log_path=None, use_log=True):
+        self.scraper = scraper
+        self.output_path = output_path
+        self.log_path = (log_path or output_path + '.wal') if use_log else None
+
+
+    # Process every title not already done or failed in an earlier run
+    # Returns dictionary of counts: done, failed, skipped (finished earlier)
+    # and resumed (interrupted, lost or failed on the network earlier, and redone)
+    def run(self, titles):
+        mode = 'r+b' if os.path.exists(self.output_path) else 'w+b'
+        out = open(self.output_path, mode)
+        log = JobLog(self.log_path, before_sync=lambda: os.fsync(out.fileno()))
+        # After an OS crash the log may be on disk while the output lines it logged are not
+        size = os.fstat(out.fileno()).st_size
+        lost = set(log.lost(size)) if size < log.output_end else set()
+
+        titles = [t for t in dict.fromkeys(normalise_title(t) for t in titles) if t]
+        resumed = [t for t in titles if t in log.in_flight or t in lost
+                   or (t in log.failed and t not in log.permanent)]
+        redo = set(resumed)
+        todo = collections.deque(resumed + [t for t in titles if t not in log.done
+                                             and t not in log.failed and t not in redo])
+        summary = {'done': 0, 'failed': 0, 'skipped': len(titles) - len(todo),
+                   'resumed': len(resumed)}
+
+        # Drop anything written after the last title the log saw finish
+        out.truncate(log.output_end)
+        out.seek(log.output_end)
+
+        attempts = collections.Counter()
+        # (time to retry, title) of fetches that failed
+        retries = []
+        window = collections.deque()
+        try:
+            while todo or window or retries:
+                while retries and retries[0][0] <= time.monotonic():
+                    todo.append(heapq.heappop(retries)[1])
+                if not todo and not window:
+                    time.sleep(max(0, retries[0][0] - time.monotonic()))
+                    continue
+                while todo and len(window) < self.WINDOW:
+                    title = todo.popleft()
+                    log.started(title)
+                    url = self.scraper.site.page_url(self.scraper.form_query(title))
+                    window.append((title, self.scraper.site.submit(url)))
+
+                title, future = window.popleft()
+                try:
+                    response = future.result()
+                    if response.status_code == 404:
+                        log.failed_title(title, "missing", permanent=True)
+                        summary['failed'] += 1
+                        continue
+                    if response.status_code != 200:
+                        raise IOError(f"HTTP {response.status_code}")
+                except Exception as e:
+                    attempts[title] += 1
+                    if attempts[title] < self.MAX_ATTEMPTS:
+                        delay = self.RETRY_DELAY * 2 ** (attempts[title] - 1)
+                        heapq.heappush(retries, (time.monotonic() + delay, title))
+                    else:
+                        log.failed_title(title, e)
+                        summary['failed'] += 1
+                    continue
+
+                article = self.scraper.extract_article(response.text, self.scraper.form_query(title))
+                line = json.dumps(article_record(title, article), ensure_ascii=False)
+                out.write(line.encode('utf-8') + b'\n')
+                out.flush()
+                log.finished(title, out.tell())
+                summary['done'] += 1
+        finally:
+            for _, future in window:
+                future.cancel()
+            out.flush()
+            # Syncs the output, then the log
+            log.close()
+            os.fsync(out.fileno())
+            out.close()
+            if self.scraper.store:
+                self.scraper.store.flush()
+        return summary
+
+
+def simulated_scraper(latency):
+    from service import SimulatedWikipedia
+    from sites import FetchScheduler, WikipediaSite
+    from wikipedia_scraper import WikipediaScraper
+    scheduler = FetchScheduler(workers=JobRunner.WINDOW, opener=SimulatedWikipedia(latency))
+    site = WikipediaSite(scheduler)
+    scheduler.configure(site.host, concurrency=JobRunner.WINDOW)
+    return WikipediaScraper(site=site)
+
+
+def run(args):
+    from article_store import ArticleStore
+    from sites import WikipediaSite
+    from wikipedia_scraper import WikipediaScraper
+    if args.simulate is not None:
+        scraper = simulated_scraper(args.simulate)
+    else:
+        store = ArticleStore(args.store) if args.store else None
+        scraper = WikipediaScraper(store=store, site=WikipediaSite(lang=args.lang))
+    with open(args.titles, encoding='utf-8') as f:
+        titles = f.read().splitlines()
+    summary = JobRunner(scraper, args.output).run(titles)
+    print(f"{summary['done']} done, {summary['failed']} failed, "
+          f"{summary['skipped']} already done, {summary['resumed']} resumed")
+
+
+def bench(args):
+    titles = [f"Topic {i}" for i in range(args.count)]
+    with tempfile.TemporaryDirectory() as tmp:
+        titles_path = os.path.join(tmp, 'titles.txt')
+        with open(titles_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(titles))
+
+        print(f"Throughput on {args.count:,} simulated pages (best of 3):")
+        best = {False: 0, True: 0}
+        for attempt in range(3):
+            for use_log in best:
+                output = os.path.join(tmp, f'out-{use_log}-{attempt}.jsonl')
+                start = time.perf_counter()
+                JobRunner(simulated_scraper(0), output, use_log=use_log).run(titles)
+                best[use_log] = max(best[use_log], args.count / (time.perf_counter() - start))
+        print(f"\tno log   {best[False]:8,.0f} pages/s")
+        print(f"\twith log {best[True]:8,.0f} pages/s ({1 - best[True] / best[False]:.1%} slower)")
+
+        # Kill a run partway through, repeatedly, then let it finish
+        output = os.path.join(tmp, 'crash.jsonl')
+        command = [sys.executable, os.path.abspath(__file__), 'run', titles_path, output,
+                   '--simulate', '0.01']
+        kills = 0
+        while kills < args.kills:
+            process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+            time.sleep(1.0)
+            if process.poll() is not None:
+                break
+            process.send_signal(signal.SIGKILL)
+            process.wait()
+            kills += 1
+        # An OS crash can lose output the log already counts as written
+        with open(output, 'r+b') as f:
+            f.truncate(os.path.getsize(output) // 2)
+        subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+
+        with open(output, encoding='utf-8') as f:
+            written = [json.loads(line)['query'] for line in f]
+        counts = collections.Counter(written)
+        duplicates = sum(1 for n in counts.values() if n > 1)
+        lost = len(set(titles) - set(counts))
+        print(f"Killed {kills} times, lost half the output, then resumed: {len(written):,} lines, "
+              f"{duplicates} duplicated, {lost} lost")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resumable bulk Wikipedia scrape")
+    commands = parser.add_subparsers(dest='command')
+    run_parser = commands.add_parser('run', help="scrape titles, resuming an earlier run")
+    run_parser.add_argument('titles', help="file of titles, one per line")
+    run_parser.add_argument('output', help="JSON lines output file; its log is OUTPUT.wal")
+    run_parser.add_argument('--store', metavar='DB', help="also save articles to this SQLite file")
+    run_parser.add_argument('--lang', default='en', help="Wikipedia language edition")
+    run_parser.add_argument('--simulate', type=float, metavar='SECONDS',
+                            help=argparse.SUPPRESS)
+    bench_parser = commands.add_parser('bench', help="measure log overhead and check crash recovery")
+    bench_parser.add_argument('--count', type=int, default=2000)
+    bench_parser.add_argument('--kills', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        run(args)
+    elif args.command == 'bench':
+        bench(args)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
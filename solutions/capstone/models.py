@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+# Data model for scraped Wikipedia articles
+# Small classes with __slots__ so bulk jobs holding hundreds of thousands of
+# results don't pay for a per-object __dict__. Everything is plain str/int,
+# so nothing keeps a BeautifulSoup tree alive after extraction.
+# Run this file to measure memory per retained article.
+
+import sys
+import tracemalloc
+
+
+# Category labels are shared by every fact, so keep a single copy of each
+def intern_category(category):
+    return sys.intern(str(category))
+
+
+class Paragraph:
+    __slots__ = ('position', 'text')
+
+    def __init__(self, position, text):
+        self.position = position
+        self.text = str(text)
+
+    def __repr__(self):
+        return f"Paragraph({self.position}, {self.text[:30]!r})"
+
+
+class Fact:
+    __slots__ = ('category', 'text', 'position')
+
+    # position is the offset in the article text where the fact was first
+    # matched, or None if it isn't known
+    def __init__(self, category, text, position=None):
+        self.category = intern_category(category)
+        self.text = str(text)
+        self.position = position
+
+    def __eq__(self, other):
+        return (isinstance(other, Fact)
+                and self.category == other.category and self.text == other.text)
+
+    def __hash__(self):
+        return hash((self.category, self.text))
+
+    def __repr__(self):
+        return f"Fact({self.category!r}, {self.text!r})"
+
+
+class Link:
+    __slots__ = ('title', 'href')
+
+    # Build from an anchor tag, copying the attributes out of the parse tree
+    @classmethod
+    def from_tag(cls, tag):
+        return cls(tag.get('title'), tag.get('href'))
+
+    def __init__(self, title, href):
+        self.title = None if title is None else str(title)
+        self.href = None if href is None else str(href)
+
+    def __repr__(self):
+        return f"Link({self.title!r}, {self.href!r})"
+
+
+class Article:
+    __slots__ = ('title', 'revision', 'paragraphs', 'facts', 'disambiguation')
+
+    # paragraphs is an iterable of paragraph strings
+    # facts is a dictionary of category -> values as returned by extract_key_facts,
+    # or of category -> {value: position} as returned by stream_key_facts
+    def __init__(self, title, revision, paragraphs, facts=None, disambiguation=False):
+        self.title = str(title)
+        self.revision = revision
+        self.paragraphs = tuple(Paragraph(i, p) for i, p in enumerate(paragraphs))
+        self.facts = tuple(
+            Fact(category, value, values[value] if isinstance(values, dict) else None)
+            for category, values in (facts or {}).items() for value in values
+        )
+        self.disambiguation = disambiguation
+
+    # Paragraph texts in article order
+    def texts(self):
+        return [p.text for p in self.paragraphs]
+
+    # Facts regrouped into the category -> {value: position} form used for
+    # display, each category's values in the order they were found
+    def facts_by_category(self):
+        grouped = {}
+        for fact in self.facts:
+            grouped.setdefault(fact.category, {}).setdefault(fact.text, fact.position)
+        return grouped
+
+    def __repr__(self):
+        return f"Article({self.title!r}, revision={self.revision})"
+
+
+# Measure memory retained per article when results are kept in loose tuples,
+# dicts of sets and soup Tags, compared to this data model
+def measure_memory(count=2000):
+    from bs4 import BeautifulSoup
+
+    paragraph = "The sheep is a domesticated mammal first farmed in Paris, France in 1991. " * 6
+    html = (
+        "<html><head><title>Sheep - Wikipedia</title></head><body>"
+        "<div id='mw-content-text'>" + f"<p>{paragraph}</p>" * 8 +
+        "<ul>" + "".join(f"<li><a href='/wiki/Sheep_{i}' title='Sheep {i}'>Sheep {i}</a></li>"
+                         for i in range(10)) +
+        "</ul></div></body></html>"
+    )
+    facts = {
+        'Dates': {'1991', 'March 15, 1991'},
+        'Locations': {'Paris, France', 'Paris'},
+        'Measurements': {'300 kilometres'},
+    }
+
+    def loose(i):
+        soup = BeautifulSoup(html, 'html.parser')
+        content = soup.find('div', id='mw-content-text')
+        page = (f"Sheep {i}", [p.text.strip() for p in content.find_all('p')])
+        links = content.select('li a')
+        return (page, {k: set(v) for k, v in facts.items()}, links)
+
+    def compact(i):
+        soup = BeautifulSoup(html, 'html.parser')
+        content = soup.find('div', id='mw-content-text')
+        article = Article(f"Sheep {i}", i, [p.text.strip() for p in content.find_all('p')], facts)
+        links = [Link.from_tag(a) for a in content.select('li a')]
+        soup.decompose()
+        return (article, links)
+
+    results = {}
+    for name, build in (('tuples, sets and Tags', loose), ('slotted model', compact)):
+        tracemalloc.start()
+        kept = [build(i) for i in range(count)]
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[name] = current / count
+        del kept
+    return results
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print(f"Memory retained per article over {count:,} articles:")
+    for name, per_article in measure_memory(count).items():
+        print(f"\t{name:25} {per_article:>10,.0f} bytes")
+
+
+if __name__ == "__main__":
+    main()
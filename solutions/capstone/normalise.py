@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+# Streaming text normaliser
+# Applies the cleaning steps from examples/03_regex_formatting.py ex3_2 to
+# text of any size with constant memory:
+#   1. collapse runs of whitespace to a single space
+#   2. strip whitespace from the start and end
+#   3. replace underscores with spaces
+# Each chunk is split on whitespace runs and rejoined (collapsing and
+# stripping in one C-level pass), then run through a translate table for the
+# underscores, instead of a separate re.sub per step over the whole text.
+#
+#   normalise_file("dump.txt", "clean.txt")
+#
+# Run this file to compare throughput with the multi-pass version.
+
+import os
+import re
+import sys
+import tempfile
+import time
+
+CHUNK_SIZE = 1 << 20
+
+UNDERSCORES = str.maketrans('_', ' ')
+
+
+# The ex3_2 steps, one pass each over the whole text
+def normalise_text_multipass(text):
+    cleaned = re.sub(r'\s+', ' ', text)
+    cleaned = cleaned.strip()
+    return re.sub(r'_', ' ', cleaned)
+
+
+# Normalise a whole string in one go
+def normalise_text(text):
+    return ''.join(normalise_chunks([text]))
+
+
+# Normalise a stream of text chunks, yielding cleaned chunks
+# A whitespace run split across chunks still becomes a single space: trailing
+# whitespace is held back until the next chunk shows whether more text follows,
+# so the final chunk's trailing whitespace is dropped like strip() would.
+def normalise_chunks(chunks):
+    started = False
+    pending_space = False
+    for chunk in chunks:
+        # str.split() splits on the same whitespace as \s+ and drops the ends
+        words = chunk.split()
+        if not words:
+            pending_space = pending_space or bool(chunk)
+            continue
+        if started and (pending_space or chunk[0].isspace()):
+            yield ' '
+        yield ' '.join(words).translate(UNDERSCORES)
+        started = True
+        pending_space = chunk[-1].isspace()
+
+
+# Yield fixed size chunks read from an open text file
+def read_chunks(f, chunk_size=CHUNK_SIZE):
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+# Normalise the file at src into dst, reading chunk_size characters at a time
+# Returns the number of characters written
+def normalise_file(src, dst, chunk_size=CHUNK_SIZE, encoding='utf-8'):
+    written = 0
+    with open(src, encoding=encoding, newline='') as fin, \
+            open(dst, 'w', encoding=encoding, newline='') as fout:
+        for cleaned in normalise_chunks(read_chunks(fin, chunk_size)):
+            fout.write(cleaned)
+            written += len(cleaned)
+    return written
+
+
+# Write a messy sample file of roughly size_mb megabytes
+def write_sample(path, size_mb):
+    line = "  Too   many    spaces \tremove_underscores_from_text\r\nMixed\nLine\nBreaks\rHere   "
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        for _ in range(size_mb * (1 << 20) // len(line)):
+            f.write(line)
+
+
+def main():
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    with tempfile.TemporaryDirectory() as tmp:
+        src = os.path.join(tmp, 'messy.txt')
+        dst = os.path.join(tmp, 'clean.txt')
+        write_sample(src, size_mb)
+        print(f"Normalising {size_mb} MB of text")
+
+        start = time.perf_counter()
+        with open(src, encoding='utf-8', newline='') as f:
+            expected = normalise_text_multipass(f.read())
+        multipass = time.perf_counter() - start
+
+        start = time.perf_counter()
+        normalise_file(src, dst)
+        streaming = time.perf_counter() - start
+
+        with open(dst, encoding='utf-8', newline='') as f:
+            matches = f.read() == expected
+        del expected
+
+    print(f"\tmulti-pass (whole file in memory): {size_mb / multipass:8.1f} MB/s")
+    print(f"\tstreaming ({CHUNK_SIZE >> 10} KB chunks):        {size_mb / streaming:8.1f} MB/s")
+    print(f"\tsame output: {matches}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+
+# Extraction patterns shared by the Wikipedia Scraper and its batch tools
+#
+# Several of the original patterns nest quantifiers, e.g. (?:\d+[,\.\s]?)+
+# A long run of digits can be split between the inner and outer + in
+# exponentially many ways, and when the rest of the pattern then fails the
+# regex engine tries every one of them. The rewrites below match the same text
+# but only ever have one way to split a run:
+#   (?:\d+[,\.\s]?)+   becomes   \d+(?:[,\.\s]\d+)*[,\.\s]?
+# Patterns that must be followed by something (a unit, a currency word) also
+# refuse to start in the middle of a run of digits, since a match starting
+# there would have been found from the start of the run anyway.
+#
+# Python's re has no timeout, so findall() checks a time budget between
+# matches. With linear patterns no single match can take long, so this bounds
+# the time spent on untrusted text.
+#
+# Run this file to check the rewrites against the original patterns on the
+# fixtures and random inputs, and to benchmark worst-case match times.
+
+import random
+import re
+import sys
+import time
+
+MONTH_NAMES = 'January|February|March|April|May|June|July|August|September|October|November|December'
+
+DATE_PATTERNS = [
+    # March 15, 2024
+    re.compile(rf'(?:{MONTH_NAMES})\s+\d{{1,2}},?\s+\d{{4}}', re.IGNORECASE),
+    # 15 March 2024
+    re.compile(rf'\d{{1,2}}\s+(?:{MONTH_NAMES})\s+\d{{4}}', re.IGNORECASE),
+    # 1991 or 1991-2024
+    re.compile(r'\d{4}(?:[-–]\d{4})?', re.IGNORECASE),
+    # 03/15/24 or 03/15/2024
+    re.compile(r'\d{1,2}/\d{1,2}/\d{2,4}', re.IGNORECASE),
+    # born 1991, founded in 2001
+    re.compile(r'(?:born|died|founded|established|created|released)\s+(?:in\s+)?\d{4}', re.IGNORECASE),
+]
+
+MONEY_PATTERNS = [
+    # $1,234.56
+    re.compile(r'([$£€¥]\d+(?:[,\.\s]\d+)*[,\.\s]?)', re.IGNORECASE),
+    # 1 000 000 dollars
+    re.compile(r'((?<!\d)(?<!\d[,\.\s])\d+(?:[,\.\s]\d+)*[,\.\s]?)\s*((?:dollar|pound|euro|yen)s?)',
+               re.IGNORECASE),
+]
+
+MEASUREMENT_PATTERNS = [
+    # Distances
+    re.compile(r'(?<!\d)\d+(?:,\d{3})*\s*(?:metres?|feet|kilometers?|kilometres?|miles?|inches?|cm|mm|km)', re.IGNORECASE),
+    # Weights
+    re.compile(r'(?<!\d)\d+(?:,\d{3})*\s*(?:kg|kilograms?|pounds?|lbs?|tonnes?|tons?)', re.IGNORECASE),
+    # People
+    re.compile(r'(?<!\d)\d+(?:,\d{3})*\s*(?:people|inhabitants|residents|population|students|members|employees)', re.IGNORECASE),
+    # Large numbers with units
+    re.compile(r'(?<!\d)\d+(?:\.\d+)?\s*(?:million|billion|thousand|hundred)\s*(?:people|square|years?|acres?|cm|mm|m|km)', re.IGNORECASE),
+    # Area
+    re.compile(r'(?<!\d)\d+(?:\.\d+)?\s*(?:square\s+)?(?:kilometres?|kilometers?|miles?|acres?)', re.IGNORECASE),
+]
+
+QUOTE_PATTERNS = [
+    re.compile(r'\s"([^"]{10,120})"\s'),
+    re.compile(r"\s'([^']{10,120})'\s"),
+    re.compile(r'\s“([^“]{10,120})”\s'),
+]
+
+LOCATION_PATTERNS = [
+    # "in Paris, France"
+    re.compile(r'\bin\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*),\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)'),
+    # "in|at England"
+    re.compile(r'\b(?:in|at)\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)'),
+]
+
+# Prices from examples/03_regex_formatting.py ex3_3
+# Groups: (amount with optional symbol, currency word)
+PRICE_PATTERN = re.compile(r'([$£€]?\d+(?:[,\.\s]\d+)*[,\.\s]?)((?:dollar|pound|euro)s?)?', re.IGNORECASE)
+
+# Phone numbers from examples/03_regex_formatting.py ex3_4
+# Groups: (whole number, leading part e.g. "(+61)", last block e.g. " 678")
+# The lookaheads decide where the leading part ends and which block is last
+# without trying every split of the digits.
+PHONE_PATTERN = re.compile(
+    r'((\(?\+?\d+\)?(?=[-\s]?\d))?'
+    r'(?:[-\s]?\d+(?=[-\s]\d))?'
+    r'(?:[-\s]\d+(?=[-\s]\d))*'
+    r'([-\s]?\d+))'
+)
+
+# The original patterns, kept to check the rewrites against and to benchmark
+LEGACY_PATTERNS = {
+    'money symbol': (re.compile(r'([$£€¥](?:\d+[,\.\s]?)+)', re.IGNORECASE), MONEY_PATTERNS[0]),
+    'money words': (re.compile(r'((?:\d+[,\.\s]?)+)\s*((?:dollar|pound|euro|yen)s?)', re.IGNORECASE), MONEY_PATTERNS[1]),
+    'distance': (re.compile(r'\d+(?:,\d{3})*\s*(?:metres?|feet|kilometers?|kilometres?|miles?|inches?|cm|mm|km)', re.IGNORECASE), MEASUREMENT_PATTERNS[0]),
+    'price': (re.compile(r'([$£€]?(?:\d+[,\.\s]?)+)((?:dollar|pound|euro)s?)?', re.IGNORECASE), PRICE_PATTERN),
+    'phone': (re.compile(r'((\(?\+?\d+\)?)?([-\s]?\d+)+)'), PHONE_PATTERN),
+}
+
+FIXTURES = [
+    # examples/03_regex_formatting.py ex3_3
+    "$19.99",
+    "1 000 000 DOLLARS!",
+    "Price: $1,234.56 each",
+    "Cost AUD $99.00 (inc tax)",
+    "€25.50 or $35.00 USD",
+    "Special offer: was $199, now $149.99!",
+    "Free shipping on orders over £50.00",
+    # examples/03_regex_formatting.py ex3_4
+    "555-123-4567",
+    "(02) 5550 1234",
+    "my number is +61 412 345 678",
+    "(+61) 412 345 678 call now!",
+    "call me at 0400 123 456 please",
+    "not-a-phone",
+    # Article text
+    "It was first domesticated in Paris, France on March 15, 1991 and costs $1,234.56 each, "
+    "about 300 kilometres from 1,500 people.",
+    "In 1800 there were 10 million sheep in England, worth 5 dollars each, 12,34 km away.",
+    "The 2019 budget was ¥ 3 500 yen, €1.234.567 and 45 kg or 1,000,000 pounds.",
+]
+
+
+class PatternTimeout(Exception):
+    # partial holds the matches found before the budget ran out
+    def __init__(self, pattern, partial):
+        super().__init__(f"time budget exceeded matching {pattern.pattern[:40]!r}")
+        self.partial = partial
+
+
+# re.findall with a time budget in seconds, checked between matches
+# Raises PatternTimeout (with the matches so far) if the budget runs out
+def findall(pattern, text, budget=None):
+    if budget is None:
+        return pattern.findall(text)
+
+    deadline = time.perf_counter() + budget
+    matches = []
+    for match in pattern.finditer(text):
+        if pattern.groups == 0:
+            matches.append(match.group(0))
+        elif pattern.groups == 1:
+            matches.append(match.group(1))
+        else:
+            matches.append(match.groups())
+        if time.perf_counter() > deadline:
+            raise PatternTimeout(pattern, matches)
+    return matches
+
+
+# Check that each rewrite finds the same matches as the original pattern
+# Returns list of (name, text) pairs that differ
+def compare_with_legacy(texts):
+    differences = []
+    for name, (legacy, rewrite) in LEGACY_PATTERNS.items():
+        for text in texts:
+            if legacy.findall(text) != rewrite.findall(text):
+                differences.append((name, text))
+    return differences
+
+
+# Short random strings built from the pieces the patterns care about
+def random_texts(count, seed=0):
+    rng = random.Random(seed)
+    pieces = list("0123456789 ,.-()+$£€x") + ['dollars', 'euro', 'km', ' kilometres', '1,000']
+    return [''.join(rng.choice(pieces) for _ in range(rng.randint(1, 12))) for _ in range(count)]
+
+
+# Inputs that make nested quantifiers backtrack: long digit runs that
+# almost, but don't quite, match
+def adversarial_texts(size):
+    return {
+        'digits': '1' * size + 'x',
+        'spaced digits': '1 ' * size + 'x',
+        'symbol digits': '$' + '1' * size + '!',
+        'phone digits': '(+' + '1' * size + '(',
+    }
+
+
+# Worst time over the adversarial inputs of one size
+def worst_time(pattern, size):
+    worst = 0
+    for text in adversarial_texts(size).values():
+        start = time.perf_counter()
+        pattern.findall(text)
+        worst = max(worst, time.perf_counter() - start)
+    return worst
+
+
+# Grow the adversarial inputs until a pattern takes longer than limit seconds
+# or the size reaches max_size. Returns list of (size, seconds).
+def benchmark_pattern(pattern, limit=0.5, max_size=100_000):
+    results = []
+    size = 8
+    while size <= max_size:
+        elapsed = worst_time(pattern, size)
+        results.append((size, elapsed))
+        if elapsed > limit:
+            break
+        # Backtracking can double per extra digit, so only step gently on
+        # small inputs, where an exponential pattern shows itself
+        size = size + 2 if size < 40 else size * 2
+    return results
+
+
+def main():
+    texts = FIXTURES + random_texts(20000)
+    differences = compare_with_legacy(texts)
+    print(f"Compared rewrites with original patterns on {len(texts):,} inputs: "
+          f"{len(differences)} differences")
+    for name, text in differences[:10]:
+        print(f"\t{name}: {text!r}")
+    print()
+
+    limit = float(sys.argv[1]) if len(sys.argv) > 1 else 0.5
+    print(f"Worst-case match time on adversarial input (stops growing past {limit}s):")
+    for name, (legacy, rewrite) in LEGACY_PATTERNS.items():
+        for label, pattern in (('original', legacy), ('rewrite', rewrite)):
+            size, elapsed = benchmark_pattern(pattern, limit)[-1]
+            print(f"\t{name:12} {label:8} {size:>8,} chars  {elapsed * 1000:>10.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+
+# Streaming scrape pipeline
+# Bulk scraping built from stages joined by bounded queues:
+#   titles -> fetch -> parse -> extract -> sink
+# Each stage runs its function on its own worker threads. When a queue is full
+# the stage feeding it waits, so a slow sink slows parsing, which slows fetching,
+# instead of pages piling up in memory. On top of the queue limits, a memory
+# budget caps the total size of the items waiting in or being worked on by all
+# stages together, so a few huge pages can't add up to a huge buffer either.
+# A worker passes its input's share of the budget on to what it outputs, and
+# waits only for any extra; waits further down the pipeline are served first,
+# since only moving items along frees budget.
+#
+#   pipeline = Pipeline(scrape_stages(scraper), memory_budget=64 << 20)
+#   for article in pipeline.stream(titles):
+#       ...
+#   pipeline.print_stats()
+#
+# Run this file to scrape a simulated Wikipedia into a deliberately slow sink.
+
+import collections
+import queue
+import sys
+import threading
+import time
+
+# Marks the end of the stream in a queue
+DONE = object()
+
+
+class MemoryBudget:
+    # limit is in bytes, or None for no limit
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.used = 0
+        self.peak = 0
+        # Bytes held and acquires waiting by position: 0 is the queue into the
+        # first stage, and each stage's output is one position further on
+        self.held = collections.Counter()
+        self.waiting = collections.Counter()
+        self.condition = threading.Condition()
+
+    # Wait until size bytes fit in the budget, then hold them at position
+    # holding is whether the caller holds an input it's working on. If nothing
+    # at or past position holds any budget, no wait would ever end, so it goes
+    # over the budget instead. An item bigger than the whole budget is let
+    # through once nothing else is held.
+    def acquire(self, size, stopped, position=0, holding=False):
+        with self.condition:
+            self.waiting[position] += 1
+            while not stopped.is_set():
+                later = [p for p in self.held if p >= position] + [p for p in self.waiting if p > position]
+                fits = (self.limit is None or not self.used or self.used + size <= self.limit)
+                if fits and not any(self.waiting[p] for p in later if p > position):
+                    break
+                if holding and not any(self.held[p] for p in later):
+                    break
+                self.condition.wait(0.1)
+            self.waiting[position] -= 1
+            self.used += size
+            self.held[position] += size
+            self.peak = max(self.peak, self.used)
+            self.condition.notify_all()
+
+    # Move size bytes held at one position to another
+    def transfer(self, size, source, target):
+        with self.condition:
+            self.held[source] -= size
+            self.held[target] += size
+
+    def release(self, size, position=0):
+        with self.condition:
+            self.used -= size
+            self.held[position] -= size
+            self.condition.notify_all()
+
+
+class Stage:
+    QUEUE_SIZE = 8
+
+    # function takes one item and returns the item for the next stage, or None
+    # to drop it. With many=True it returns an iterable of items instead.
+    # sizeof estimates an output item's size in bytes for the memory budget.
+    def __init__(self, name, function, workers=1, queue_size=QUEUE_SIZE,
+                 sizeof=None, many=False):
+        self.name = name
+        self.function = function
+        self.workers = workers
+        self.queue_size = queue_size
+        self.sizeof = sizeof or default_sizeof
+        self.many = many
+        # Stats
+        self.processed = 0
+        self.busy = 0.0
+        self.blocked = 0.0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+
+def default_sizeof(item):
+    if isinstance(item, (str, bytes)):
+        return len(item)
+    return sys.getsizeof(item)
+
+
+class Pipeline:
+    # memory_budget is in bytes, or None to rely on the queue sizes alone
+    def __init__(self, stages, memory_budget=None):
+        self.stages = stages
+        self.budget = MemoryBudget(memory_budget)
+        self.errors = []
+        self.stopped = threading.Event()
+
+
+    def _put(self, q, entry):
+        while not self.stopped.is_set():
+            try:
+                q.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+
+    def _get(self, q):
+        while not self.stopped.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return DONE
+
+
+    # Put a stage's output on its queue, at position, once it fits in the memory budget
+    # held is how much of the worker's input budget is left to pass on, None for the source
+    # Returns what's left of held, or None if the pipeline was stopped
+    def _emit(self, stage, q, item, position, held=None):
+        size = stage.sizeof(item)
+        start = time.perf_counter()
+        reused = min(held or 0, size)
+        # The input's share stays where it is while waiting, so it doesn't look
+        # like budget that moving items along could free
+        if size > reused:
+            self.budget.acquire(size - reused, self.stopped, position, holding=held is not None)
+        if reused:
+            self.budget.transfer(reused, position - 1, position)
+        sent = self._put(q, (item, size))
+        with stage.lock:
+            stage.blocked += time.perf_counter() - start
+        if not sent:
+            return None
+        return (held or 0) - reused
+
+
+    def _feed(self, source, out):
+        feeder = Stage('source', None)
+        try:
+            for item in source:
+                if self._emit(feeder, out, item, 0) is None:
+                    return
+        except Exception as e:
+            self.errors.append(('source', None, e))
+        self._put(out, DONE)
+
+
+    # One worker thread of a stage; the last worker to finish passes DONE on
+    # position is that of the stage's inbox in the memory budget
+    def _work(self, stage, inbox, out, finished, position):
+        while True:
+            entry = self._get(inbox)
+            if entry is DONE:
+                # Let this stage's other workers see the end too
+                self._put(inbox, DONE)
+                break
+            item, size = entry
+            start = time.perf_counter()
+            try:
+                result = stage.function(item)
+                if result is None:
+                    results = []
+                elif stage.many:
+                    results = list(result)
+                else:
+                    results = [result]
+            except Exception as e:
+                results = []
+                with stage.lock:
+                    stage.errors += 1
+                self.errors.append((stage.name, item, e))
+            with stage.lock:
+                stage.processed += 1
+                stage.busy += time.perf_counter() - start
+            # The input's budget goes to the results, and what they don't need is freed
+            held = size
+            for result in results:
+                held = self._emit(stage, out, result, position + 1, held)
+                if held is None:
+                    return
+            if held:
+                self.budget.release(held, position)
+
+        with finished[1]:
+            finished[0] -= 1
+            last = finished[0] == 0
+        if last:
+            self._put(out, DONE)
+
+
+    # Run the pipeline over source, yielding the last stage's items as they come
+    # Stopping early (e.g. break) stops every stage
+    def stream(self, source):
+        self.stopped = threading.Event()
+        queues = [queue.Queue(stage.queue_size) for stage in self.stages]
+        queues.append(queue.Queue(self.stages[-1].queue_size if self.stages else Stage.QUEUE_SIZE))
+        threads = [threading.Thread(target=self._feed, args=(source, queues[0]), daemon=True,
+                                    name='source')]
+        for i, stage in enumerate(self.stages):
+            finished = [stage.workers, threading.Lock()]
+            for n in range(stage.workers):
+                threads.append(threading.Thread(target=self._work, daemon=True, name=f"{stage.name}-{n}",
+                                                args=(stage, queues[i], queues[i + 1], finished, i)))
+        self.started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                entry = self._get(queues[-1])
+                if entry is DONE:
+                    break
+                item, size = entry
+                # The caller holds the item until it asks for the next one
+                yield item
+                self.budget.release(size, len(self.stages))
+        finally:
+            self.stopped.set()
+            for thread in threads:
+                thread.join()
+            self.elapsed = time.perf_counter() - self.started
+
+
+    # Pass every output item to sink; returns the number of items
+    def run(self, source, sink):
+        count = 0
+        for item in self.stream(source):
+            sink(item)
+            count += 1
+        return count
+
+
+    def print_stats(self):
+        print(f"{'stage':10} {'workers':>7} {'items':>7} {'busy':>8} {'waiting':>8} {'errors':>6}")
+        for stage in self.stages:
+            print(f"{stage.name:10} {stage.workers:>7} {stage.processed:>7} "
+                  f"{stage.busy:>7.2f}s {stage.blocked:>7.2f}s {stage.errors:>6}")
+        limit = self.budget.limit
+        print(f"Peak memory held: {self.budget.peak / 1024:,.0f} KB"
+              + (f" of {limit / 1024:,.0f} KB budget" if limit else ""))
+
+
+# Fetch, parse and extract stages built on WikipediaScraper
+# Articles come out of the pipeline; saving them (e.g. to scraper.store, whose
+# SQLite connection belongs to one thread) is left to the caller's sink
+def scrape_stages(scraper, fetch_workers=8, parse_workers=2, extract_workers=1):
+    def fetch(title):
+        response = scraper.get_response(scraper.site.page_url(scraper.form_query(title)))
+        return (title, response.text) if response else None
+
+    def parse(item):
+        query, page_html = item
+        title, body = scraper.extract_page_paragraphs(page_html)
+        title = scraper.extract_page_title(page_html, title)
+        return {
+            'query': query,
+            'title': title,
+            'revision': scraper.extract_revision_id(page_html),
+            'disambiguation': scraper.is_disambiguation_page(page_html),
+            'paragraphs': body,
+        }
+
+    def extract(page):
+        from models import Article
+        if page['disambiguation']:
+            return Article(page['title'], page['revision'], page['paragraphs'], disambiguation=True)
+        facts = scraper.stream_key_facts(page['paragraphs'])
+        return Article(page['title'], page['revision'], page['paragraphs'], facts)
+
+    def page_size(item):
+        return len(item[1])
+
+    def paragraphs_size(page):
+        return sum(len(p) for p in page['paragraphs'])
+
+    def article_size(article):
+        return sum(len(p.text) for p in article.paragraphs) + sum(len(f.text) for f in article.facts)
+
+    return [
+        Stage('fetch', fetch, fetch_workers, sizeof=page_size),
+        Stage('parse', parse, parse_workers, sizeof=paragraphs_size),
+        Stage('extract', extract, extract_workers, sizeof=article_size),
+    ]
+
+
+def main():
+    from service import SimulatedWikipedia
+    from sites import FetchScheduler, WikipediaSite
+    from wikipedia_scraper import WikipediaScraper
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    scheduler = FetchScheduler(workers=8, opener=SimulatedWikipedia(0.05))
+    site = WikipediaSite(scheduler)
+    scheduler.configure(site.host, concurrency=8)
+    scraper = WikipediaScraper(site=site)
+
+    titles = (f"Topic {i}" for i in range(count))
+    pipeline = Pipeline(scrape_stages(scraper), memory_budget=16 << 10)
+
+    # A sink that takes 10ms per article, slower than fetching
+    def slow_sink(article):
+        time.sleep(0.01)
+
+    print(f"Scraping {count} simulated pages into a sink taking 10ms each")
+    done = pipeline.run(titles, slow_sink)
+    print(f"{done} articles in {pipeline.elapsed:.2f}s")
+    pipeline.print_stats()
+    scheduler.close()
+
+
+if __name__ == "__main__":
+    main()
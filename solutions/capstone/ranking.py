@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+
+# Top-k ranking of extracted facts
+# Only the best FACT_LIMIT facts of each category are shown, so sorting every
+# fact found is wasted work on articles (or corpora) with thousands of them.
+# FactRanker keeps a bounded min-heap of the best facts per category as they
+# stream out of extraction: a new fact replaces the worst kept one if it
+# scores higher, at O(log k) a fact, O(n log k) overall and O(k) memory.
+#
+# Scorers rank facts by anything known about them. Each is called with a fact's
+# value, the position of its first match and its number of matches, and
+# returns a number or tuple; higher ranks first, and ties keep the earlier fact.
+#   by_length     longest first, the original display order
+#   by_position   earliest in the article first
+#   by_frequency  most often repeated first (needs every fact counted first,
+#                 so it keeps one entry per distinct fact instead of k)
+#   combined(by_frequency, by_length)   frequency, then length to break ties
+#
+#   ranker = FactRanker(4, by_position)
+#   for category, value, position in matches:
+#       ranker.add(category, value, position)
+#   ranker.ranked()   # {category: [best value, ...]}
+#
+# Run this file to compare it with sorting on a large set of facts.
+
+import heapq
+import sys
+import time
+
+
+def by_length(value, position, count):
+    return len(value)
+
+# Scorers that only look at the value can give it as a key function, so a
+# whole set can be ranked without calling the scorer for every fact
+by_length.value_key = len
+# A fact this long is a good one: extraction can stop looking for more of a
+# category once the ranker keeps enough facts scoring at least this
+by_length.enough = 15
+
+
+def by_position(value, position, count):
+    return -position
+
+# Facts are found in article order, so later ones never outscore those kept
+by_position.final = True
+
+
+def by_frequency(value, position, count):
+    return count
+
+by_frequency.needs_counts = True
+
+
+# Score by each scorer in turn, the later ones breaking ties
+def combined(*scorers):
+    def score(value, position, count):
+        return tuple(scorer(value, position, count) for scorer in scorers)
+    score.needs_counts = any(getattr(scorer, 'needs_counts', False) for scorer in scorers)
+    score.__name__ = '+'.join(scorer.__name__ for scorer in scorers)
+    return score
+
+
+SCORERS = {
+    'length': by_length,
+    'position': by_position,
+    'frequency': combined(by_frequency, by_length),
+}
+
+
+class TopK:
+    # The k highest scoring values pushed, ignoring repeats of a value kept
+    def __init__(self, k):
+        self.k = k
+        # (score, -arrival, value): the root is the lowest score, and the
+        # latest to arrive among equal scores, so ties keep the earlier value
+        self.heap = []
+        self.kept = set()
+        self.arrivals = 0
+
+
+    def push(self, score, value):
+        heap = self.heap
+        # Most facts don't beat the worst kept one; a tie loses to the earlier value
+        if len(heap) >= self.k and (not heap or score <= heap[0][0]):
+            return
+        if value in self.kept:
+            return
+        self.arrivals += 1
+        entry = (score, -self.arrivals, value)
+        if len(heap) < self.k:
+            heapq.heappush(heap, entry)
+        else:
+            self.kept.discard(heapq.heapreplace(heap, entry)[2])
+        self.kept.add(value)
+
+
+    def full(self):
+        return len(self.heap) >= self.k
+
+
+    # Lowest score kept, which a value must beat once full
+    def threshold(self):
+        return self.heap[0][0] if self.heap else None
+
+
+    # Kept values, best first
+    def values(self):
+        return [value for _, _, value in sorted(self.heap, reverse=True)]
+
+
+    def __len__(self):
+        return len(self.heap)
+
+
+class FactRanker:
+    # limit is the number of facts kept per category
+    # scorer is one of the scorers above, or any function of (value, position, count)
+    def __init__(self, limit, scorer=by_length):
+        self.limit = limit
+        self.scorer = scorer
+        self.counting = getattr(scorer, 'needs_counts', False)
+        # category -> TopK, or category -> {value: [position, count]} for counting scorers
+        self.top = {}
+        self.seen = {}
+        self.position = 0
+
+
+    # Offer one extracted fact; position defaults to the order facts are added
+    def add(self, category, value, position=None):
+        if position is None:
+            position = self.position
+        self.position = position + 1
+        if self.counting:
+            seen = self.seen.setdefault(category, {})
+            if value in seen:
+                seen[value][1] += 1
+            else:
+                seen[value] = [position, 1]
+            return
+        top = self.top.get(category)
+        if top is None:
+            top = self.top[category] = TopK(self.limit)
+        top.push(self.scorer(value, position, 1), value)
+
+
+    # Offer a dictionary of category -> values, as returned by extract_key_facts,
+    # or of category -> {value: position}
+    def update(self, facts):
+        for category, values in facts.items():
+            for value, position in positioned(values):
+                self.add(category, value, position)
+        return self
+
+
+    # Whether a category already holds limit facts
+    def full(self, category):
+        return category in self.top and self.top[category].full()
+
+
+    # Whether extraction can stop looking for a category: it is full, and
+    # either nothing found later can displace its facts (a final scorer such as
+    # by_position) or every kept fact scores at least the scorer's enough.
+    # Counting scorers need every fact, so are never satisfied.
+    def satisfied(self, category):
+        if not self.full(category):
+            return False
+        if getattr(self.scorer, 'final', False):
+            return True
+        enough = getattr(self.scorer, 'enough', None)
+        return enough is not None and self.top[category].threshold() >= enough
+
+
+    # Best values of each category that has any, best first
+    def ranked(self):
+        if self.counting:
+            ranked = {}
+            for category, seen in self.seen.items():
+                # Earlier facts win ties, as in TopK
+                best = heapq.nlargest(self.limit, seen.items(),
+                                      key=lambda item: (self.scorer(item[0], *item[1]), -item[1][0]))
+                ranked[category] = [value for value, _ in best]
+            return ranked
+        return {category: top.values() for category, top in self.top.items() if top}
+
+
+# (value, position) pairs of one category's values. A {value: position}
+# dictionary gives the positions, otherwise (or where it has None) a fact's
+# position is its place in the values.
+def positioned(values):
+    if isinstance(values, dict):
+        return [(value, i if position is None else position)
+                for i, (value, position) in enumerate(values.items())]
+    return [(value, i) for i, value in enumerate(values)]
+
+
+# Best limit values of each category of a category -> values dictionary
+def top_facts(facts, limit, scorer=by_length):
+    if getattr(scorer, 'needs_counts', False):
+        return FactRanker(limit, scorer).update(facts).ranked()
+    key = getattr(scorer, 'value_key', None)
+    ranked = {}
+    for category, values in facts.items():
+        if key:
+            best = heapq.nlargest(limit, values, key=key)
+        else:
+            best = [value for value, _ in heapq.nlargest(
+                limit, positioned(values), key=lambda item: scorer(item[0], item[1], 1))]
+        if best:
+            ranked[category] = best
+    return ranked
+
+
+def main():
+    import random
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    k = 4
+    rng = random.Random(0)
+    values = {f"{rng.randint(1, 10 ** rng.randint(1, 9)):,} km" for _ in range(count)}
+    print(f"Top {k} of {len(values):,} facts:")
+
+    start = time.perf_counter()
+    expected = sorted(list(values), key=lambda x: len(x), reverse=True)[:k]
+    print(f"\tfull sort           {time.perf_counter() - start:6.3f}s")
+
+    for name, scorer in SCORERS.items():
+        start = time.perf_counter()
+        ranked = top_facts({'Measurements': values}, k, scorer)['Measurements']
+        print(f"\t{name:19} {time.perf_counter() - start:6.3f}s  {ranked}")
+        if scorer is by_length:
+            assert ranked == expected
+
+    # Facts offered one at a time, as extraction finds them
+    ranker = FactRanker(k, by_length)
+    start = time.perf_counter()
+    for position, value in enumerate(values):
+        ranker.add('Measurements', value, position)
+    print(f"\t{'length, streamed':19} {time.perf_counter() - start:6.3f}s  "
+          f"{ranker.ranked()['Measurements']}")
+
+
+if __name__ == "__main__":
+    main()
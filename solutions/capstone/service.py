@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+
+# Local Wikipedia facts service
+# A long-running process that answers JSON requests with the WikipediaScraper
+# extraction logic, so tools share one warm cache instead of each starting a
+# scraper of their own:
+#   GET /search?q=sheep     -> {"query": ..., "results": [titles]}
+#   GET /page?title=Sheep   -> {"title", "revision", "intro", "disambiguation", "options"}
+#   GET /facts?title=Sheep  -> {"title", "revision", "facts": {category: [values]}}
+#
+# The server runs on asyncio. Fetching and parsing are blocking, so they run on
+# a thread pool. Results are kept in LRU caches shared by every client, and
+# concurrent requests for a title that isn't cached yet wait on the one
+# upstream fetch already in flight rather than starting their own.
+#
+#   python3 service.py serve --port 8080
+#   curl 'localhost:8080/facts?title=Sheep'
+#
+# `python3 service.py bench` runs the built-in load generator against a service
+# backed by a simulated Wikipedia and reports p50/p99 latency and RPS.
+
+import argparse
+import asyncio
+import collections
+import json
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+from sites import FetchScheduler, WikipediaSite
+from titles import TitleResolver
+from wikipedia_scraper import WikipediaScraper
+
+
+class NotFound(Exception):
+    pass
+
+
+# Wikipedia couldn't be reached, or answered with an error
+# status is the one to answer with: 503 for timeouts and connection
+# errors, which are worth retrying, 502 for bad responses
+class UpstreamError(Exception):
+    def __init__(self, message, status=502):
+        super().__init__(message)
+        self.status = status
+
+
+class LRUCache:
+    def __init__(self, size):
+        self.size = size
+        self.items = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if key in self.items:
+            self.items.move_to_end(key)
+            self.hits += 1
+            return self.items[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        self.items[key] = value
+        self.items.move_to_end(key)
+        while len(self.items) > self.size:
+            self.items.popitem(last=False)
+
+
+class FactService:
+    CACHE_SIZE = 2048
+    WORKERS = 8
+
+    # scraper is a WikipediaScraper used for its fetching and extraction.
+    # Its store (SQLite) can't be shared across threads, so pass one without.
+    def __init__(self, scraper, cache_size=CACHE_SIZE, workers=WORKERS):
+        self.scraper = scraper
+        self.articles = LRUCache(cache_size)
+        self.searches = LRUCache(cache_size)
+        self.executor = ThreadPoolExecutor(workers)
+        self.inflight = {}
+        self.upstream = 0
+        self.coalesced = 0
+
+
+    # Return the cached value for key, or run load on the thread pool
+    # Concurrent callers with the same key share one call of load
+    async def _cached(self, cache, key, load):
+        value = cache.get(key)
+        if value is not None:
+            return value
+        future = self.inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        self.upstream += 1
+        future = asyncio.get_running_loop().run_in_executor(self.executor, load)
+        self.inflight[key] = future
+        try:
+            value = await asyncio.shield(future)
+        finally:
+            del self.inflight[key]
+        cache.put(key, value)
+        return value
+
+
+    async def search(self, query):
+        query = ' '.join(query.split())
+        return await self._cached(self.searches, ('search', query.lower()),
+                                  lambda: self.scraper.get_search_results(query))
+
+
+    # Fetch and extract an article
+    # Returns (Article, list of disambiguation option titles)
+    async def article(self, title):
+        # Aliases the scraper's TitleResolver knows share the canonical entry
+        query = self.scraper.resolve_query(self.scraper.form_query(title))
+
+        def load():
+            import requests
+            try:
+                response = self.scraper.site.get(self.scraper.site.page_url(query))
+            except (requests.Timeout, requests.ConnectionError, TimeoutError, ConnectionError) as e:
+                raise UpstreamError(f"couldn't reach Wikipedia: {e}", 503)
+            if response.status_code == 404:
+                raise NotFound(title)
+            if response.status_code != 200:
+                status = 503 if response.status_code in (429, 503) else 502
+                raise UpstreamError(f"Wikipedia answered {response.status_code}", status)
+            article = self.scraper.extract_article(response.text, query)
+            options = []
+            if article.disambiguation:
+                links = self.scraper.extract_disambiguation_links(response.text)
+                options = [link.title for link in links if link.title]
+            return article, options
+
+        article, options = await self._cached(self.articles, ('page', query), load)
+        # Later requests by the canonical title share the entry
+        self.articles.put(('page', self.scraper.form_query(article.title)), (article, options))
+        return article, options
+
+
+    async def page(self, title):
+        article, options = await self.article(title)
+        texts = article.texts()
+        return {
+            'title': article.title,
+            'revision': article.revision,
+            'intro': texts[0] if texts and not article.disambiguation else None,
+            'disambiguation': article.disambiguation,
+            'options': options,
+        }
+
+
+    async def facts(self, title):
+        article, _ = await self.article(title)
+        return {
+            'title': article.title,
+            'revision': article.revision,
+            'facts': {category: sorted(values)
+                      for category, values in article.facts_by_category().items()},
+        }
+
+
+    def stats(self):
+        return {
+            'upstream_fetches': self.upstream,
+            'coalesced': self.coalesced,
+            'article_cache': {'size': len(self.articles.items), 'hits': self.articles.hits,
+                              'misses': self.articles.misses},
+            'search_cache': {'size': len(self.searches.items), 'hits': self.searches.hits,
+                             'misses': self.searches.misses},
+        }
+
+
+    # Route one request, returning (status, JSON-serialisable body)
+    async def route(self, target):
+        parts = urlsplit(target)
+        params = {k: v[0] for k, v in parse_qs(parts.query).items()}
+        try:
+            if parts.path == '/search' and 'q' in params:
+                return 200, {'query': params['q'], 'results': await self.search(params['q'])}
+            if parts.path == '/page' and 'title' in params:
+                return 200, await self.page(params['title'])
+            if parts.path == '/facts' and 'title' in params:
+                return 200, await self.facts(params['title'])
+            if parts.path == '/stats':
+                return 200, self.stats()
+        except NotFound as e:
+            return 404, {'error': f"no page for '{e}'"}
+        except UpstreamError as e:
+            return e.status, {'error': str(e)}
+        except Exception as e:
+            return 502, {'error': f"upstream failed: {e}"}
+        return 400, {'error': "use /search?q=, /page?title=, /facts?title= or /stats"}
+
+
+    # Serve HTTP/1.1 with keep-alive on one connection
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                keep_alive = True
+                while True:
+                    header = await reader.readline()
+                    if header in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = header.decode('latin-1').partition(':')
+                    if name.strip().lower() == 'connection' and value.strip().lower() == 'close':
+                        keep_alive = False
+
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                if method != 'GET':
+                    status, body = 405, {'error': "only GET is supported"}
+                else:
+                    status, body = await self.route(target)
+                payload = json.dumps(body).encode('utf-8')
+                writer.write(f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                             f"Content-Type: application/json\r\n"
+                             f"Content-Length: {len(payload)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                             .encode('latin-1') + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+    async def serve(self, host='127.0.0.1', port=8080):
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+
+# Load generator: concurrency clients on keep-alive connections send paths,
+# picked in order, until requests have been sent
+# Returns dictionary with latencies in seconds, elapsed time and error count
+async def load_test(host, port, paths, requests=2000, concurrency=50):
+    latencies = []
+    errors = 0
+    sent = 0
+
+    async def client():
+        nonlocal errors, sent
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            while sent < requests:
+                path = paths[sent % len(paths)]
+                sent += 1
+                start = time.perf_counter()
+                writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode('latin-1'))
+                status = int((await reader.readline()).split()[1])
+                length = 0
+                while True:
+                    header = await reader.readline()
+                    if header in (b'\r\n', b''):
+                        break
+                    if header.lower().startswith(b'content-length:'):
+                        length = int(header.split(b':')[1])
+                await reader.readexactly(length)
+                latencies.append(time.perf_counter() - start)
+                if status != 200:
+                    errors += 1
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return {'latencies': latencies, 'elapsed': time.perf_counter() - start, 'errors': errors}
+
+
+def print_load_report(result):
+    latencies = sorted(result['latencies'])
+    p50 = statistics.median(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"\t{len(latencies):,} requests in {result['elapsed']:.2f}s: "
+          f"{len(latencies) / result['elapsed']:,.0f} RPS, "
+          f"p50 {p50 * 1000:.1f}ms, p99 {p99 * 1000:.1f}ms, {result['errors']} errors")
+
+
+# A stand-in for Wikipedia that makes up an article for any title after a delay
+class SimulatedWikipedia:
+    def __init__(self, latency=0.2):
+        self.latency = latency
+
+    def __call__(self, scheduler, host, url, params, headers):
+        time.sleep(self.latency)
+        if params and params.get('action') == 'opensearch':
+            words = params['search'].title()
+            text = json.dumps([params['search'], [f"{words} {i}" for i in range(10)]])
+        else:
+            title = unquote(url.rsplit('/', 1)[-1]).replace('_', ' ')
+            text = (f'<html><head><title>{title} - Wikipedia</title>'
+                    f'<script>RLCONF={{"wgPageName":{json.dumps(title.replace(" ", "_"))},'
+                    f'"wgRevisionId":{abs(hash(title)) % 10**8}}};</script></head>'
+                    f'<body><div id="mw-content-text">'
+                    f'<p>{title} was founded in 1850 in Paris, France and costs $1,234.56 each.</p>'
+                    f'<p>It is 300 kilometres from 1,500 people and weighs 45 kg.</p>'
+                    f'<p>On March 15, 1991 it was sold for 5 million dollars.</p>'
+                    f'</div><div id="catlinks"><a href="/wiki/Category:Things">x</a></div></body></html>')
+        return SimpleNamespace(status_code=200, url=url, text=text, json=lambda: json.loads(text))
+
+
+def bench_paths(count, titles=50, seed=0):
+    # A few popular titles get most requests, like real traffic
+    rng = random.Random(seed)
+    names = [f"Topic {i}" for i in range(titles)]
+    weights = [1 / (i + 1) for i in range(titles)]
+    paths = []
+    for name in rng.choices(names, weights, k=count):
+        endpoint = rng.choice(['/page?title=', '/facts?title=', '/search?q='])
+        paths.append(endpoint + quote(name))
+    return paths
+
+
+async def bench(args):
+    scheduler = FetchScheduler(workers=16, opener=SimulatedWikipedia(args.latency))
+    site = WikipediaSite(scheduler)
+    scheduler.configure(site.host, concurrency=16)
+    service = FactService(WikipediaScraper(site=site))
+    server = await service.serve(port=0)
+    port = server.sockets[0].getsockname()[1]
+    paths = bench_paths(args.requests)
+
+    print(f"Load test: {args.requests:,} requests, {args.concurrency} clients, "
+          f"simulated upstream latency {args.latency * 1000:.0f}ms")
+    print("Cold cache:")
+    print_load_report(await load_test('127.0.0.1', port, paths, args.requests, args.concurrency))
+    print(f"\t{service.upstream} upstream fetches, {service.coalesced} requests "
+          f"joined a fetch already in flight")
+    print("Warm cache:")
+    print_load_report(await load_test('127.0.0.1', port, paths, args.requests, args.concurrency))
+    server.close()
+    await server.wait_closed()
+    scheduler.close()
+
+
+async def serve(args):
+    titles = TitleResolver(args.titles)
+    service = FactService(WikipediaScraper(site=WikipediaSite(lang=args.lang), titles=titles))
+    server = await service.serve(args.host, args.port)
+    print(f"Serving on http://{args.host}:{args.port}/ (search, page, facts, stats)")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        titles.save()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Wikipedia facts service")
+    commands = parser.add_subparsers(dest='command')
+    serve_parser = commands.add_parser('serve', help="run the service")
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8080)
+    serve_parser.add_argument('--lang', default='en', help="Wikipedia language edition")
+    serve_parser.add_argument('--titles', metavar='FILE',
+                              help="load and save title redirects in this JSON file")
+    bench_parser = commands.add_parser('bench', help="load test against a simulated Wikipedia")
+    bench_parser.add_argument('--requests', type=int, default=5000)
+    bench_parser.add_argument('--concurrency', type=int, default=50)
+    bench_parser.add_argument('--latency', type=float, default=0.2,
+                              help="simulated upstream seconds per request")
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'serve':
+            asyncio.run(serve(args))
+        elif args.command == 'bench':
+            asyncio.run(bench(args))
+        else:
+            parser.print_help()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
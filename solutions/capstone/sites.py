@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+
+# Site adapters sharing one fetch scheduler
+# Each Site knows one host: its URLs, how politely to treat it and how to read
+# its pages. Every site's requests go through a FetchScheduler, which keeps:
+#   - a connection pool (requests.Session) per host
+#   - a per-host limit on requests in flight and a minimum gap between them
+#   - a queue per host, served round robin, so a slow host only ever holds its
+#     own few slots and requests to other hosts keep moving
+#
+#   scheduler = FetchScheduler()
+#   wiki = WikipediaSite(scheduler)
+#   quotes = QuotesSite(scheduler)
+#   wiki.submit(wiki.page_url("Sheep")), quotes.submit(quotes.page_url(2))
+#
+# WikipediaScraper takes a WikipediaSite, so it can point at another language
+# or mirror and share the scheduler with other tools.
+#
+# Run this file to compare fair scheduling with a plain thread pool on
+# simulated hosts, one of them slow.
+
+import collections
+import json
+import threading
+import time
+from types import SimpleNamespace
+from urllib.parse import quote, unquote, urljoin, urlsplit
+
+
+class FetchCancelled(Exception):
+    pass
+
+
+# Download progress of one request, readable while it runs
+class Progress:
+    def __init__(self):
+        self.received = 0
+        self.submitted = time.monotonic()
+        self.started = None
+        self.cancelled = threading.Event()
+
+
+class HostState:
+    def __init__(self, concurrency, interval):
+        self.concurrency = concurrency
+        self.interval = interval
+        self.queue = collections.deque()
+        self.active = 0
+        self.next_start = 0.0
+        self.session = None
+
+
+class FetchScheduler:
+    WORKERS = 8
+    TIMEOUT = 10
+    # Bytes read at a time, and so how quickly a cancelled download stops
+    CHUNK_SIZE = 16 * 1024
+
+    # Politeness for hosts that haven't been configured
+    DEFAULT_CONCURRENCY = 2
+    DEFAULT_INTERVAL = 0.0
+
+    # opener(scheduler, host, url, params, headers) performs one request.
+    # The default sends it with the host's requests.Session.
+    def __init__(self, workers=WORKERS, opener=None):
+        self.opener = opener or FetchScheduler._http_get
+        self.hosts = {}
+        # Hosts with queued requests, in the order they get their next turn
+        self.ring = collections.deque()
+        self.condition = threading.Condition()
+        self.closed = False
+        self.workers = workers
+        self.threads = []
+        # Progress of the request each worker thread is running
+        self.local = threading.local()
+
+
+    # Set how many requests may be in flight to host and the minimum seconds
+    # between starting them
+    def configure(self, host, concurrency=DEFAULT_CONCURRENCY, interval=DEFAULT_INTERVAL):
+        with self.condition:
+            state = self._host(host)
+            state.concurrency = concurrency
+            state.interval = interval
+            self.condition.notify_all()
+
+
+    def _host(self, host):
+        if host not in self.hosts:
+            self.hosts[host] = HostState(self.DEFAULT_CONCURRENCY, self.DEFAULT_INTERVAL)
+        return self.hosts[host]
+
+
+    # Queue a GET request, returning a Future for the response
+    # The future's progress attribute tracks the download, see cancel()
+    def submit(self, url, params=None, headers=None):
+        # Imported here as it brings in logging, which startup doesn't need
+        from concurrent.futures import Future
+        future = Future()
+        future.progress = Progress()
+        host = urlsplit(url).netloc
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("scheduler is closed")
+            state = self._host(host)
+            if not state.queue and host not in self.ring:
+                self.ring.append(host)
+            state.queue.append((future, url, params, headers))
+            # Workers start with the first request, so unused schedulers cost nothing
+            if not self.threads:
+                self.threads = [threading.Thread(target=self._worker, daemon=True, name=f"fetch-{i}")
+                                for i in range(self.workers)]
+                for thread in self.threads:
+                    thread.start()
+            self.condition.notify()
+        return future
+
+
+    # GET and wait for the response
+    def get(self, url, params=None, headers=None):
+        return self.submit(url, params, headers).result()
+
+
+    # Abandon a request: a queued one never starts, and a running download stops
+    # at its next chunk, closing its connection, with FetchCancelled as its result
+    def cancel(self, future):
+        future.progress.cancelled.set()
+        future.cancel()
+
+
+    # Next request whose host has a free slot and has waited long enough
+    # Returns (host, request) or (None, seconds until a host may be ready)
+    def _next_request(self):
+        now = time.monotonic()
+        wait = None
+        for _ in range(len(self.ring)):
+            host = self.ring[0]
+            self.ring.rotate(-1)
+            state = self.hosts[host]
+            if state.active >= state.concurrency:
+                continue
+            if state.next_start > now:
+                delay = state.next_start - now
+                wait = delay if wait is None else min(wait, delay)
+                continue
+            request = state.queue.popleft()
+            if not state.queue:
+                self.ring.remove(host)
+            state.active += 1
+            state.next_start = now + state.interval
+            return host, request
+        return None, wait
+
+
+    def _worker(self):
+        while True:
+            with self.condition:
+                while True:
+                    if self.closed:
+                        return
+                    host, request = self._next_request()
+                    if host is not None:
+                        break
+                    self.condition.wait(request)
+            future, url, params, headers = request
+            if future.set_running_or_notify_cancel():
+                self.local.progress = future.progress
+                future.progress.started = time.monotonic()
+                try:
+                    future.set_result(self.opener(self, host, url, params, headers))
+                except Exception as e:
+                    future.set_exception(e)
+            with self.condition:
+                self.hosts[host].active -= 1
+                self.condition.notify_all()
+
+
+    def _http_get(self, host, url, params, headers):
+        with self.condition:
+            state = self.hosts[host]
+            if state.session is None:
+                import requests
+                state.session = requests.Session()
+                # Keep as many connections open as requests allowed in flight
+                adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=state.concurrency)
+                state.session.mount('https://', adapter)
+                state.session.mount('http://', adapter)
+            session = state.session
+
+        # Read the body in chunks so a cancelled download can stop partway
+        progress = self.local.progress
+        response = session.get(url, params=params, headers=headers, timeout=self.TIMEOUT, stream=True)
+        try:
+            chunks = []
+            for chunk in response.iter_content(self.CHUNK_SIZE):
+                if progress.cancelled.is_set():
+                    raise FetchCancelled(url)
+                chunks.append(chunk)
+                progress.received += len(chunk)
+            # Keep the body on the response, as if it had been read in one go
+            response._content = b''.join(chunks)
+        finally:
+            # Returns the connection to the pool, or drops it if unread
+            response.close()
+        return response
+
+
+    # Stop the workers; queued requests are cancelled
+    def close(self):
+        with self.condition:
+            self.closed = True
+            for state in self.hosts.values():
+                while state.queue:
+                    state.queue.popleft()[0].cancel()
+                if state.session is not None:
+                    state.session.close()
+            self.ring.clear()
+            self.condition.notify_all()
+
+
+_default_scheduler = None
+_default_lock = threading.Lock()
+
+
+# Scheduler shared by every site created without one
+def default_scheduler():
+    global _default_scheduler
+    with _default_lock:
+        if _default_scheduler is None:
+            _default_scheduler = FetchScheduler()
+        return _default_scheduler
+
+
+class Site:
+    BASE_URL = None
+    # Wikipedia requests a User-Agent has contact info.
+    # Best practice would be to follow that, but this repo is public.
+    HEADERS = {
+        "User-Agent": "Wikipedia Workshop Scraper 1.0 (Educational Use)"
+    }
+    CONCURRENCY = 2
+    INTERVAL = 0.0
+
+    def __init__(self, scheduler=None, base_url=None):
+        self.scheduler = scheduler or default_scheduler()
+        self.base_url = base_url or self.BASE_URL
+        self.host = urlsplit(self.base_url).netloc
+        self.scheduler.configure(self.host, self.CONCURRENCY, self.INTERVAL)
+
+
+    def url(self, path):
+        return urljoin(self.base_url, path)
+
+
+    def submit(self, url, params=None):
+        return self.scheduler.submit(url, params, self.HEADERS)
+
+
+    def get(self, url, params=None):
+        return self.submit(url, params).result()
+
+
+    def cancel(self, future):
+        self.scheduler.cancel(future)
+
+
+    # Page text, raising for HTTP errors. Usable as a Crawler fetch function.
+    def text(self, url):
+        response = self.get(url)
+        response.raise_for_status()
+        return response.text
+
+
+class WikipediaSite(Site):
+    BASE_URL = "https://en.wikipedia.org/"
+    # At most two pages at once, and no more than ten requests a second
+    CONCURRENCY = 2
+    INTERVAL = 0.1
+
+    # lang picks the language edition, e.g. 'de' for de.wikipedia.org
+    def __init__(self, scheduler=None, lang=None, base_url=None):
+        if lang and not base_url:
+            base_url = f"https://{lang}.wikipedia.org/"
+        super().__init__(scheduler, base_url)
+        # Searching via /w/index.php?search=... would violate Wikipedia's robots.txt,
+        # which disallows scraping /w/, so search uses the official API
+        self.api_url = self.url("w/api.php")
+
+
+    # query is a title with underscores, as made by WikipediaScraper.form_query,
+    # or the last part of an article link's href, which is already percent-encoded
+    # and may point at a section ("Mercury_(planet)#Orbit")
+    def page_url(self, query):
+        title = unquote(query.split('#')[0])
+        return self.url("wiki/" + quote(title, safe="_()'!,:;-./"))
+
+
+class QuotesSite(Site):
+    BASE_URL = "http://quotes.toscrape.com/"
+    CONCURRENCY = 4
+
+    def page_url(self, number=1):
+        return self.base_url if number == 1 else self.url(f"page/{number}/")
+
+
+    # Keyword arguments for Crawler.crawl, see crawler.py
+    def crawl_settings(self):
+        from crawler import quotes_site
+        return quotes_site()
+
+
+# JSON API from examples/01_basic_requests.py ex1_1 and ex1_2
+class JsonPlaceholderSite(Site):
+    BASE_URL = "https://jsonplaceholder.typicode.com/"
+    CONCURRENCY = 4
+
+    def post(self, post_id):
+        return self.get(self.url(f"posts/{post_id}")).json()
+
+
+    def posts(self, user_id=None):
+        params = {"userId": user_id} if user_id is not None else None
+        return self.get(self.url("posts"), params).json()
+
+
+    def create_post(self, title, body, user_id):
+        # The scheduler only sends GETs; POSTs are rare, so they go direct
+        import requests
+        data = {"title": title, "body": body, "userId": user_id}
+        return requests.post(self.url("posts"), json=data, headers=self.HEADERS,
+                             timeout=FetchScheduler.TIMEOUT).json()
+
+
+# Simulated hosts for the benchmark: host -> seconds per request
+SIMULATED_LATENCY = {
+    "slow.example": 1.0,
+    "quotes.example": 0.05,
+    "api.example": 0.05,
+}
+
+
+def simulated_get(scheduler, host, url, params, headers):
+    time.sleep(SIMULATED_LATENCY[host])
+    return SimpleNamespace(status_code=200, url=url, text=json.dumps({"url": url}))
+
+
+def simulated_urls(per_host):
+    # The slow host's requests are queued first, the worst case for a FIFO pool
+    return [f"http://{host}/item/{i}" for host in SIMULATED_LATENCY for i in range(per_host)]
+
+
+def report(label, urls, finished, start):
+    import statistics
+    print(label)
+    for host in SIMULATED_LATENCY:
+        times = [finished[u] - start for u in urls if urlsplit(u).netloc == host]
+        print(f"\t{host:15} median done after {statistics.median(times):5.2f}s, "
+              f"last after {max(times):5.2f}s")
+
+
+def main():
+    from concurrent.futures import ThreadPoolExecutor
+    urls = simulated_urls(20)
+    workers = FetchScheduler.WORKERS
+
+    finished = {}
+    start = time.perf_counter()
+    with ThreadPoolExecutor(workers) as pool:
+        def fetch(url):
+            simulated_get(None, urlsplit(url).netloc, url, None, None)
+            finished[url] = time.perf_counter()
+        list(pool.map(fetch, urls))
+    report(f"Thread pool, {workers} workers, FIFO:", urls, finished, start)
+
+    finished = {}
+    scheduler = FetchScheduler(workers, opener=simulated_get)
+    for host in SIMULATED_LATENCY:
+        scheduler.configure(host, concurrency=2)
+    start = time.perf_counter()
+    futures = {url: scheduler.submit(url) for url in urls}
+    for url, future in futures.items():
+        future.add_done_callback(lambda f, url=url: finished.__setitem__(url, time.perf_counter()))
+    for future in futures.values():
+        future.result()
+    scheduler.close()
+    report(f"FetchScheduler, {workers} workers, 2 per host:", urls, finished, start)
+
+
+if __name__ == "__main__":
+    main()
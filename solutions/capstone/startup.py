@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+# Startup time of the Wikipedia Scraper
+# Batch jobs that start the scraper thousands of times pay for its startup on
+# every run, so it only imports what it needs to show the first prompt.
+# BeautifulSoup, the fact patterns, the SQLite store and the other extensions
+# load on first use. This measures, as the median of several runs:
+#   - the Python interpreter on its own
+#   - importing wikipedia_scraper
+#   - starting the scraper until it prompts for a search
+#   - starting it and quitting straight away
+#   - importing wikipedia_scraper along with everything it defers, the cost
+#     moved to the first article
+#
+#   python3 startup.py [RUNS]
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCRAPER = os.path.join(HERE, 'wikipedia_scraper.py')
+DEFERRED = ['bs4', 'patterns', 'models', 'article_store', 'article_archive', 'fact_index',
+            'title_search', 'argparse', 'textwrap', 'concurrent.futures']
+
+
+# Seconds from starting command until it exits
+def time_command(command):
+    start = time.perf_counter()
+    subprocess.run(command, cwd=HERE, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                   check=True)
+    return time.perf_counter() - start
+
+
+# Seconds from starting the scraper until it prompts, and until it has quit
+def time_prompt():
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, SCRAPER], cwd=HERE,
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    output = b''
+    while not output.endswith(b'> '):
+        chunk = os.read(process.stdout.fileno(), 1024)
+        if not chunk:
+            raise RuntimeError("scraper exited before prompting")
+        output += chunk
+    prompted = time.perf_counter() - start
+    process.communicate(b'q\n')
+    return prompted, time.perf_counter() - start
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    # The first run of each may write bytecode caches, so isn't counted
+    commands = {
+        'interpreter': [sys.executable, '-c', 'pass'],
+        'import wikipedia_scraper': [sys.executable, '-c', 'import wikipedia_scraper'],
+        'import with deferred modules': [
+            sys.executable, '-c', 'import wikipedia_scraper, ' + ', '.join(DEFERRED)],
+    }
+    times = {}
+    for label, command in commands.items():
+        time_command(command)
+        times[label] = [time_command(command) for _ in range(runs)]
+    time_prompt()
+    prompts = [time_prompt() for _ in range(runs)]
+    times['first prompt'] = [prompted for prompted, _ in prompts]
+    times['start and quit'] = [total for _, total in prompts]
+
+    print(f"Median of {runs} runs:")
+    for label in ('interpreter', 'import wikipedia_scraper', 'first prompt', 'start and quit',
+                  'import with deferred modules'):
+        print(f"\t{label:30} {statistics.median(times[label]) * 1000:7.1f}ms")
+    if sys.flags.dont_write_bytecode:
+        print("Bytecode caching is off (PYTHONDONTWRITEBYTECODE), so every run compiles the scraper")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+import time
+
+from dedupe import ParagraphIndex
+from wikipedia_scraper import WikipediaScraper
+
+
+PARAGRAPH = "Founded in 2001 in Paris, France, it grew to 300 km and cost $5,000."
+
+
+def test_cached_facts_cover_only_searched_categories():
+    scraper = WikipediaScraper()
+    index = ParagraphIndex()
+    assert set(index.extract([PARAGRAPH], scraper.extract_key_facts, ['Dates'])) == {'Dates'}
+    facts = index.extract([PARAGRAPH], scraper.extract_key_facts)
+    assert facts['Measurements'] == {'300 km'}
+    assert index.misses == 2
+    assert index.extract([PARAGRAPH], scraper.extract_key_facts, ['Measurements']) == \
+        {'Measurements': {'300 km'}}
+    assert index.exact_hits == 1
+
+
+def test_facts_past_the_deadline_are_not_cached():
+    scraper = WikipediaScraper()
+    index = ParagraphIndex()
+    index.extract([PARAGRAPH], scraper.extract_key_facts, deadline=time.perf_counter())
+    index.extract([PARAGRAPH], scraper.extract_key_facts)
+    assert index.misses == 2 and index.exact_hits == 0
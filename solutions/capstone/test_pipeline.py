@@ -0,0 +1,40 @@
+import threading
+
+from pipeline import Pipeline, Stage
+
+
+# Run the pipeline on a thread; None if it hasn't finished within timeout
+def run_with_timeout(pipeline, source, timeout=5):
+    results = []
+    thread = threading.Thread(target=lambda: results.extend(pipeline.stream(source)), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        pipeline.stopped.set()
+        return None
+    return results
+
+
+def test_small_budget_with_uneven_items_finishes():
+    stages = [
+        Stage('fetch', lambda n: (n, 'x' * 90), workers=4, sizeof=lambda item: len(item[1])),
+        Stage('parse', lambda item: (item[0], 'y' * 20), workers=2, sizeof=lambda item: len(item[1])),
+    ]
+    pipeline = Pipeline(stages, memory_budget=100)
+    results = run_with_timeout(pipeline, range(200))
+    assert results is not None, f"pipeline stuck with {pipeline.budget.used} bytes held"
+    assert sorted(n for n, _ in results) == list(range(200))
+    assert pipeline.budget.used == 0
+
+
+def test_small_budget_with_growing_items_finishes():
+    stages = [
+        Stage('fetch', lambda n: 'x' * 30, workers=3),
+        Stage('parse', lambda text: text * 3, workers=3),
+        Stage('split', lambda text: [text[:50], text[50:]], workers=2, many=True),
+    ]
+    pipeline = Pipeline(stages, memory_budget=100)
+    results = run_with_timeout(pipeline, range(100))
+    assert results is not None, f"pipeline stuck with {pipeline.budget.used} bytes held"
+    assert len(results) == 200
+    assert pipeline.budget.used == 0
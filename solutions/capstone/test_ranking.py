@@ -0,0 +1,55 @@
+import os
+import tempfile
+
+from article_store import ArticleStore
+from models import Article
+from ranking import by_position, top_facts
+from wikipedia_scraper import WikipediaScraper
+
+
+PARAGRAPHS = [
+    "The farm was founded in Paris, France and grew to 300 km.",
+    "By 1991 it was 20 km wide, and 1850 was long forgotten.",
+]
+
+
+def test_stream_key_facts_records_article_positions():
+    scraper = WikipediaScraper(fact_scorer=by_position)
+    facts = scraper.stream_key_facts(PARAGRAPHS)
+    assert facts['Measurements'] == {'300 km': PARAGRAPHS[0].index('300 km'),
+                                     '20 km': len(PARAGRAPHS[0]) + 1 + PARAGRAPHS[1].index('20 km')}
+    assert list(facts['Dates']) == ['1991', '1850']
+    assert top_facts(facts, 1, by_position) == {
+        'Dates': ['1991'], 'Measurements': ['300 km'], 'Locations': ['Paris']}
+
+
+def test_store_keeps_fact_positions():
+    scraper = WikipediaScraper()
+    article = Article("Farm", 1, PARAGRAPHS, scraper.stream_key_facts(PARAGRAPHS))
+    with tempfile.TemporaryDirectory() as directory:
+        store = ArticleStore(os.path.join(directory, 'articles.db'))
+        store.save_article(article)
+        loaded = store.get_article("Farm")
+        store.close()
+    assert loaded.facts_by_category() == article.facts_by_category()
+
+
+def test_ranker_satisfied_by_final_or_high_scores():
+    from ranking import FactRanker, by_frequency, by_length
+    ranker = FactRanker(2, by_position)
+    ranker.add('Dates', '1991', 0)
+    assert not ranker.satisfied('Dates')
+    ranker.add('Dates', '1850', 5)
+    assert ranker.satisfied('Dates')
+
+    ranker = FactRanker(2, by_length)
+    ranker.add('Measurements', '300 km', 0)
+    ranker.add('Measurements', '20 km', 1)
+    assert ranker.full('Measurements') and not ranker.satisfied('Measurements')
+    ranker.add('Measurements', '1,234,567,890 km', 2)
+    ranker.add('Measurements', '9,876,543,210 km', 3)
+    assert ranker.satisfied('Measurements')
+
+    ranker = FactRanker(1, by_frequency)
+    ranker.add('Dates', '1991', 0)
+    assert not ranker.satisfied('Dates')
@@ -0,0 +1,26 @@
+from sites import FetchScheduler, WikipediaSite
+
+
+def make_site():
+    return WikipediaSite(FetchScheduler(opener=lambda *args: None))
+
+
+def test_page_url_quotes_typed_titles():
+    site = make_site()
+    assert site.page_url("Café") == "https://en.wikipedia.org/wiki/Caf%C3%A9"
+    assert site.page_url("Python_(programming_language)") == \
+        "https://en.wikipedia.org/wiki/Python_(programming_language)"
+    assert site.page_url("AC/DC") == "https://en.wikipedia.org/wiki/AC/DC"
+
+
+def test_page_url_keeps_encoded_hrefs():
+    site = make_site()
+    assert site.page_url("Caf%C3%A9") == "https://en.wikipedia.org/wiki/Caf%C3%A9"
+    assert site.page_url("100%25_Pure") == "https://en.wikipedia.org/wiki/100%25_Pure"
+
+
+def test_page_url_drops_fragment():
+    site = make_site()
+    assert site.page_url("Mercury_(planet)#Orbit") == \
+        "https://en.wikipedia.org/wiki/Mercury_(planet)"
+    assert site.page_url("Caf%C3%A9#History") == "https://en.wikipedia.org/wiki/Caf%C3%A9"
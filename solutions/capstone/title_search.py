@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+
+# Offline title search
+# A local replacement for the opensearch API: prefix and typo-tolerant title
+# search over a list of titles (e.g. a dump's all-titles-in-ns0 file), ranked by
+# a popularity score such as page views, with no network round trip.
+#
+# build() writes one file that is memory-mapped for searching:
+#   - the titles' search keys (case-folded, spaces for underscores), sorted
+#   - a prefix index: the first 8 bytes of each key as a big-endian integer, so
+#     the range of keys starting with a prefix is two numpy binary searches
+#   - the popularity of each key and the title to show for it
+# A search for "shee" finds the range of keys starting with "shee" and takes
+# the most popular titles in it. A fuzzy search also looks up every string
+# within max_distance edits of the query (deletions, substitutions, insertions
+# and swaps of neighbouring characters) as a prefix. So "shep" finds "Sheep"
+# and "spiderman" finds "Spider-Man". Exact prefix matches rank first, then by
+# popularity.
+#
+#   python3 title_search.py build all-titles-in-ns0 titles.idx   (TITLE[<tab>POPULARITY] lines)
+#   python3 title_search.py search titles.idx shep
+#   python3 title_search.py bench
+
+import bisect
+import heapq
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+import numpy as np
+
+PREFIX_BYTES = 8
+
+
+# Search key of a title or query: "Sheep_dog" -> "sheep dog"
+def search_key(text):
+    return ' '.join(text.replace('_', ' ').casefold().split())
+
+
+# A key's first PREFIX_BYTES bytes as an integer, padded with zero bytes
+# Integers sort in the same order as the UTF-8 keys they start
+def prefix_value(key_bytes):
+    return int.from_bytes(key_bytes[:PREFIX_BYTES].ljust(PREFIX_BYTES, b'\0'), 'big')
+
+
+# Strings one edit away from text, using characters from alphabet
+def edits(text, alphabet):
+    variants = set()
+    for i in range(len(text) + 1):
+        left, right = text[:i], text[i:]
+        if right:
+            variants.add(left + right[1:])
+            for c in alphabet:
+                variants.add(left + c + right[1:])
+        if len(right) > 1:
+            variants.add(left + right[1] + right[0] + right[2:])
+        for c in alphabet:
+            variants.add(left + c + right)
+    variants.discard(text)
+    return variants
+
+
+class TitleSearch:
+    MAGIC = b'TITLEIX1'
+    HEADER = struct.Struct('<8sQQ')
+    # Characters tried in fuzzy edits: the most common ones in the keys
+    ALPHABET_SIZE = 40
+    # Queries shorter than this only match as prefixes; one edit to "x" matches everything
+    FUZZY_MIN_LENGTH = 3
+    # Ranges of at most this many keys are scanned rather than searched
+    SCAN_LIMIT = 256
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, offset, length = self.HEADER.unpack_from(self.map)
+        if magic != self.MAGIC:
+            raise ValueError(f"{path} is not a title index")
+        header = json.loads(self.map[offset:offset + length])
+        self.count = header['count']
+        self.max_distance = header['max_distance']
+        self.alphabet = header['alphabet']
+
+        def array(name, dtype, count):
+            return np.frombuffer(self.map, dtype=dtype, count=count, offset=header[name])
+        self.prefixes = array('prefixes', np.uint64, self.count)
+        self.popularity = array('popularity', np.float32, self.count)
+        self.key_offsets = array('key_offsets', np.uint64, self.count + 1)
+        self.title_offsets = array('title_offsets', np.uint64, self.count + 1)
+        self.keys_start = header['keys']
+        self.titles_start = header['titles']
+
+
+    def key(self, i):
+        start = self.keys_start + int(self.key_offsets[i])
+        return self.map[start:self.keys_start + int(self.key_offsets[i + 1])]
+
+
+    def title(self, i):
+        start = self.titles_start + int(self.title_offsets[i])
+        return self.map[start:self.titles_start + int(self.title_offsets[i + 1])].decode('utf-8')
+
+
+    # Ranges [lo, hi) of the keys starting with any of prefixes
+    def ranges(self, prefixes):
+        encoded = [p.encode('utf-8') for p in prefixes]
+        # Prefixes longer than the index share ranges with the others with the same first bytes
+        heads = list({p[:PREFIX_BYTES] for p in encoded})
+        # The last key starting with a prefix has every byte after it as 0xff at most
+        low = b''.join(h.ljust(PREFIX_BYTES, b'\0') for h in heads)
+        high = b''.join(h.ljust(PREFIX_BYTES, b'\xff') for h in heads)
+        los = np.searchsorted(self.prefixes, np.frombuffer(low, dtype='>u8').astype(np.uint64), 'left')
+        his = np.searchsorted(self.prefixes, np.frombuffer(high, dtype='>u8').astype(np.uint64), 'right')
+        found = {h: (lo, hi) for h, lo, hi in zip(heads, los.tolist(), his.tolist()) if lo < hi}
+        longer = {}
+        for p in encoded:
+            head = p[:PREFIX_BYTES]
+            if head not in found:
+                continue
+            if len(p) <= PREFIX_BYTES:
+                yield found[head]
+            else:
+                longer.setdefault(found[head], []).append(p)
+        for (lo, hi), group in longer.items():
+            yield from self._narrow(group, lo, hi)
+
+
+    # Keys of a range sharing their first PREFIX_BYTES bytes that start with
+    # any of prefixes
+    def _narrow(self, prefixes, lo, hi):
+        if hi - lo <= self.SCAN_LIMIT:
+            # Reading each key once beats a binary search for each prefix
+            wanted = set(prefixes)
+            lengths = {len(p) for p in prefixes}
+            for i in range(lo, hi):
+                key = self.key(i)
+                if any(key[:n] in wanted for n in lengths):
+                    yield i, i + 1
+            return
+        keys = KeyView(self)
+        for prefix in prefixes:
+            start = bisect.bisect_left(keys, prefix, lo, hi)
+            end = bisect.bisect_left(keys, prefix + b'\xff', start, hi)
+            if start < end:
+                yield start, end
+
+
+    # The limit most popular keys of a range
+    def top(self, lo, hi, limit):
+        if hi - lo <= limit:
+            return range(lo, hi)
+        scores = self.popularity[lo:hi]
+        best = np.argpartition(-scores, limit - 1)[:limit]
+        return (best + lo).tolist()
+
+
+    # Titles starting with query, or within max_distance edits of starting with it
+    # (fuzzy=True), most popular first after exact prefix matches
+    # Returns list of titles, the same shape as the opensearch results
+    def search(self, query, limit=10, fuzzy=True):
+        key = search_key(query)
+        if not key:
+            return []
+        found = {}
+        levels = [{key}]
+        if fuzzy and len(key) >= self.FUZZY_MIN_LENGTH:
+            alphabet = self.alphabet[:self.ALPHABET_SIZE]
+            for _ in range(self.max_distance):
+                levels.append({v for text in levels[-1] for v in edits(text, alphabet)})
+        for distance, prefixes in enumerate(levels):
+            for lo, hi in self.ranges(prefixes):
+                for i in self.top(lo, hi, limit):
+                    if i not in found:
+                        found[i] = distance
+            # Enough matches with fewer edits; more edits could only rank lower
+            if len(found) >= limit:
+                break
+        best = heapq.nsmallest(limit, found, key=lambda i: (found[i], -self.popularity[i], i))
+        return [self.title(i) for i in best]
+
+
+    def __len__(self):
+        return self.count
+
+
+    def close(self):
+        self.prefixes = self.popularity = self.key_offsets = self.title_offsets = None
+        self.map.close()
+        self.file.close()
+
+
+# Keys of a TitleSearch as a sequence for bisect
+class KeyView:
+    def __init__(self, index):
+        self.index = index
+
+    def __getitem__(self, i):
+        return self.index.key(i)
+
+    def __len__(self):
+        return self.index.count
+
+
+# Write an index of titles, an iterable of (title, popularity) pairs
+# Titles with the same key keep the most popular spelling
+def build(entries, path, max_distance=1):
+    best = {}
+    for title, popularity in entries:
+        title = ' '.join(title.replace('_', ' ').split())
+        key = search_key(title).encode('utf-8')
+        if key and (key not in best or popularity > best[key][1]):
+            best[key] = (title, popularity)
+    keys = sorted(best)
+
+    counts = {}
+    for key in keys:
+        for c in key.decode('utf-8'):
+            counts[c] = counts.get(c, 0) + 1
+    alphabet = ''.join(sorted(counts, key=counts.get, reverse=True))
+
+    prefixes = np.array([prefix_value(k) for k in keys], dtype=np.uint64)
+    popularity = np.array([best[k][1] for k in keys], dtype=np.float32)
+    titles = [best[k][0].encode('utf-8') for k in keys]
+    key_offsets = np.zeros(len(keys) + 1, dtype=np.uint64)
+    np.cumsum([len(k) for k in keys], out=key_offsets[1:])
+    title_offsets = np.zeros(len(keys) + 1, dtype=np.uint64)
+    np.cumsum([len(t) for t in titles], out=title_offsets[1:])
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.titles-')
+    header = {'count': len(keys), 'max_distance': max_distance, 'alphabet': alphabet}
+    with os.fdopen(fd, 'wb') as f:
+        f.write(TitleSearch.HEADER.pack(TitleSearch.MAGIC, 0, 0))
+        for name, data in (('prefixes', prefixes), ('popularity', popularity),
+                           ('key_offsets', key_offsets), ('title_offsets', title_offsets)):
+            # Arrays start on 8-byte boundaries
+            f.write(b'\0' * (-f.tell() % 8))
+            header[name] = f.tell()
+            f.write(data.tobytes())
+        header['keys'] = f.tell()
+        for key in keys:
+            f.write(key)
+        header['titles'] = f.tell()
+        for title in titles:
+            f.write(title)
+        offset = f.tell()
+        encoded = json.dumps(header, ensure_ascii=False).encode('utf-8')
+        f.write(encoded)
+        f.seek(0)
+        f.write(TitleSearch.HEADER.pack(TitleSearch.MAGIC, offset, len(encoded)))
+    os.replace(tmp, path)
+    return len(keys)
+
+
+# (title, popularity) pairs from lines of TITLE or TITLE<tab>POPULARITY
+def read_titles(path):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            title, _, popularity = line.rstrip('\n').partition('\t')
+            try:
+                yield title, float(popularity) if popularity else 0.0
+            except ValueError:
+                yield title, 0.0
+
+
+# Made-up titles with a long tail of popularity, like Wikipedia's
+def synthetic_titles(count, seed=0):
+    import random
+    rng = random.Random(seed)
+    words = ['sheep', 'spider', 'python', 'river', 'castle', 'station', 'battle', 'church',
+             'county', 'football', 'club', 'school', 'island', 'mountain', 'lake', 'park',
+             'history', 'list', 'album', 'song', 'film', 'season', 'village', 'railway']
+    yield "Sheep", 5e6
+    yield "Spider-Man", 8e6
+    yield "Python (programming language)", 1.2e7
+    for i in range(count):
+        name = ' '.join(rng.choice(words) for _ in range(rng.randint(1, 4)))
+        yield f"{name.capitalize()} {i}", rng.paretovariate(1.0)
+
+
+def bench(count, queries=2000):
+    import random
+    import statistics
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'titles.idx')
+        start = time.perf_counter()
+        built = build(synthetic_titles(count), path)
+        print(f"Built index of {built:,} titles in {time.perf_counter() - start:.1f}s, "
+              f"{os.path.getsize(path) / 2**20:,.0f} MB")
+
+        start = time.perf_counter()
+        index = TitleSearch(path)
+        print(f"Opened in {(time.perf_counter() - start) * 1000:.2f}ms")
+        rng = random.Random(1)
+        words = ['sh', 'shee', 'sheep riv', 'spi', 'spiderman', 'pyth', 'castle sta',
+                 'footbal', 'raliway', 'histroy of', 'moutain lake', 'x']
+        for label, fuzzy in (('prefix', False), ('fuzzy', True)):
+            times = []
+            for _ in range(queries):
+                query = rng.choice(words)
+                start = time.perf_counter()
+                index.search(query, fuzzy=fuzzy)
+                times.append(time.perf_counter() - start)
+            times.sort()
+            print(f"\t{label:6} median {statistics.median(times) * 1e6:7.0f}µs, "
+                  f"p99 {times[int(len(times) * 0.99)] * 1e6:7.0f}µs")
+        for query in ('shee', 'shep', 'spiderman', 'pyth', 'raliway 12'):
+            print(f"\t{query!r}: {index.search(query, limit=3)}")
+        index.close()
+
+
+def main():
+    if len(sys.argv) > 3 and sys.argv[1] == 'build':
+        max_distance = int(sys.argv[4]) if len(sys.argv) > 4 else 1
+        start = time.perf_counter()
+        count = build(read_titles(sys.argv[2]), sys.argv[3], max_distance)
+        print(f"Indexed {count:,} titles in {time.perf_counter() - start:.1f}s")
+    elif len(sys.argv) > 3 and sys.argv[1] == 'search':
+        index = TitleSearch(sys.argv[2])
+        query = ' '.join(sys.argv[3:])
+        start = time.perf_counter()
+        results = index.search(query)
+        print(f"{len(results)} results in {(time.perf_counter() - start) * 1000:.2f}ms")
+        for title in results:
+            print(f"\t{title}")
+    elif len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        bench(int(sys.argv[2]) if len(sys.argv) > 2 else 1_000_000)
+    else:
+        print(f"usage: {sys.argv[0]} build TITLES INDEX [MAX_DISTANCE]")
+        print(f"       {sys.argv[0]} search INDEX QUERY")
+        print(f"       {sys.argv[0]} bench [COUNT]")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+# Title normalisation and redirect resolution
+# "sheep", "Sheep " and "sheep_" are all the Wikipedia article "Sheep", and
+# "Spiderman" redirects to "Spider-Man". Fetching each spelling separately
+# downloads the same page again and caches it under another key.
+#
+# normalise_title() applies MediaWiki's own rules (underscores are spaces,
+# whitespace is collapsed, the first letter is upper case). TitleResolver
+# remembers alias -> canonical title mappings learned from fetched pages and
+# API responses, so later requests for an alias go straight to the canonical
+# title. The mappings can be saved to a JSON file and reused between runs.
+#
+#   titles = TitleResolver("titles.json")
+#   titles.record("Spiderman", "Spider-Man")
+#   titles.resolve("spiderman")   # "Spider-Man"
+#   titles.save()
+#
+# Run this file with a saved mapping file to see its contents, or with titles
+# after the file name to resolve them.
+
+import json
+import os
+import sys
+import tempfile
+import threading
+from urllib.parse import unquote
+
+# Redirect chains longer than this are treated as a loop
+MAX_HOPS = 5
+
+
+# Normalise a title or query the way MediaWiki does
+# Returns the title with spaces, e.g. "sheep_dog" -> "Sheep dog"
+# Typed text is taken as it is: "100% Pure" is a title, not an encoded one
+def normalise_title(text):
+    title = ' '.join(text.replace('_', ' ').split())
+    return title[:1].upper() + title[1:]
+
+
+# Title of the article an href links to, e.g. "/wiki/Caf%C3%A9#History" -> "Café"
+def title_from_href(href):
+    return normalise_title(unquote(href.split('#')[0].rsplit('/', 1)[-1]))
+
+
+class TitleResolver:
+    # path is an optional JSON file the mappings are loaded from and saved to
+    def __init__(self, path=None):
+        self.path = path
+        self.canonical = {}
+        self.lock = threading.Lock()
+        self.changed = False
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.canonical = json.load(f)
+
+
+    # Canonical title for a title or alias, normalised if no mapping is known
+    def resolve(self, title):
+        title = normalise_title(title)
+        with self.lock:
+            for _ in range(MAX_HOPS):
+                target = self.canonical.get(title)
+                if target is None:
+                    break
+                title = target
+        return title
+
+
+    # Remember that alias leads to the page titled canonical
+    def record(self, alias, canonical):
+        alias = normalise_title(alias)
+        canonical = normalise_title(canonical)
+        if not alias or not canonical:
+            return
+        with self.lock:
+            # A title that used to redirect may since have become an article
+            if self.canonical.pop(canonical, None) is not None:
+                self.changed = True
+            if alias != canonical and self.canonical.get(alias) != canonical:
+                self.canonical[alias] = canonical
+                self.changed = True
+
+
+    # Record the "normalized" and "redirects" lists of an action=query API response
+    # https://www.mediawiki.org/wiki/API:Query#Resolving_redirects
+    def record_query(self, query):
+        for mapping in query.get("normalized", []) + query.get("redirects", []):
+            self.record(mapping["from"], mapping["to"])
+
+
+    def __contains__(self, title):
+        with self.lock:
+            return normalise_title(title) in self.canonical
+
+
+    # Write the mappings to path if anything changed since loading
+    # Writes to a temporary file first so an interrupted save can't lose them
+    def save(self):
+        if not self.path or not self.changed:
+            return
+        with self.lock:
+            data = dict(sorted(self.canonical.items()))
+            self.changed = False
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.titles-', suffix='.json')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=0)
+        os.replace(tmp, self.path)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(f"usage: {sys.argv[0]} TITLES.json [TITLE ...]")
+        sys.exit(1)
+    resolver = TitleResolver(sys.argv[1])
+    if len(sys.argv) > 2:
+        for title in sys.argv[2:]:
+            print(f"{title!r} -> {resolver.resolve(title)!r}")
+        return
+    targets = set(resolver.canonical.values())
+    print(f"{len(resolver.canonical):,} aliases for {len(targets):,} articles")
+    for alias, target in list(resolver.canonical.items())[:20]:
+        print(f"\t{alias} -> {target}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+
+# Chrome trace of a scraping session
+# An opt-in tracer that records how long searches, fetches, parsing and
+# extraction take and on which thread, as Chrome trace-event JSON. Open the
+# file at https://ui.perfetto.dev or chrome://tracing to see one track per
+# thread and per process, and so where the workers sit idle or wait.
+#   - complete ("X") events for each traced call
+#   - async ("b"/"e") events for the time a request waits in the fetch queue
+#   - counter ("C") events, e.g. the pipeline's memory budget in use
+# https://docs.google.com/document/d/1CvAClvFfyA5R-PhYUmn5OOQtYMH4h6I0nSsKchNAySU
+#
+# Tracing works by wrapping methods of the objects passed in, so nothing is
+# slowed down unless it's switched on:
+#
+#   tracer = Tracer("trace.json")
+#   trace_scraper(scraper, tracer)      # also traces its site's fetch workers
+#   ...
+#   tracer.save()
+#
+# Traces written by several processes share a clock and can be merged:
+#   python3 tracing.py merge session.json worker-*.json
+# Run `python3 tracing.py demo` to trace a scrape of a simulated Wikipedia
+# through the streaming pipeline.
+
+import functools
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+
+
+class Tracer:
+    # path is where save() writes the trace
+    # process_name labels this process's track, the script name if not given
+    def __init__(self, path=None, process_name=None):
+        self.path = path
+        self.pid = os.getpid()
+        self.events = []
+        self.lock = threading.Lock()
+        self.named_threads = set()
+        self.ids = itertools.count(1)
+        # Timestamps are wall clock microseconds so traces of several processes line up,
+        # measured with perf_counter so they never go backwards within one
+        self.offset = time.time() - time.perf_counter()
+        name = process_name or os.path.basename(sys.argv[0]) or 'python'
+        self._record({'ph': 'M', 'name': 'process_name', 'pid': self.pid, 'tid': 0,
+                      'args': {'name': f"{name} ({self.pid})"}})
+
+
+    # Microseconds on the trace clock
+    def now(self):
+        return (time.perf_counter() + self.offset) * 1e6
+
+
+    def _record(self, event):
+        with self.lock:
+            self.events.append(event)
+
+
+    # Id of the current thread, naming its track the first time it's seen
+    def _thread(self):
+        tid = threading.get_ident()
+        if tid not in self.named_threads:
+            self.named_threads.add(tid)
+            self._record({'ph': 'M', 'name': 'thread_name', 'pid': self.pid, 'tid': tid,
+                          'args': {'name': threading.current_thread().name}})
+        return tid
+
+
+    # Record a call on the current thread that ran from start to end (trace clock)
+    def complete(self, name, category, start, end, args=None):
+        event = {'ph': 'X', 'name': name, 'cat': category, 'pid': self.pid,
+                 'tid': self._thread(), 'ts': start, 'dur': end - start}
+        if args:
+            event['args'] = args
+        self._record(event)
+
+
+    # Record a wait that isn't tied to one thread, e.g. a request in a queue
+    def wait(self, name, category, start, end, args=None):
+        span_id = next(self.ids)
+        begin = {'ph': 'b', 'name': name, 'cat': category, 'pid': self.pid,
+                 'tid': self._thread(), 'ts': start, 'id': span_id}
+        if args:
+            begin['args'] = args
+        self._record(begin)
+        self._record({'ph': 'e', 'name': name, 'cat': category, 'pid': self.pid,
+                      'tid': self._thread(), 'ts': end, 'id': span_id})
+
+
+    # Record the current values of a counter track, e.g. {'bytes': 1024}
+    def counter(self, name, values):
+        self._record({'ph': 'C', 'name': name, 'pid': self.pid, 'tid': 0,
+                      'ts': self.now(), 'args': values})
+
+
+    # Time a block of code
+    #   with tracer.span("save", "store"): ...
+    def span(self, name, category, args=None):
+        return Span(self, name, category, args)
+
+
+    # Replace obj's method with one that records each call
+    # describe is an optional function of the call's arguments returning a
+    # dictionary of details to show with it
+    # name labels the calls, the method's qualified name if not given
+    def wrap(self, obj, method, category, describe=None, name=None):
+        original = getattr(obj, method)
+        name = name or getattr(original, '__qualname__', method)
+
+        @functools.wraps(original)
+        def traced(*args, **kwargs):
+            start = self.now()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.complete(name, category, start, self.now(),
+                              describe(*args, **kwargs) if describe else None)
+        setattr(obj, method, traced)
+
+
+    # Write the trace to path, or the path given at the start
+    def save(self, path=None):
+        path = path or self.path
+        with self.lock:
+            events = list(self.events)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        return path
+
+
+class Span:
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = self.tracer.now()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.complete(self.name, self.category, self.start, self.tracer.now(), self.args)
+
+
+def describe_url(url, params=None, *args, **kwargs):
+    details = {'url': url}
+    if params:
+        details['params'] = {k: str(v)[:80] for k, v in params.items()}
+    return details
+
+
+def describe_query(query, *args, **kwargs):
+    return {'query': query}
+
+
+def describe_paragraphs(paragraphs, *args, **kwargs):
+    return {'paragraphs': len(paragraphs)}
+
+
+# Trace a WikipediaScraper's searching, fetching, parsing and extraction,
+# and the fetch workers of its site's scheduler
+def trace_scraper(scraper, tracer):
+    tracer.wrap(scraper, 'handle_search', 'search', describe_query)
+    tracer.wrap(scraper, 'get_search_results', 'search', describe_query)
+    tracer.wrap(scraper, 'go_to_page', 'page', describe_query)
+    tracer.wrap(scraper, 'get_response', 'network', describe_url)
+    tracer.wrap(scraper, 'extract_article', 'extract')
+    tracer.wrap(scraper, 'extract_page_paragraphs', 'parse')
+    tracer.wrap(scraper, 'is_disambiguation_page', 'parse')
+    tracer.wrap(scraper, 'extract_disambiguation_links', 'parse')
+    tracer.wrap(scraper, 'stream_key_facts', 'extract', describe_paragraphs)
+    tracer.wrap(scraper, 'extract_key_facts', 'extract')
+    tracer.wrap(scraper, 'get_description', 'search', describe_query)
+    trace_scheduler(scraper.site.scheduler, tracer)
+
+
+# Trace each request a FetchScheduler's workers run, and how long it was queued
+def trace_scheduler(scheduler, tracer):
+    opener = scheduler.opener
+
+    def traced(scheduler, host, url, params, headers):
+        start = tracer.now()
+        progress = scheduler.local.progress
+        queued = time.monotonic() - progress.submitted
+        tracer.wait(f"queued for {host}", 'queue', start - queued * 1e6, start, {'url': url})
+        try:
+            return opener(scheduler, host, url, params, headers)
+        finally:
+            tracer.complete('download', 'network', start, tracer.now(),
+                            {'host': host, 'url': url, 'bytes': progress.received})
+    scheduler.opener = traced
+
+
+# Trace each item a Pipeline's stages work on, the time they wait for room in
+# the next queue, and the memory budget in use
+def trace_pipeline(pipeline, tracer):
+    for stage in pipeline.stages:
+        tracer.wrap(stage, 'function', stage.name, name=stage.name)
+    tracer.wrap(pipeline, '_emit', 'stall', name='wait for room')
+    budget = pipeline.budget
+    for method in ('acquire', 'release'):
+        original = getattr(budget, method)
+
+        def traced(*args, original=original, **kwargs):
+            result = original(*args, **kwargs)
+            tracer.counter('memory budget', {'bytes': budget.used})
+            return result
+        setattr(budget, method, traced)
+
+
+# Combine the traces of several processes into one file
+def merge(paths, output):
+    events = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            events.extend(json.load(f)['traceEvents'])
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+    return len(events)
+
+
+def demo(path, count=100):
+    from pipeline import Pipeline, scrape_stages
+    from service import SimulatedWikipedia
+    from sites import FetchScheduler, WikipediaSite
+    from wikipedia_scraper import WikipediaScraper
+
+    scheduler = FetchScheduler(workers=4, opener=SimulatedWikipedia(0.05))
+    site = WikipediaSite(scheduler)
+    scheduler.configure(site.host, concurrency=4, interval=0.01)
+    scraper = WikipediaScraper(site=site)
+    pipeline = Pipeline(scrape_stages(scraper, fetch_workers=4), memory_budget=16 << 10)
+
+    tracer = Tracer(path)
+    trace_scraper(scraper, tracer)
+    trace_pipeline(pipeline, tracer)
+
+    def slow_sink(article):
+        with tracer.span('sink', 'sink', {'title': article.title}):
+            time.sleep(0.01)
+
+    done = pipeline.run((f"Topic {i}" for i in range(count)), slow_sink)
+    scheduler.close()
+    tracer.save()
+    print(f"Traced {done} simulated articles: {len(tracer.events):,} events in {path}")
+    print("Open it at https://ui.perfetto.dev or chrome://tracing")
+
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == 'merge':
+        count = merge(sys.argv[3:], sys.argv[2])
+        print(f"{count:,} events from {len(sys.argv) - 3} traces in {sys.argv[2]}")
+    elif len(sys.argv) > 1 and sys.argv[1] == 'demo':
+        demo(sys.argv[2] if len(sys.argv) > 2 else 'trace.json')
+    else:
+        print(f"usage: {sys.argv[0]} demo [TRACE.json]")
+        print(f"       {sys.argv[0]} merge OUTPUT.json TRACE.json ...")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
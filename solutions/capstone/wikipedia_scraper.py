@@ -5,28 +5,21 @@
 # Program accepts user search terms and retrieves Wikipedia articles.
 # It handles disambiguation pages and search results by allowing user selection.
 # It also extracts key facts from articles using regex pattern matching.
+#
+# BeautifulSoup, the fact patterns and the optional extensions are imported
+# where they are first used, so starting up (or quitting straight away) doesn't
+# wait for them. Run startup.py to measure startup time.
 
-import requests
+import json
 import re
+import select
 import sys
-import textwrap
-from bs4 import BeautifulSoup, Tag
+import time
+from sites import FetchCancelled, WikipediaSite
+from titles import TitleResolver, normalise_title, title_from_href
 
 
 class WikipediaScraper:
-    WIKI_BASE_URL = "https://en.wikipedia.org/wiki/"
-    
-    # Previous implementation searched via /w/index.php?search=...
-    # This violated condition in Wikipedia's robots.txt disallowing scraping /w/.
-    # Now using official Wikipedia API for search functionality.
-    WIKI_API_URL = "https://en.wikipedia.org/w/api.php"
-    
-    # Wikipedia requests a User-Agent has contact info.
-    # Best practice would be to follow that, but this repo is public.
-    HEADERS = {
-        "User-Agent": "Wikipedia Workshop Scraper 1.0 (Educational Use)"
-    }
-    
     # Config
     PAGE_SIZE = 10
     TEXT_WRAP_WIDTH = 100
@@ -37,8 +30,65 @@ class WikipediaScraper:
     CANCEL_COMMANDS = ['c', 'cancel']
     MORE_COMMANDS = ['m', 'more']
     
-    def __init__(self):
-        pass
+    # Revision id and canonical page name embedded in the page's JavaScript config
+    REVISION_PATTERN = re.compile(r'"wgRevisionId":\s*(\d+)')
+    PAGE_NAME_PATTERN = re.compile(r'"wgPageName":\s*("(?:[^"\\]|\\.)*")')
+    
+    # Maximum titles per API query
+    REVISION_BATCH_SIZE = 50
+    DESCRIPTION_BATCH_SIZE = 50
+    
+    # Seconds to wait for an option's description before listing it without one
+    DESCRIPTION_TIMEOUT = 3
+    
+    # Seconds before a download's progress is shown, and between updates
+    PROGRESS_DELAY = 1.0
+    PROGRESS_INTERVAL = 0.2
+    
+    # Seconds extract_key_facts may spend matching one article's text
+    PATTERN_BUDGET = 0.5
+    
+    # Facts come from the whole article. The lead paragraphs are always searched
+    # in full; after them a category is no longer looked for once its ranking
+    # is satisfied (see FactRanker.satisfied).
+    FACT_CATEGORIES = ('Dates', 'Money', 'Measurements', 'Quotes', 'Locations')
+    LEAD_PARAGRAPHS = 3
+    
+    # store is an optional ArticleStore used to save articles and search locally
+    # archive is an optional ArticleArchive that keeps the raw HTML of fetched pages
+    # site is the WikipediaSite to scrape, English Wikipedia if not given
+    # titles is an optional TitleResolver that sends aliases and redirects to
+    # the canonical title, so each article is fetched and cached once
+    # paragraph_index is an optional dedupe.ParagraphIndex that reuses the facts
+    # of paragraphs already seen, for bulk runs over templated articles
+    # fact_index is an optional fact_index.FactIndex that scraped articles are added to
+    # fact_scorer picks which facts are shown, one of the scorers in ranking.py;
+    # longest first if not given
+    # tracer is an optional tracing.Tracer recording the time spent fetching,
+    # parsing and extracting, saved when the program stops
+    # title_search is an optional title_search.TitleSearch used for searches
+    # instead of the opensearch API, so they work offline
+    def __init__(self, store=None, archive=None, site=None, titles=None, paragraph_index=None,
+                 fact_index=None, fact_scorer=None, tracer=None, title_search=None):
+        self.store = store
+        self.archive = archive
+        self.site = site or WikipediaSite()
+        self.titles = titles
+        self.paragraph_index = paragraph_index
+        self.fact_index = fact_index
+        self.fact_scorer = fact_scorer
+        self.tracer = tracer
+        self.title_search = title_search
+        if tracer:
+            from tracing import trace_scraper
+            trace_scraper(self, tracer)
+        # Short descriptions of disambiguation options, by title
+        self.descriptions = {}
+        self.description_requests = {}
+        # Set by run(): downloads show progress and can be cancelled from the prompt
+        self.interactive = False
+        # Lines typed during a download that weren't a cancel command, for the next prompts
+        self.typed_ahead = []
     
     
     # Print a formatted heading
@@ -69,50 +119,133 @@ class WikipediaScraper:
     
     
     # Get user input and handle quit commands
+    # Lines typed while a download was running are answered first
     def handle_user_input(self):
-        line = input("> ")
+        if self.typed_ahead:
+            line = self.typed_ahead.pop(0)
+            print(f"> {line}")
+        else:
+            line = input("> ")
         if self.is_stop_command(line): self.stop()
         return line
     
     
     # Stop the program and exit
     def stop(self):
+        if self.store:
+            self.store.close()
+        if self.titles:
+            self.titles.save()
+        if self.fact_index:
+            self.fact_index.save()
+        if self.tracer:
+            print(f"Trace written to {self.tracer.save()}")
         print("Bye!")
         sys.exit(0)
     
     
     # Convert user input into a valid Wikipedia query format
-    # Replaces spaces with underscores for URL compatibility
+    # Normalised like MediaWiki titles ("sheep  dog" -> "Sheep_dog"), with
+    # underscores for spaces for URL compatibility
     def form_query(self, line):
-        return '_'.join(line.split())
+        return normalise_title(line).replace(' ', '_')
+    
+    
+    # Query for the canonical title of a query, if it's a known alias
+    def resolve_query(self, query):
+        if not self.titles:
+            return query
+        return self.form_query(self.titles.resolve(query))
     
     
     # Make HTTP request to URL with optional parameters
+    # Requests go through the site's scheduler, which keeps to its politeness limits
     # Returns response object if successful, None if error
+    # Raises FetchCancelled if the user cancels it
     def get_response(self, url, params={}):
         try:
-            response = requests.get(url, params=params, headers=self.HEADERS)
+            future = self.site.submit(url, params=params)
+            if self.interactive:
+                response = self.wait_for_download(future)
+            else:
+                response = future.result()
             if response.status_code == 200:
                 return response
             else:
                 print("Received:", response)
             
+        except FetchCancelled:
+            raise
         except Exception as e:
             print('error: ', e)
     
     
+    # Wait for a download running in the background, showing progress if it's slow
+    # Ctrl-C, or entering a cancel command, abandons it and frees its connection
+    def wait_for_download(self, future):
+        from concurrent.futures import TimeoutError as FutureTimeout
+        shown = False
+        try:
+            while True:
+                try:
+                    return future.result(timeout=self.PROGRESS_INTERVAL)
+                except FutureTimeout:
+                    pass
+                progress = future.progress
+                if progress.started is None:
+                    continue
+                elapsed = time.monotonic() - progress.started
+                if elapsed < self.PROGRESS_DELAY:
+                    continue
+                print(f"\r\tDownloading... {progress.received / 1024:,.0f} KB in {elapsed:.0f}s "
+                      f"(enter 'c' or press Ctrl-C to cancel) ", end='', flush=True)
+                shown = True
+                if self.cancel_requested():
+                    raise KeyboardInterrupt
+        except KeyboardInterrupt:
+            self.site.cancel(future)
+            raise FetchCancelled() from None
+        finally:
+            if shown:
+                print()
+    
+    
+    # Check, without waiting, whether a cancel command has been typed
+    # Anything else typed is kept for the next prompt
+    # Only possible where stdin can be polled (not on Windows); Ctrl-C works everywhere
+    def cancel_requested(self):
+        # Piped input holds the answers to later prompts, so leave it alone
+        if not sys.stdin.isatty():
+            return False
+        try:
+            ready, _, _ = select.select([sys.stdin], [], [], 0)
+        except (OSError, ValueError):
+            return False
+        if not ready:
+            return False
+        line = sys.stdin.readline()
+        if not line:
+            return False
+        if self.is_cancel_command(line.strip()):
+            return True
+        self.typed_ahead.append(line.rstrip('\n'))
+        return False
+    
+    
     # Extract title and body content from Wikipedia article page
     # Filters out content from tables and infoboxes to get main article text
     # Returns tuple of (title, list_of_paragraphs)
     def extract_page_paragraphs(self, page):
+        from bs4 import BeautifulSoup
         soup = BeautifulSoup(page, 'html.parser')
         content = soup.find('div', id='mw-content-text')
         ps = content.find_all('p')
         
+        # Titles look like "Spider-Man - Wikipedia", so only drop the last part
         raw_title = soup.find('title')
-        title = raw_title.text.split('-')[0].strip()
+        title = raw_title.text.rsplit(' - ', 1)[0].strip()
         
-        def is_body_paragraph(tag: Tag):
+        def is_body_paragraph(tag):
             for parent in tag.parents:
                 if parent.name == 'table':
                     return False
@@ -127,27 +260,54 @@ class WikipediaScraper:
             if is_body_paragraph(p) and p.text.strip():
                 content.append(p.text.strip())
 
+        # Only plain strings are kept, so the parse tree can be freed straight away
+        soup.decompose()
         return (title, content)
     
     
+    # Extract the revision id of the article so stored copies can be versioned
+    # Returns revision id as an int, or None if the page doesn't include one
+    def extract_revision_id(self, page_html):
+        match = self.REVISION_PATTERN.search(page_html)
+        return int(match.group(1)) if match else None
+    
+    
+    # Extract the canonical title of the article, the same title the API uses
+    # Falls back to the <title> based title when the page name isn't embedded
+    def extract_page_title(self, page_html, fallback):
+        match = self.PAGE_NAME_PATTERN.search(page_html)
+        if not match:
+            return fallback
+        return json.loads(match.group(1)).replace('_', ' ')
+    
+    
     # Extract links from disambiguation pages
-    # Returns list of anchor tags
+    # Returns list of Link objects with the title and href of each anchor tag
     def extract_disambiguation_links(self, page):
+        from bs4 import BeautifulSoup
+        from models import Link
         soup = BeautifulSoup(page, 'html.parser')
         content = soup.find('div', id='mw-content-text')
-        links = content.select('li a')
+        links = [Link.from_tag(a) for a in content.select('li a')]
+        soup.decompose()
         return links
     
     
     # Display paginated list of options to user
+    # describe is an optional function from option index to a short description,
+    # called as each line is printed so lines appear as descriptions arrive
     # Returns selected index or None if cancelled
-    def paginate(self, options):
+    def paginate(self, options, describe=None):
         pos = 0
         prompt = True
         while True:
             if prompt:
                 for i, option in enumerate(options[pos:pos+self.PAGE_SIZE], pos + 1):
-                    print(f"\t{i}. {option}")
+                    description = describe(i - 1) if describe else None
+                    if description:
+                        print(f"\t{i}. {option} - {description}", flush=True)
+                    else:
+                        print(f"\t{i}. {option}", flush=True)
                 print("Which topic would you like to explore?")
                 
             try:
@@ -167,7 +327,10 @@ class WikipediaScraper:
                     n = int(line)
                     if n < 1 or n > len(options): raise ValueError
                     return n - 1
-            except (EOFError, KeyboardInterrupt):
+            except KeyboardInterrupt:
+                print()
+                return
+            except EOFError:
                 self.stop()
             except ValueError:
                 print('Invalid Selection')
@@ -178,13 +341,12 @@ class WikipediaScraper:
     # Handle a list of Wikipedia links by showing them to user and processing selection
     def handle_links_list(self, list):
         if list:
-            options = [r.get('title') for r in list]
-            selected = self.paginate(options)
+            options = [r.title for r in list]
+            self.request_descriptions([t for t in options if t])
+            selected = self.paginate(options, lambda i: self.get_description(options[i]))
             # Assume valid index (handled in paginate)
             if selected is not None:
-                href = list[selected].get('href')
-                query = href.split('/')[-1]
-                self.go_to_page(query)
+                self.go_to_page(self.form_query(title_from_href(list[selected].href)))
         else:
             print("\tNo results found")
         
@@ -199,30 +361,66 @@ class WikipediaScraper:
     # Check if current page is a disambiguation page
     # Looks for "Category:Disambiguation_pages" in the page categories
     def is_disambiguation_page(self, page_html):
+        from bs4 import BeautifulSoup
         soup = BeautifulSoup(page_html, 'html.parser')
         catlinks = soup.find('div', id='catlinks')
         links = catlinks.find_all('a')
-        for l in links:
-            if "Category:Disambiguation_pages" in l.get('href'):
-                return True
-        return False
+        found = any("Category:Disambiguation_pages" in l.get('href') for l in links)
+        soup.decompose()
+        return found
+
+        
+    # Run the extraction path over a fetched article page
+    # The article is saved to the store and archive if there are any
+    # query is the title the page was requested as, archived as an alias
+    # Returns an Article
+    def extract_article(self, page_html, query=None):
+        from models import Article
+        title, body = self.extract_page_paragraphs(page_html)
+        title = self.extract_page_title(page_html, title)
+        if self.titles and query:
+            self.titles.record(query, title)
+        if self.archive:
+            raw = page_html.encode('utf-8')
+            self.archive.put(title, raw)
+            if query:
+                self.archive.put(query.replace('_', ' '), raw)
+        
+        revision = self.extract_revision_id(page_html)
+        if self.is_disambiguation_page(page_html):
+            article = Article(title, revision, body, disambiguation=True)
+        else:
+            facts = self.stream_key_facts(body)
+            article = Article(title, revision, body, facts)
+        
+        if self.store:
+            self.store.save_article(article, size=len(page_html.encode('utf-8')))
+        if self.fact_index and not article.disambiguation:
+            self.fact_index.add_article(article)
+        return article
 
         
     # Handle main Wikipedia content pages
     # Displays article title and first paragraph, or redirects to disambiguation        
-    def handle_content_page(self, page_html):
-        title, body = self.extract_page_paragraphs(page_html)
-        print(f"Found: {title}")
+    def handle_content_page(self, page_html, query=None):
+        article = self.extract_article(page_html, query)
+        self.display_article(article, page_html)
+    
+    
+    # Display an extracted article
+    # page_html is only needed to list the options of a disambiguation page
+    def display_article(self, article, page_html=None):
+        print(f"Found: {article.title}")
         self.print_heading("Overview")
         # If page is a disambiguation page then we recurse
-        if self.is_disambiguation_page(page_html):
-            self.handle_disambiguation_page(title, page_html)
+        if article.disambiguation:
+            self.handle_disambiguation_page(article.title, page_html)
         # Otherwise, it is a normal page. So print overview paragraph and key facts
         else:
-            wrapped_first = textwrap.fill(body[0], width=self.TEXT_WRAP_WIDTH)
+            import textwrap
+            wrapped_first = textwrap.fill(article.paragraphs[0].text, width=self.TEXT_WRAP_WIDTH)
             print(wrapped_first)
-            facts = self.extract_key_facts(' '.join(body[:3]))  # First 3 paragraphs
-            self.display_facts(facts)
+            self.display_facts(article.facts_by_category())
             
 
     # Extract interesting facts from Wikipedia article text using regex patterns
@@ -232,107 +430,111 @@ class WikipediaScraper:
     # - measurements
     # - quotes
     # - locations
-    def extract_key_facts(self, article_text):
-        facts = {
-            'Dates': set(),
-            'Money': set(),
-            'Measurements': set(),
-            'Quotes': set(),
-            'Locations': set()
-        }
-        
-        # Dates
-        date_patterns = [
-            # March 15, 2024
-            r'(?:January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{1,2},?\s+\d{4}',
-            # 15 March 2024
-            r'\d{1,2}\s+(?:January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{4}',
-            # 1991 or 1991-2024
-            r'\d{4}(?:[-–]\d{4})?',
-            # 03/15/24 or 03/15/2024
-            r'\d{1,2}/\d{1,2}/\d{2,4}',
-            # born 1991, founded in 2001
-            r'(?:born|died|founded|established|created|released)\s+(?:in\s+)?\d{4}'
-        ]
-        
-        for pattern in date_patterns:
-            matches = re.findall(pattern, article_text, re.IGNORECASE)
-            facts['Dates'].update(matches)
+    # categories limits the search to some of them, and deadline (a
+    # time.perf_counter() value) shares one time budget between several calls
+    def extract_key_facts(self, article_text, categories=FACT_CATEGORIES, deadline=None):
+        import patterns
+        facts = {category: set() for category in categories}
         
-        # Money
-        money_patterns = [
-            r'([$£€¥](?:\d+[,\.\s]?)+)',
-            r'((?:\d+[,\.\s]?)+)\s*((?:dollar|pound|euro|yen)s?)',
-        ]
+        # Patterns live in patterns.py, rewritten so long runs of digits
+        # can't make them backtrack. All of them share one time budget, and a
+        # pattern keeps whatever it matched if the budget runs out.
+        if deadline is None:
+            deadline = time.perf_counter() + self.PATTERN_BUDGET
+        def find(pattern):
+            try:
+                remaining = max(0, deadline - time.perf_counter())
+                return patterns.findall(pattern, article_text, budget=remaining)
+            except patterns.PatternTimeout as e:
+                return e.partial
         
-        for pattern in money_patterns:
-            matches = re.findall(pattern, article_text, re.IGNORECASE)
-            matches = [''.join(m) for m in matches]
-            facts['Money'].update(matches)
-    
+        # Dates: March 15, 2024 / 15 March 2024 / 1991-2024 / 03/15/24 / founded in 2001
+        if 'Dates' in facts:
+            for pattern in patterns.DATE_PATTERNS:
+                facts['Dates'].update(find(pattern))
         
-        # Measurements
-        measurement_patterns = [
-            # Distances
-            r'\d+(?:,\d{3})*\s*(?:metres?|feet|kilometers?|kilometres?|miles?|inches?|cm|mm|km)',
-            # Weights
-            r'\d+(?:,\d{3})*\s*(?:kg|kilograms?|pounds?|lbs?|tonnes?|tons?)',
-            # People
-            r'\d+(?:,\d{3})*\s*(?:people|inhabitants|residents|population|students|members|employees)',
-            # Large numbers with units
-            r'\d+(?:\.\d+)?\s*(?:million|billion|thousand|hundred)\s*(?:people|square|years?|acres?|cm|mm|m|km)',
-            # Area
-            r'\d+(?:\.\d+)?\s*(?:square\s+)?(?:kilometres?|kilometers?|miles?|acres?)'
-        ]
+        # Money: $1,234.56 / 1 000 000 dollars
+        if 'Money' in facts:
+            for pattern in patterns.MONEY_PATTERNS:
+                matches = [''.join(m) for m in find(pattern)]
+                facts['Money'].update(matches)
         
-        for pattern in measurement_patterns:
-            matches = re.findall(pattern, article_text, re.IGNORECASE)
-            facts['Measurements'].update(matches)
+        # Measurements: distances, weights, people, large numbers and areas
+        if 'Measurements' in facts:
+            for pattern in patterns.MEASUREMENT_PATTERNS:
+                facts['Measurements'].update(find(pattern))
         
         # Quotes
-        quote_patterns = [
-            r'\s"([^"]{10,120})"\s',
-            r"\s'([^']{10,120})'\s",
-            r'\s“([^“]{10,120})”\s'
-        ]
-        
-        for pattern in quote_patterns:
-            matches = re.findall(pattern, article_text)
-            facts['Quotes'].update(matches)
-        
-        # Locations
-        location_patterns = [
-            # "in Paris, France"
-            r'\bin\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*),\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)',
-            # "in|at|from England"
-            r'\b(?:in|at)\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)'
-        ]
+        if 'Quotes' in facts:
+            for pattern in patterns.QUOTE_PATTERNS:
+                facts['Quotes'].update(find(pattern))
         
-        for pattern in location_patterns:
-            matches = re.findall(pattern, article_text)
-            if matches:
-                if isinstance(matches[0], tuple):
-                    facts['Locations'].update([f"{m[0]}, {m[1]}" for m in matches])
-                else:
-                    facts['Locations'].update(matches)
+        # Locations: "in Paris, France" / "in|at England"
+        if 'Locations' in facts:
+            for pattern in patterns.LOCATION_PATTERNS:
+                matches = find(pattern)
+                if matches:
+                    if isinstance(matches[0], tuple):
+                        facts['Locations'].update([f"{m[0]}, {m[1]}" for m in matches])
+                    else:
+                        facts['Locations'].update(matches)
         
         return facts
     
     
+    # Extract facts from every paragraph of an article, one paragraph at a time
+    # Each fact is offered to a FactRanker, in article order, with the offset of
+    # its first match in the paragraphs joined by newlines. The lead paragraphs
+    # are searched for every category. After them a category is only searched
+    # until the ranker is satisfied with it, and the rest of the article is
+    # skipped once none are left. All of it shares PATTERN_BUDGET.
+    # Returns dictionary of category -> {value: position} in article order
+    def stream_key_facts(self, paragraphs):
+        from ranking import FactRanker, by_length
+        ranker = FactRanker(self.FACT_LIMIT, self.fact_scorer or by_length)
+        found = {category: {} for category in self.FACT_CATEGORIES}
+        deadline = time.perf_counter() + self.PATTERN_BUDGET
+        offset = 0
+        for i, text in enumerate(paragraphs):
+            if i < self.LEAD_PARAGRAPHS:
+                categories = self.FACT_CATEGORIES
+            else:
+                categories = [c for c in self.FACT_CATEGORIES if not ranker.satisfied(c)]
+                if not categories:
+                    break
+            
+            if self.paragraph_index:
+                facts = self.paragraph_index.extract([text], self.extract_key_facts,
+                                                     categories, deadline)
+            else:
+                # Padded so patterns needing surrounding whitespace (quotes)
+                # match at the start and end of a paragraph
+                facts = self.extract_key_facts(f" {text} ", categories, deadline)
+            for category in categories:
+                # Extraction returns sets, so place each value where it first
+                # occurs; joined values (money) that don't occur verbatim go
+                # at the start of their paragraph
+                values = [(max(text.find(value), 0), value) for value in facts.get(category, ())]
+                for start, value in sorted(values):
+                    position = found[category].setdefault(value, offset + start)
+                    ranker.add(category, value, position)
+            offset += len(text) + 1
+        return found
+    
+    
     # Display extracted facts in a nicely formatted way
     def display_facts(self, facts):
-        found = False
+        from ranking import by_length, top_facts
         self.print_heading("Key Facts")
-        for title, values in facts.items():
-            if values:
-                found = True
-                print(f"{title}:")
-                # Sort by longest fact because its probably more interesting.
-                # Take only the first few to prevent overkill.
-                sorted_facts = sorted(list(values), key=lambda x: len(x), reverse=True)
-                limited_facts = sorted_facts[:self.FACT_LIMIT]
-                for i, v in enumerate(limited_facts, 1):
-                    print(f"\t{i}. {v}")
+        # Longest facts first by default because they're probably more interesting.
+        # Take only the first few to prevent overkill; a bounded heap finds
+        # them without sorting every fact.
+        ranked = top_facts(facts, self.FACT_LIMIT, self.fact_scorer or by_length)
+        found = bool(ranked)
+        for title, limited_facts in ranked.items():
+            print(f"{title}:")
+            for i, v in enumerate(limited_facts, 1):
+                print(f"\t{i}. {v}")
                     
         if not found:
             print("No facts found. Try a different article!")
@@ -340,7 +542,10 @@ class WikipediaScraper:
     
     # Uses wikipedia api and Opensearch to return a list of search results.      
     # https://www.mediawiki.org/wiki/API:Opensearch
+    # With a local title index there's no request at all
     def get_search_results(self, query):
+        if self.title_search:
+            return self.title_search.search(query, limit=10)
         params = {
             "action": "opensearch",
             "namespace": "0",
@@ -349,39 +554,204 @@ class WikipediaScraper:
             "format": "json"
         }
         
-        search_response = self.get_response(self.WIKI_API_URL, params=params)
+        search_response = self.get_response(self.site.api_url, params=params)
         return search_response.json()[1]
     
     
     # Handle navigating to a specific Wikipedia page by query
+    # Articles already in the store are shown without fetching them again
     def go_to_page(self, query):
+        query = self.resolve_query(query)
+        if self.store:
+            # Disambiguation pages need their links, which the store doesn't keep
+            article = self.store.get_article(query.replace('_', ' '))
+            if article and not article.disambiguation:
+                print(f"Showing saved copy of '{query}'")
+                self.display_article(article)
+                return
+        
         print(f"Searching Wikipedia for '{query}'")
-        response = self.get_response(self.WIKI_BASE_URL + query)
+        response = self.get_response(self.site.page_url(query))
         
         # Check nothing went wrong
         if not response:
             print(f"Sorry! No page exists for '{query}'. Please try again!")
             return
 
-        self.handle_content_page(response.text)
+        self.handle_content_page(response.text, query)
+    
+    
+    # Map each title sent in an API query to the page title it ended up at
+    # Titles we send may come back normalised, e.g. "sheep" -> "Sheep",
+    # and then be followed to the article they redirect to
+    def resolve_batch(self, batch, query):
+        if self.titles:
+            self.titles.record_query(query)
+        normalized = {n["from"]: n["to"] for n in query.get("normalized", [])}
+        redirects = {r["from"]: r["to"] for r in query.get("redirects", [])}
+        resolved = {}
+        for requested in batch:
+            title = normalized.get(requested, requested)
+            resolved[requested] = redirects.get(title, title)
+        return resolved
+    
+    
+    # Start fetching short descriptions for titles in the background
+    # The first page of options goes in a batch of its own so it shows quickly;
+    # the rest follow DESCRIPTION_BATCH_SIZE titles per API call
+    # https://www.mediawiki.org/wiki/Extension:ShortDescription
+    def request_descriptions(self, titles):
+        titles = [t for t in dict.fromkeys(titles)
+                  if t not in self.descriptions and t not in self.description_requests]
+        batches = [titles[:self.PAGE_SIZE]]
+        for i in range(self.PAGE_SIZE, len(titles), self.DESCRIPTION_BATCH_SIZE):
+            batches.append(titles[i:i + self.DESCRIPTION_BATCH_SIZE])
+        for batch in batches:
+            if not batch:
+                continue
+            params = {
+                "action": "query",
+                "prop": "description",
+                "redirects": "1",
+                "titles": "|".join(batch),
+                "format": "json",
+                "formatversion": "2"
+            }
+            request = (batch, self.site.submit(self.site.api_url, params=params))
+            for title in batch:
+                self.description_requests[title] = request
+    
+    
+    # Short description of a title, waiting for its batch if it's still in flight
+    # Returns None if there isn't one or it didn't arrive in time
+    def get_description(self, title):
+        if title in self.descriptions:
+            return self.descriptions[title]
+        request = self.description_requests.get(title)
+        if request is None:
+            return None
+        batch, future = request
+        try:
+            response = future.result(timeout=self.DESCRIPTION_TIMEOUT)
+            query = response.json().get("query", {}) if response.status_code == 200 else {}
+        except Exception:
+            # Timed out or failed: list the batch without, rather than waiting again
+            for requested in batch:
+                self.description_requests.pop(requested, None)
+            return None
+        
+        found = {page["title"]: page.get("description") for page in query.get("pages", [])}
+        for requested, resolved in self.resolve_batch(batch, query).items():
+            self.descriptions[requested] = found.get(resolved)
+            self.description_requests.pop(requested, None)
+        return self.descriptions.get(title)
+    
+    
+    # Batch query the API for the latest revision of each title
+    # https://www.mediawiki.org/wiki/API:Revisions
+    # Returns dictionary of requested title -> (canonical title, revision id)
+    # for titles that exist
+    def get_latest_revisions(self, titles):
+        revisions = {}
+        for i in range(0, len(titles), self.REVISION_BATCH_SIZE):
+            batch = titles[i:i + self.REVISION_BATCH_SIZE]
+            params = {
+                "action": "query",
+                "prop": "revisions",
+                "rvprop": "ids",
+                "redirects": "1",
+                "titles": "|".join(batch),
+                "format": "json",
+                "formatversion": "2"
+            }
+            response = self.get_response(self.site.api_url, params=params)
+            if not response:
+                continue
+            
+            query = response.json().get("query", {})
+            latest = {}
+            for page in query.get("pages", []):
+                if page.get("missing") or not page.get("revisions"):
+                    continue
+                latest[page["title"]] = page["revisions"][0]["revid"]
+            for requested, title in self.resolve_batch(batch, query).items():
+                if title in latest:
+                    revisions[requested] = (title, latest[title])
+        return revisions
+    
+    
+    # Re-scrape only the titles whose latest revision differs from the stored one
+    # Changed and new pages go through the same extraction path as go_to_page
+    # Returns dictionary summarising how many pages were fetched and skipped
+    def refresh_titles(self, titles):
+        titles = [normalise_title(t) for t in titles]
+        titles = [t for t in dict.fromkeys(titles) if t]
+        latest = self.get_latest_revisions(titles)
+        stored = self.store.get_revisions([t for t, _ in latest.values()])
+        
+        summary = {'fetched': 0, 'skipped': 0, 'missing': 0, 'bytes_saved': 0}
+        seen = set()
+        for title in titles:
+            if title not in latest:
+                summary['missing'] += 1
+                continue
+            
+            # Several listed titles may redirect to the same article
+            title, latest_revision = latest[title]
+            if title in seen:
+                continue
+            seen.add(title)
+            revision, size = stored.get(title, (None, None))
+            if revision == latest_revision:
+                summary['skipped'] += 1
+                summary['bytes_saved'] += size or 0
+                continue
+            
+            response = self.get_response(self.site.page_url(self.form_query(title)))
+            if not response:
+                summary['missing'] += 1
+                continue
+            self.extract_article(response.text, title)
+            summary['fetched'] += 1
+        
+        self.store.flush()
+        print(f"Refreshed {summary['fetched']} pages, "
+              f"skipped {summary['skipped']} unchanged pages "
+              f"({summary['bytes_saved']:,} bytes not downloaded), "
+              f"{summary['missing']} not found")
+        return summary
     
     
     # Handle user search by querying Wikipedia API
+    # Saved articles whose title matches are answered locally without a request.
+    # Otherwise saved articles that only mention the query are listed after
+    # Wikipedia's results, so they never hide the article actually searched for.
     def handle_search(self, query):
+        if self.store:
+            results = self.store.search(query, limit=10, title_only=True)
+            if results:
+                print(f"Found saved articles for '{query}':")
+                return results
+        
         print(f"Searching Wikipedia for '{query}':")
-        return self.get_search_results(query)
+        results = self.get_search_results(query)
+        if self.store:
+            mentions = self.store.search(query, limit=10)
+            results = list(dict.fromkeys(results + mentions))
+        return results
     
     
     # Print welcome prompt at start of program
     def welcome_prompt(self):
         print("Welcome to Wikipedia Scraper!")
-        print("Type 'q' at any time to quit")
+        print("Type 'q' at any time to quit, or press Ctrl-C to cancel a slow request")
     
     
     # Main program loop that handles user interaction
     # Continuously prompts for search terms and processes them
     def run(self):
         self.welcome_prompt()
+        self.interactive = True
         while True:
             try:
                 self.prompt_new_search()
@@ -397,12 +767,77 @@ class WikipediaScraper:
                 query = self.form_query(results[selected])
                 self.go_to_page(query)
                     
-            except (EOFError, KeyboardInterrupt):
+            except FetchCancelled:
+                print("Request cancelled")
+            except KeyboardInterrupt:
+                # Ctrl-C abandons the current search, only 'q' or Ctrl-D quits
+                print("\nCancelled")
+            except EOFError:
                 self.stop()
 
 
 def main():
-    scraper = WikipediaScraper()
+    import argparse
+    parser = argparse.ArgumentParser(description="Search and scrape Wikipedia articles")
+    parser.add_argument('--store', metavar='DB',
+                        help="save scraped articles to this SQLite file and search it first")
+    parser.add_argument('--refresh', metavar='TITLES',
+                        help="re-scrape changed articles listed one per line in this file, then exit")
+    parser.add_argument('--archive', metavar='DIR',
+                        help="keep compressed copies of fetched pages in this directory")
+    parser.add_argument('--titles', metavar='FILE',
+                        help="remember redirects and title aliases in this JSON file between runs")
+    parser.add_argument('--lang', metavar='CODE', default='en',
+                        help="language edition of Wikipedia to use, e.g. 'de' (default: en)")
+    parser.add_argument('--fact-index', metavar='FILE',
+                        help="add the facts of scraped articles to this index file")
+    parser.add_argument('--rank-facts', choices=['length', 'position', 'frequency'],
+                        default='length', help="which facts to show first (default: length)")
+    parser.add_argument('--trace', metavar='FILE',
+                        help="write a Chrome trace of the session to this JSON file")
+    parser.add_argument('--title-search', metavar='INDEX',
+                        help="search titles in this index from title_search.py instead of online")
+    args = parser.parse_args()
+    if args.refresh and not args.store:
+        parser.error("--refresh needs --store to compare revisions against")
+
+    store = archive = fact_index = None
+    if args.store:
+        from article_store import ArticleStore
+        store = ArticleStore(args.store)
+    if args.archive:
+        from article_archive import ArticleArchive
+        archive = ArticleArchive(args.archive)
+    if args.fact_index:
+        from fact_index import FactIndex
+        fact_index = FactIndex(args.fact_index)
+    titles = TitleResolver(args.titles) if args.titles else None
+    fact_scorer = None
+    if args.rank_facts != 'length':
+        from ranking import SCORERS
+        fact_scorer = SCORERS[args.rank_facts]
+    tracer = None
+    if args.trace:
+        from tracing import Tracer
+        tracer = Tracer(args.trace)
+    title_search = None
+    if args.title_search:
+        from title_search import TitleSearch
+        title_search = TitleSearch(args.title_search)
+    scraper = WikipediaScraper(store=store, archive=archive, site=WikipediaSite(lang=args.lang),
+                               titles=titles, fact_index=fact_index, fact_scorer=fact_scorer,
+                               tracer=tracer, title_search=title_search)
+    if args.refresh:
+        with open(args.refresh, encoding='utf-8') as f:
+            scraper.refresh_titles(f.read().splitlines())
+        store.close()
+        if titles:
+            titles.save()
+        if fact_index:
+            fact_index.save()
+        if tracer:
+            tracer.save()
+        return
     scraper.run()
 
 